@@ -11,13 +11,35 @@ Encoder resolution ratio indicates the count of pulses output by the encoder dur
 gear_ratio = P006 / P007
 gear_ratio = Number_of_wires * 4 / Displacement_per_load_shaft_revolution * m / n
 """
+import logging
 import sys
+from fractions import Fraction
+from typing import Iterable
 
-import pigpio
-from time import sleep
+from encoder import QuadratureEncoder
+from frequency_planner import FrequencyPlanner, planner_for
+from motion_profile import MotionProfile, ProfileCompiler, speed_to_freq
+from pi_backend import backend_sleep, pigpio
+from pulse_engine import PulseEngine
 
 BAD_CODE: int = -1
 
+logger: logging.Logger = logging.getLogger('dl57d')
+
+
+class DriverConfigError(ValueError):
+    """
+    Bad driver configuration (sample rate, gpios, config file options)
+    """
+
+
+def exact_fraction(value: float | int | Fraction) -> Fraction:
+    """
+    :param value: number (float is taken as written in decimal: 0.1 -> 1/10)
+    :return: exact rational value
+    """
+    return Fraction(repr(value)) if isinstance(value, float) else Fraction(value)
+
 
 class DL57D:
     """
@@ -40,6 +62,8 @@ class DL57D:
     MAX_SPEED_RPM: float = 2000  # 2000 r/min  rotation per minute is 332 rotation per second
 
     ENCODER_RESOLUTION: int = 1000  # full rotation / min
+    TURN_ON_LOW: tuple[str, ...] = ('PULL', 'ENA')  # Turn ON (0), PUL LOW
+    TURN_ON_HIGH: tuple[str, ...] = ('DIR',)  # DIR (1) by default
     """
                                    Hertz
 
@@ -88,7 +112,14 @@ class DL57D:
                  reductor_ratio: int = 100,  # Amount of driver rotation needs for 1 system rotation
                  pigpiod_sample_rate: int = 5,  # 5 microseconds
 
-                 sectors: int = 400):
+                 sectors: int = 400,
+                 use_waves: bool = True,
+                 accel: float | None = None,
+                 jerk: float | None = None,
+                 pi: pigpio.pi | None = None,
+                 ea_gpio: int | None = None,  # Could be not connected, For encoder A channel
+                 eb_gpio: int | None = None,  # Could be not connected, For encoder B channel
+                 turn_on: bool = True):
         """
         :param pul_gpio: raspberry pi GPIO num of PUL + connection to pin
         :param ena_gpio: raspberry pi GPIO num of ENA + connection to pin
@@ -98,8 +129,17 @@ class DL57D:
         :param microstep:  driver setted P001 parameter
         :param reductor_ratio:  reductor ratio of connected to NEMA motor
         :param pigpiod_sample_rate:  sample rate of tunned pigpio daemon (pigpiod)
+        :param use_waves:  send PUL impulses as DMA waveforms (False -> bit-bang by write + sleep)
+        :param accel:  default acceleration of rotate_sectors r/min per second (None -> no ramps)
+        :param jerk:  default jerk r/min per second^2 (None -> trapezoidal, else S-curve ramps)
+        :param pi:  connected backend (pigpio.pi or sim_pigpio.SimulatedPi), None -> new pigpio.pi()
+        :param ea_gpio: raspberry pi GPIO num of encoder EA + connection to pin
+        :param eb_gpio: raspberry pi GPIO num of encoder EB + connection to pin
+        :param turn_on: write ENA / PUL / DIR lvls of turned ON driver (False -> caller batches turn_on)
+        :raise DriverConfigError: bad sample rate or gpios
+        :raise ConnectionError: pigpiod is not connected
         """
-        print('Init driver')
+        logger.debug('Init driver')
         self.pul_gpio: int = pul_gpio  # Clockwise mode OUTPUT GPIO
         self.ena_gpio: int = ena_gpio  # OUTPUT GPIO (ON / OFF) 1 / 0
         self.dir_gpio: int = dir_gpio  # OUTPUT GPIO (CW / CCW) Directions
@@ -110,74 +150,107 @@ class DL57D:
                             'DIR': self.dir_gpio,
                             'PEND': self.pend_gpio,
                             'ALM': self.alm_gpio}
+        used: list[int] = [gpio for gpio in (*self.gpios.values(), ea_gpio, eb_gpio) if gpio is not None]
+        if len(set(used)) != len(used):
+            raise DriverConfigError(f'GPIOs are used twice: {self.gpios} EA {ea_gpio} EB {eb_gpio}')
 
         self.sectors = sectors
         self.microstep: int = microstep  # Pulses (microsteps) per one step (200 steps -> full rotation)
-        print(f'Microstep is {self.microstep}')
+        logger.debug('Microstep is %s', self.microstep)
         self.reductor_ratio: int = reductor_ratio  # Reduction in degrees
         self.full_rotate_steps: int = self.microstep * self.STEPS_RATIO  # Pulses per full rotation
-        print(f'Full rotation steps is {self.full_rotate_steps}')
+        logger.debug('Full rotation steps is %s', self.full_rotate_steps)
         self.seconds_for_rotate: float = 60 / self.NORMAL_SPEED_RPM  # Time in seconds for 1 rotation with normal speed
-        print(f'Seconds for rotate is {self.seconds_for_rotate}')
-
-        # self.lvl_duration: float = self.seconds_for_rotate / self.full_rotate_steps / 2  # Period indeed 2 durations
-        self.max_speed: float = self.convert_lvl_duration_to_speed(lvl_duration=self.LVL_MIN_DURATION)
-        print(f'Max speed is {self.max_speed} for microstep {self.microstep}')
-        if self.max_speed > self.MAX_SPEED_RPM:
-            self.max_speed = self.MAX_SPEED_RPM
-        self.lv_min_duration: float = self.convert_speed_to_lvl_duration(speed=self.MAX_SPEED_RPM)
-        if self.lv_min_duration < self.LVL_MIN_DURATION:  # lvl duration couldn't be less 2.5 us
-            print(f'For microstep {microstep} and lvl duration {self.LVL_MIN_DURATION} speed {self.MAX_SPEED_RPM}'
-                  f'Unavailable')
-            print(f'Steps duration set to {self.LVL_MIN_DURATION}')
-            self.lv_min_duration = self.LVL_MIN_DURATION
-        print(f'Lvl min duration set to {self.lv_min_duration}')
+        logger.debug('Seconds for rotate is %s', self.seconds_for_rotate)
+
         if self.full_rotate_steps % self.sectors != 0:
-            print(f'Bad sectors {self.sectors} for full circle of {self.full_rotate_steps} steps')
+            logger.warning('Sectors %s are not whole microsteps of full circle %s steps, sector moves carry '
+                           'fractional microsteps', self.sectors, self.full_rotate_steps)
         self.sector_steps: int = int(self.full_rotate_steps / self.sectors)
+        self.sector_ratio: Fraction = Fraction(self.full_rotate_steps, self.sectors)  # Exact microsteps per sector
+        self.step_remainder: Fraction = Fraction(0)  # Commanded fraction of microstep not sent yet (-1/2..1/2)
         # microsteps per degree ( 5/9 of microsteps ) (if sectors 360)
-        print(f'Degree steps is {self.sector_steps}')
+        logger.debug('Degree steps is %s', self.sector_steps)
 
         self.pigpiod_sample_rate: int = pigpiod_sample_rate  # 5 microseconds of sample rate by default
-        print(f'Pigpiod sample rate is {self.pigpiod_sample_rate}')
+        logger.debug('Pigpiod sample rate is %s', self.pigpiod_sample_rate)
 
         if self.pigpiod_sample_rate in self.PWM_FREQ_DICT:
             self.pwm_freqs: tuple = self.PWM_FREQ_DICT[self.pigpiod_sample_rate]  # Range of values is constant
-            print(f'PWM freqs is {self.pwm_freqs}')
+            logger.debug('PWM freqs is %s', self.pwm_freqs)
         else:
-            print(f'Not available pidpiod sample rate {self.pigpiod_sample_rate} available: '
-                  f'{[_ for _ in self.PWM_FREQ_DICT]}')  # Key freq from dict
-            sys.exit(BAD_CODE)
-
-        print('Init gpio')
-        self.pi: pigpio.pi = pigpio.pi()
+            raise DriverConfigError(f'Not available pigpiod sample rate {self.pigpiod_sample_rate}, available: '
+                                    f'{list(self.PWM_FREQ_DICT)}')
+
+        # Speeds are quantised to periods of sample rate grid, fastest one is limited by lvl and motor speed
+        self.planner: FrequencyPlanner = planner_for(microstep=self.microstep, sample_rate=self.pigpiod_sample_rate,
+                                                     max_speed_rpm=self.MAX_SPEED_RPM)
+        self.max_speed: float = self.planner.max_speed  # Fastest achievable speed of microstep
+        logger.debug('Max speed is %s for microstep %s', self.max_speed, self.microstep)
+        self.lv_min_duration: float = self.planner.min_period / 2e6  # Lvl of fastest period
+        logger.debug('Lvl min duration set to %s', self.lv_min_duration)
+
+        logger.debug('Init gpio')
+        self.pi: pigpio.pi = pigpio.pi() if pi is None else pi
+        self.sleep = backend_sleep(self.pi)  # Host side sleep (virtual clock of simulator)
         if not self.pi.connected:
-            print('PI not connected\n'
-                  'EXIT . . .')
-            exit(BAD_CODE)  # Exiting program
+            raise ConnectionError('pigpiod is not connected')
         # SETUP pins GPIO modes (I/O)
-        print('Set up pins MODES')
+        logger.debug('Set up pins MODES')
         self.pi.set_mode(self.pul_gpio, pigpio.OUTPUT)  # OUTPUT PULL signal mode
         if self.ena_gpio is not None:
             self.pi.set_mode(self.ena_gpio, pigpio.OUTPUT)  # OUTPUT ENA mode
-            print('ENA output connected')
+            logger.debug('ENA output connected')
         if self.dir_gpio is not None:  # If connected
             self.pi.set_mode(self.dir_gpio, pigpio.OUTPUT)  # OUTPUT direction
-            print('DIR output connected')
+            logger.debug('DIR output connected')
         if self.alm_gpio is not None:  # If connected
             self.pi.set_mode(self.alm_gpio, pigpio.INPUT)  # INPUT ALM error
-            print('ALM input connected')
+            logger.debug('ALM input connected')
         if self.pend_gpio is not None:
             self.pi.set_mode(self.pend_gpio, pigpio.INPUT)  # INPUT PEND when in position
-            print('PEND input connected')
-
-        print('State before turn ON:')
-        self.print_state()
-        print('Turn ON driver (ENA LOW)')
-        if self.ena_gpio is not None:
-            self.change_lvl(gpio_name='ENA', lvl=pigpio.LOW)  # Turn ON (0) by default
-        if self.dir_gpio is not None:
-            self.change_lvl(gpio_name='DIR', lvl=pigpio.HIGH)  # Turn ON (1) by default
+            logger.debug('PEND input connected')
+        self.accel: float | None = accel  # r/min per second
+        self.jerk: float | None = jerk  # r/min per second^2
+        self.pulse_engine: PulseEngine | None = None  # Hardware timed PUL (None -> bit-bang)
+        self.profile_compiler: ProfileCompiler | None = None  # Cached accel / decel ramps
+        if use_waves:
+            self.pulse_engine = PulseEngine(pi=self.pi, pul_gpio=self.pul_gpio, planner=self.planner)
+            self.profile_compiler = ProfileCompiler(engine=self.pulse_engine,
+                                                    microstep=self.microstep,
+                                                    sector_steps=self.sector_steps)
+            logger.debug('PUL waveform engine connected')
+        self.setup_waves: dict[tuple[bool, int], int] = {}  # (ENA turn ON, DIR lvl) -> ENA / DIR setup wave id
+        self.setup_generation: int = 0  # Wave cache generation of setup waves
+        self.position: int = 0  # Commanded microsteps since zero ( - sign mean CCW)
+        self.aborting: bool = False  # Set by abort() until next move start
+        self.pending: list[list[int]] = []  # Chains of running batch not transmitted yet (not sent on abort)
+        self.encoder: QuadratureEncoder | None = None  # Closed loop feedback
+        if ea_gpio is not None and eb_gpio is not None:
+            self.encoder = QuadratureEncoder(pi=self.pi, ea_gpio=ea_gpio, eb_gpio=eb_gpio,
+                                             resolution=self.ENCODER_RESOLUTION)
+            logger.debug('Encoder EA / EB inputs connected')
+        self.instruments = None  # instrumentation.Instrumentation of moves (None -> off, hooks cost one check)
+        self.safety = None  # safety.SafetyMonitor of ALM / limit inputs (None -> off)
+        self.jog = None  # jog.SpeedJog of PUL gpio, stopped by safety monitor (None -> off)
+
+        # Shadow of gpio lvls: outputs updated on write, all resynced by one read_bank_1 on demand
+        self.pin_state: dict[str, int | None] = {name: None for name in self.gpios}
+        if logger.isEnabledFor(logging.DEBUG):  # Read-back costs one read_bank_1
+            logger.debug('State before turn ON:')
+            self.print_state()
+        if turn_on:
+            self.turn_on()
+
+    def turn_on(self) -> None:
+        """
+        Turn ON driver (ENA LOW), PUL LOW and DIR HIGH by one clear_bank_1 and one set_bank_1
+        (driver_factory.turn_on_drivers batches this for all drivers of one connection)
+        :return: None
+        """
+        logger.debug('Turn ON driver (ENA LOW)')
+        self.write_bank(low=self.TURN_ON_LOW, high=self.TURN_ON_HIGH)
+        self.sleep(self.SLEEP_AFTER_DIR)
 
     def change_lvl(self, gpio_name: str, lvl: int | None = None) -> None:  # Turn off PULL
         """
@@ -191,35 +264,101 @@ class DL57D:
         if gpio_name in self.gpios:
             gpio: int | None = self.gpios[gpio_name]  # GPIO of gpio name channel (GPIO of PUL exmpl)
             if gpio is None:
-                print(f'No gpio connection of {gpio_name} channel')
+                logger.warning('No gpio connection of %s channel', gpio_name)
             else:
                 if lvl is None:  # Default value change
-                    if self.pi.read(gpio=gpio) == pigpio.HIGH:
-                        self.pi.write(gpio=gpio, level=pigpio.LOW)
-                        print(f'{gpio_name} lvl {pigpio.LOW}')
+                    if self.pin_state[gpio_name] is None:
+                        self.resync_state()
+                    if self.pin_state[gpio_name] == pigpio.HIGH:
+                        self.write_lvl(gpio_name=gpio_name, lvl=pigpio.LOW)
+                        logger.debug('%s lvl %s', gpio_name, pigpio.LOW)
                         if gpio_name == 'ENA':  # After ENA needs to sleep 5 us Before DIR
-                            sleep(self.SLEEP_AFTER_ENA)
+                            self.sleep(self.SLEEP_AFTER_ENA)
                         elif gpio_name == 'DIR':  # After DIR needs to sleep 100us Before ENA
-                            sleep(self.SLEEP_AFTER_DIR)
+                            self.sleep(self.SLEEP_AFTER_DIR)
                     else:  # Was LOW
-                        self.pi.write(gpio=gpio, level=pigpio.HIGH)  # Now HIGH
-                        print(f'{gpio_name} lvl {pigpio.HIGH}')
+                        self.write_lvl(gpio_name=gpio_name, lvl=pigpio.HIGH)  # Now HIGH
+                        logger.debug('%s lvl %s', gpio_name, pigpio.HIGH)
                         if gpio_name == 'ENA':  # After ENA needs to sleep 5 us Before DIR
-                            sleep(self.SLEEP_AFTER_ENA)
+                            self.sleep(self.SLEEP_AFTER_ENA)
                         elif gpio_name == 'DIR':  # After DIR needs to sleep 100us Before ENA
-                            sleep(self.SLEEP_AFTER_DIR)
+                            self.sleep(self.SLEEP_AFTER_DIR)
                 elif lvl == pigpio.LOW or lvl == pigpio.HIGH:
-                    self.pi.write(gpio=gpio, level=lvl)
-                    print(f'{gpio_name} lvl {lvl}')
+                    self.write_lvl(gpio_name=gpio_name, lvl=lvl)
+                    logger.debug('%s lvl %s', gpio_name, lvl)
                     if gpio_name == 'ENA':  # After ENA needs to sleep 5 us Before DIR
-                        sleep(self.SLEEP_AFTER_ENA)
+                        self.sleep(self.SLEEP_AFTER_ENA)
                     elif gpio_name == 'DIR':  # After DIR needs to sleep 100us Before ENA
-                        sleep(self.SLEEP_AFTER_DIR)
+                        self.sleep(self.SLEEP_AFTER_DIR)
                 else:
-                    print(f'Incorrect lvl {lvl} for {gpio_name}')
-                self.print_state()
+                    logger.warning('Incorrect lvl %s for %s', lvl, gpio_name)
+                self.print_state(resync=False)
         else:
-            print(f'No name {gpio_name} in gpios')
+            logger.warning('No name %s in gpios', gpio_name)
+
+    def write_lvl(self, gpio_name: str, lvl: int) -> None:
+        """
+        Write lvl of gpio channel and its shadow state (no sleeps)
+        :param gpio_name: Name of gpio channel
+        :param lvl: 1 or 0 lvl
+        :return: None
+        """
+        self.pi.write(gpio=self.gpios[gpio_name], level=lvl)
+        self.pin_state[gpio_name] = lvl
+
+    def write_bank(self, low: tuple[str, ...] = (), high: tuple[str, ...] = ()) -> None:
+        """
+        Set several gpio channels by one clear_bank_1 and one set_bank_1 (LOW first)
+        Not connected channels and channels already in lvl are skipped
+        :param low: Names of gpio channels to set LOW
+        :param high: Names of gpio channels to set HIGH
+        :return: None
+        """
+        for names, lvl, command in ((low, pigpio.LOW, self.pi.clear_bank_1), (high, pigpio.HIGH, self.pi.set_bank_1)):
+            names = tuple(name for name in names if self.gpios[name] is not None and self.pin_state[name] != lvl)
+            if names:
+                command(sum(1 << self.gpios[name] for name in names))
+                for name in names:
+                    self.pin_state[name] = lvl
+                    logger.debug('%s lvl %s', name, lvl)
+
+    def resync_state(self) -> int:
+        """
+        Read lvls of all gpios by one read_bank_1 command into shadow state
+        :return: bank 1 lvls bits
+        """
+        bank: int = self.pi.read_bank_1()
+        for name, gpio in self.gpios.items():
+            if gpio is not None:
+                self.pin_state[name] = (bank >> gpio) & 1
+        return bank
+
+    def setup_chain(self, dir_lvl: int) -> list[int]:
+        """
+        Prebuilt micro-waveform ENA ON -> 5 us -> DIR -> 100 us, sent in front of PUL of move (no host sleeps)
+        :param dir_lvl: DIR lvl of move
+        :return: wave_chain data ([] when driver is ON and DIR is already set)
+        """
+        ena_on: bool = self.ena_gpio is not None and self.pin_state['ENA'] != pigpio.LOW
+        if not ena_on and self.pin_state['DIR'] == dir_lvl:
+            return []
+        key: tuple[bool, int] = (ena_on, dir_lvl)
+        if self.setup_generation != self.pulse_engine.cache.generation:  # Waves cleared by resync
+            self.setup_waves.clear()
+            self.setup_generation = self.pulse_engine.cache.generation
+        if key not in self.setup_waves:
+            pulses: list = []
+            if ena_on:  # After ENA needs 5 us Before DIR
+                pulses.append(pigpio.pulse(0, 1 << self.ena_gpio, max(round(self.SLEEP_AFTER_ENA * 1e6), 1)))
+            dir_mask: int = 1 << self.dir_gpio  # After DIR needs 100 us Before PUL
+            pulses.append(pigpio.pulse(dir_mask if dir_lvl else 0, 0 if dir_lvl else dir_mask,
+                                       round(self.SLEEP_AFTER_DIR * 1e6)))
+            self.setup_waves[key] = self.pulse_engine.create_wave(pulses)
+            self.pulse_engine.cache.pin([self.setup_waves[key]])
+        if ena_on:
+            self.pin_state['ENA'] = pigpio.LOW
+        self.pin_state['DIR'] = dir_lvl
+        return [self.setup_waves[key]]
 
     def convert_speed_to_lvl_duration(self, speed: float | int) -> float | None:
         """
@@ -229,12 +368,12 @@ class DL57D:
         :return: float lvl duration
         """
         if speed > self.MAX_SPEED_RPM:
-            print(f'Speed {speed} more than maximum {self.MAX_SPEED_RPM}')
+            logger.warning('Speed %s more than maximum %s', speed, self.MAX_SPEED_RPM)
             # return None
         lvl_duration: float = 30 / (speed * self.full_rotate_steps)
-        print(f'Speed {speed} -> duration {lvl_duration}')
+        logger.debug('Speed %s -> duration %s', speed, lvl_duration)
         if lvl_duration < self.LVL_MIN_DURATION:
-            print(f'Duration {lvl_duration}less than min 2.5e-6')
+            logger.warning('Duration %s less than min %s', lvl_duration, self.LVL_MIN_DURATION)
             # return None
         return lvl_duration
 
@@ -246,40 +385,334 @@ class DL57D:
         :return: speed float r/min
         """
         if lvl_duration < self.LVL_MIN_DURATION:
-            print(f'Duration {lvl_duration} less than min {self.LVL_MIN_DURATION}')
+            logger.warning('Duration %s less than min %s', lvl_duration, self.LVL_MIN_DURATION)
             # return None
         speed: float = 30 / (lvl_duration * self.full_rotate_steps)
-        print(f'Duration {lvl_duration} -> speed {speed}')
+        logger.debug('Duration %s -> speed %s', lvl_duration, speed)
         if speed > self.MAX_SPEED_RPM:
-            print(f'Speed {speed} more than maximum {self.MAX_SPEED_RPM}')
+            logger.warning('Speed %s more than maximum %s', speed, self.MAX_SPEED_RPM)
             # return None
         return speed
 
-    def rotate_sectors(self, sector: float, speed: float | int | None = None) -> None:
+    def set_direction(self, value: float) -> list[int]:
+        """
+        Turn ON driver and set DIR by sign of value ( - sign mean CCW DIR), changed only when needed (shadow state)
+        With waveform engine ENA / DIR go out as setup wave in front of move
+        :param value: sectors or speed
+        :return: wave_chain data of setup wave ([] when nothing to change or bit-bang)
+        """
+        if value == 0 or self.dir_gpio is None:
+            return []
+        dir_lvl: int = pigpio.LOW if value < 0 else pigpio.HIGH  # CCW DIR / CW DIR
+        if self.pulse_engine is not None:
+            return self.setup_chain(dir_lvl=dir_lvl)
+        self.write_direction(dir_lvl=dir_lvl)
+        return []
+
+    def write_direction(self, dir_lvl: int) -> None:
+        """
+        Turn ON driver and set DIR by host commands (bit-bang and PWM moves)
+        :param dir_lvl: DIR lvl of move
+        :return: None
+        """
+        self.write_bank(low=('ENA',))  # Command round-trip is longer than 5 us after ENA
+        if self.dir_gpio is not None and self.pin_state['DIR'] != dir_lvl:  # Needs to change
+            self.write_lvl(gpio_name='DIR', lvl=dir_lvl)
+            self.sleep(self.SLEEP_AFTER_DIR)  # After DIR needs to sleep 100us Before PUL
+
+    def rotate_sectors(self, sector: float, speed: float | int | None = None,
+                       accel: float | None = None, jerk: float | None = None, correct: bool = False) -> None:
         """
         UNSAFE for big speeds
         :param sector: degree of rotation ( - sign mean DIR change)
         :param speed: float speed of rotation r/min
+        :param accel: acceleration r/min per second (None -> driver default, ramps need waveform engine)
+        :param jerk: jerk r/min per second^2 (None -> driver default)
+        :param correct: check end position by encoder and correct it by one move
+        :return: None
+        """
+        target: Fraction = self.exact_position + self.sector_microsteps(sector)
+        self.rotate_steps(steps=round(target) - self.position, speed=speed, accel=accel, jerk=jerk)
+        self.step_remainder = target - round(target)
+        if correct:
+            self.correct_position(speed=speed)
+
+    def rotate_steps(self, steps: int, speed: float | int | None = None,
+                     accel: float | None = None, jerk: float | None = None) -> None:
+        """
+        UNSAFE for big speeds
+        :param steps: microsteps of rotation ( - sign mean DIR change)
+        :param speed: float speed of rotation r/min
+        :param accel: acceleration r/min per second (None -> driver default, ramps need waveform engine)
+        :param jerk: jerk r/min per second^2 (None -> driver default)
+        :return: None
+        """
+        if self.pulse_engine is not None:
+            self.pulse_engine.wait(duration=self.queue_steps(steps=steps, speed=speed, accel=accel, jerk=jerk))
+            return
+        current_lvl_duration: float = self.sector_lvl_duration(speed=speed)
+        self.begin_move(pulses=abs(steps), lvl_duration=current_lvl_duration)
+        self.set_direction(value=steps)
+        logger.debug('Start moving ...')
+        sent: int = self.bit_bang(pulses=abs(steps), lvl_duration=current_lvl_duration)
+        self.position += sent if steps > 0 else -sent  # Sign is DIR
+
+    def bit_bang(self, pulses: int, lvl_duration: float) -> int:
+        """
+        PUL impulses written by python, stopped by abort() of other thread or safety monitor
+        (position of safety stop is counted by safety monitor)
+        :param pulses: amount of PUL impulses
+        :param lvl_duration: lvl duration in seconds
+        :return: amount of sent impulses
+        """
+        for sent in range(pulses):
+            if self.aborting or (self.safety is not None and self.safety.tripped is not None):
+                return sent
+            self.pi.write(gpio=self.pul_gpio, level=pigpio.HIGH)  # LVL HIGH (1)
+            self.sleep(lvl_duration)
+            self.pi.write(gpio=self.pul_gpio, level=pigpio.LOW)  # LVL LOW (0)
+            self.sleep(lvl_duration)
+        return pulses
+
+    def begin_move(self, pulses: int, lvl_duration: float) -> None:
+        """
+        Hooks of move start: safety interlock and timing instrumentation (both None -> two checks)
+        :param pulses: amount of PUL impulses
+        :param lvl_duration: cruise lvl duration
         :return: None
         """
-        if sector < 0 and (self.pi.read(gpio=self.dir_gpio) != pigpio.LOW):  # CCW DIR
-            self.change_lvl(gpio_name='DIR', lvl=pigpio.LOW)  # Needs to change
-        elif sector > 0 and (self.pi.read(gpio=self.dir_gpio) != pigpio.HIGH):  # CW DIR
-            self.change_lvl(gpio_name='DIR', lvl=pigpio.HIGH)  # Needs to change
+        self.aborting = False
+        if self.safety is not None:
+            self.safety.check()
+        if self.instruments is not None:
+            self.instruments.start(pulses=pulses, freq=1 / (2 * lvl_duration))
+
+    def sector_lvl_duration(self, speed: float | int | None = None) -> float:
+        """
+        Lvl duration of sectors move (min lvl duration for None or too big speed)
+        :param speed: float speed of rotation r/min
+        :return: lvl duration
+        """
         if speed is not None:
             current_lvl_duration: float = self.convert_speed_to_lvl_duration(speed=speed)
             if current_lvl_duration < self.lv_min_duration:
                 current_lvl_duration = self.lv_min_duration
-                print(f'Lvl duration {self.lv_min_duration}')
+                logger.debug('Lvl duration %s', self.lv_min_duration)
         else:
             current_lvl_duration: float = self.lv_min_duration
-        print(f'Speed {speed} Lvl duration: {current_lvl_duration}')
-        print('Start moving ...')
-        for _ in range(int(sector * self.sector_steps)):
-            self.pi.write(gpio=self.pul_gpio, level=pigpio.HIGH)  # LVL HIGH (1)
-            sleep(current_lvl_duration)
-            self.pi.write(gpio=self.pul_gpio, level=pigpio.LOW)  # LVL LOW (0)
-            sleep(current_lvl_duration)
+        logger.debug('Speed %s Lvl duration: %s', speed, current_lvl_duration)
+        return current_lvl_duration
+
+    def queue_sectors(self, sector: float, speed: float | int | None = None,
+                      accel: float | None = None, jerk: float | None = None) -> float:
+        """
+        Start waveform move of sectors without waiting its end (needs waveform engine)
+        :param sector: degree of rotation ( - sign mean DIR change)
+        :param speed: float speed of rotation r/min
+        :param accel: acceleration r/min per second (None -> driver default)
+        :param jerk: jerk r/min per second^2 (None -> driver default)
+        :return: expected move time in seconds
+        """
+        target: Fraction = self.exact_position + self.sector_microsteps(sector)
+        duration: float = self.queue_steps(steps=round(target) - self.position, speed=speed, accel=accel, jerk=jerk)
+        self.step_remainder = target - round(target)
+        return duration
+
+    def queue_steps(self, steps: int, speed: float | int | None = None,
+                    accel: float | None = None, jerk: float | None = None) -> float:
+        """
+        Start waveform move of microsteps without waiting its end (needs waveform engine)
+        :param steps: microsteps of rotation ( - sign mean DIR change)
+        :param speed: float speed of rotation r/min
+        :param accel: acceleration r/min per second (None -> driver default)
+        :param jerk: jerk r/min per second^2 (None -> driver default)
+        :return: expected move time in seconds
+        """
+        pulses: int = abs(steps)  # Sign is DIR
+        current_lvl_duration: float = self.sector_lvl_duration(speed=speed)
+        self.begin_move(pulses=pulses, lvl_duration=current_lvl_duration)
+        setup: list[int] = self.set_direction(value=steps) if pulses else []
+        logger.debug('Start moving ...')
+        accel = self.accel if accel is None else accel
+        jerk = self.jerk if jerk is None else jerk
+        self.position += steps
+        if accel is not None:
+            return self.queue_profiled(pulses=pulses, lvl_duration=current_lvl_duration, accel=accel, jerk=jerk,
+                                       setup=setup)
+        return self.pulse_engine.send_pulses(pulses=pulses, lvl_duration=current_lvl_duration, wait=False,
+                                             setup=setup)
+
+    def queue_profiled(self, pulses: int, lvl_duration: float, accel: float, jerk: float | None = None,
+                       setup: list[int] | None = None) -> float:
+        """
+        Start move with accel ramp, cruise and decel ramp (trapezoidal or S-curve when jerk)
+        :param pulses: amount of PUL impulses
+        :param lvl_duration: cruise lvl duration
+        :param accel: acceleration r/min per second
+        :param jerk: jerk r/min per second^2 (None -> trapezoidal)
+        :param setup: wave_chain data sent in front of move (ENA / DIR setup)
+        :return: expected move time in seconds
+        """
+        with self.pulse_engine.cache.compiling():
+            chain, duration = self.move_chain(pulses=pulses, lvl_duration=lvl_duration, accel=accel, jerk=jerk)
+            self.pulse_engine.transmit(chain=[*(setup or []), *chain])
+        return duration
+
+    def move_chain(self, pulses: int, lvl_duration: float, accel: float | None,
+                   jerk: float | None = None) -> tuple[list[int], float]:
+        """
+        wave_chain data of PUL impulses of move (profiled when accel)
+        :param pulses: amount of PUL impulses
+        :param lvl_duration: cruise lvl duration
+        :param accel: acceleration r/min per second (None -> constant speed)
+        :param jerk: jerk r/min per second^2 (None -> trapezoidal)
+        :return: wave_chain data, expected move time in seconds
+        """
+        if accel is None:
+            return self.pulse_engine.cruise_chain(period=2 * lvl_duration * 1e6, pulses=pulses)
+        peak_speed: float = self.convert_lvl_duration_to_speed(lvl_duration=lvl_duration)
+        profile: MotionProfile = MotionProfile(
+            pulses=pulses,
+            peak_freq=speed_to_freq(speed=peak_speed, full_rotate_steps=self.full_rotate_steps),
+            accel=speed_to_freq(speed=accel, full_rotate_steps=self.full_rotate_steps),
+            jerk=None if jerk is None else speed_to_freq(speed=jerk, full_rotate_steps=self.full_rotate_steps))
+        logger.debug('%s profile: ramp %s cruise %s pulses', profile.kind, profile.ramp_pulses, profile.cruise_pulses)
+        return self.profile_compiler.compile(profile=profile, key=(profile.kind, peak_speed, accel, jerk)), \
+            profile.duration
+
+    @property
+    def exact_position(self) -> Fraction:
+        """
+        :return: commanded position in exact microsteps (sent microsteps and carried fraction)
+        """
+        return self.position + self.step_remainder
+
+    def sector_microsteps(self, sector: float | Fraction, reductor: bool = False) -> Fraction:
+        """
+        :param sector: sectors of motor rotation (of system rotation after reductor for reductor)
+        :param reductor: sector is of system rotation (reductor_ratio motor rotations)
+        :return: exact microsteps
+        """
+        microsteps: Fraction = exact_fraction(sector) * self.sector_ratio
+        return microsteps * exact_fraction(self.reductor_ratio) if reductor else microsteps
+
+    def move_to(self, sector: float | Fraction, speed: float | int | None = None, accel: float | None = None,
+                jerk: float | None = None, reductor: bool = False) -> None:
+        """
+        Move to absolute position, fraction of microstep is carried to next move
+        :param sector: position from zero in sectors (float is exact as written, Fraction for thirds etc.)
+        :param speed: float speed of rotation r/min
+        :param accel: acceleration r/min per second (None -> driver default)
+        :param jerk: jerk r/min per second^2 (None -> driver default)
+        :param reductor: sector is of system rotation (after reductor)
+        :return: None
+        """
+        target: Fraction = self.sector_microsteps(sector, reductor=reductor)
+        self.rotate_steps(steps=round(target) - self.position, speed=speed, accel=accel, jerk=jerk)
+        self.step_remainder = target - round(target)
+
+    def queue_many(self, sectors: Iterable[float | Fraction], speed: float | int | None = None,
+                   accel: float | None = None, jerk: float | None = None, dwell: float = 0,
+                   reductor: bool = False) -> float:
+        """
+        Start batch of absolute moves (needs waveform engine) compiled into one wave_chain transmission:
+        ENA / DIR setup, PUL impulses and dwell of every move, periodic moves (indexing) looped by DMA
+        Batch over wave_chain limits is split between moves into transmissions sent back to back
+        (blocks until last one is sent)
+        :param sectors: positions from zero in sectors
+        :param speed: float speed of rotation r/min
+        :param accel: acceleration r/min per second (None -> driver default)
+        :param jerk: jerk r/min per second^2 (None -> driver default)
+        :param dwell: pause after every move in seconds
+        :param reductor: sectors are of system rotation (after reductor)
+        :return: expected time of last transmission in seconds
+        """
+        chains, pinned = self.compile_many(sectors=sectors, speed=speed, accel=accel, jerk=jerk, dwell=dwell,
+                                           reductor=reductor)
+        try:
+            self.pending = [chain for chain, _ in chains]
+            for chain, duration in chains:
+                self.pulse_engine.wait()  # Previous transmission of batch
+                if self.pulse_engine.halted or self.aborting:
+                    return 0  # Stopped by safety monitor or abort()
+                self.pending.pop(0)
+                self.pulse_engine.transmit(chain=chain)
+        finally:
+            self.pulse_engine.cache.unpin(pinned)
+        return chains[-1][1] if chains else 0
+
+    def compile_many(self, sectors: Iterable[float | Fraction], speed: float | int | None = None,
+                     accel: float | None = None, jerk: float | None = None, dwell: float = 0,
+                     reductor: bool = False) -> tuple[list[tuple[list[int], float]], set[int]]:
+        """
+        Compile batch of absolute moves into wave_chain transmissions (see queue_many), position is updated
+        Waves of transmissions are pinned, caller unpins them after last transmission is sent
+        :param sectors: positions from zero in sectors
+        :param speed: float speed of rotation r/min
+        :param accel: acceleration r/min per second (None -> driver default)
+        :param jerk: jerk r/min per second^2 (None -> driver default)
+        :param dwell: pause after every move in seconds
+        :param reductor: sectors are of system rotation (after reductor)
+        :return: list of (chain, expected time in seconds) of transmissions, pinned wave ids
+        """
+        targets: list[Fraction] = [self.sector_microsteps(sector, reductor=reductor) for sector in sectors]
+        if not targets:
+            return [], set()
+        ends: list[int] = [round(target) for target in targets]
+        moves: list[int] = [end - start for start, end in zip([self.position, *ends], ends)]
+        current_lvl_duration: float = self.sector_lvl_duration(speed=speed)
+        self.begin_move(pulses=sum(map(abs, moves)), lvl_duration=current_lvl_duration)
+        accel = self.accel if accel is None else accel
+        jerk = self.jerk if jerk is None else jerk
+        blocks: list[list[int]] = []
+        durations: list[float] = []
+        pinned: set[int] = set()  # Waves of batch are kept until it is sent
+        for steps in moves:
+            block: list[int] = self.set_direction(value=steps)
+            duration: float = self.SLEEP_AFTER_DIR if block else 0
+            with self.pulse_engine.cache.compiling():  # Until waves of block are pinned
+                if steps:
+                    chain, move_time = self.move_chain(pulses=abs(steps), lvl_duration=current_lvl_duration,
+                                                       accel=accel, jerk=jerk)
+                    block += chain
+                    duration += move_time
+                if dwell > 0:
+                    block += self.pulse_engine.delay_chain(dwell)
+                    duration += dwell
+                if block:
+                    blocks.append(block)
+                    durations.append(duration)
+                    waves: set[int] = self.pulse_engine.cache.chain_waves(block) - pinned
+                    self.pulse_engine.cache.pin(waves)
+                    pinned |= waves
+        self.position = ends[-1]
+        self.step_remainder = targets[-1] - ends[-1]
+        chains: list[tuple[list[int], float]] = self.pulse_engine.batch_chains(blocks=blocks, durations=durations)
+        logger.debug('%s moves of batch in %s transmissions', len(moves), len(chains))
+        return chains, pinned
+
+    def move_many(self, sectors: Iterable[float | Fraction], speed: float | int | None = None,
+                  accel: float | None = None, jerk: float | None = None, dwell: float = 0,
+                  reductor: bool = False) -> None:
+        """
+        Move through absolute positions by one batch (see queue_many, bit-bang moves one by one)
+        :param sectors: positions from zero in sectors
+        :param speed: float speed of rotation r/min
+        :param accel: acceleration r/min per second (None -> driver default)
+        :param jerk: jerk r/min per second^2 (None -> driver default)
+        :param dwell: pause after every move in seconds
+        :param reductor: sectors are of system rotation (after reductor)
+        :return: None
+        """
+        if self.pulse_engine is not None:
+            self.pulse_engine.wait(duration=self.queue_many(sectors=sectors, speed=speed, accel=accel, jerk=jerk,
+                                                            dwell=dwell, reductor=reductor))
+            return
+        for sector in sectors:
+            self.move_to(sector=sector, speed=speed, accel=accel, jerk=jerk, reductor=reductor)
+            if self.aborting or (self.safety is not None and self.safety.tripped is not None):
+                return
+            self.sleep(dwell)
 
     def rotate_speed(self, speed: float | int = 5, duration: float | int = 6) -> None | bool:
         """
@@ -289,30 +722,134 @@ class DL57D:
         :param duration: time in seconds
         :return: None when don't move or True after Move
         """
+        if self.pulse_engine is not None:
+            move_time: float | None = self.queue_speed(speed=speed, duration=duration)
+            if move_time is None:
+                return  # Don't move
+            self.pulse_engine.wait(duration=move_time)
+            return True
+        impulses: int | None = self.speed_impulses(speed=speed, duration=duration)
+        if impulses is None:
+            return  # Don't move
+        current_lvl_duration: float = self.sector_lvl_duration(speed=abs(speed))
+        self.begin_move(pulses=impulses, lvl_duration=current_lvl_duration)
+        self.set_direction(value=speed)
+        sent: int = self.bit_bang(pulses=impulses, lvl_duration=current_lvl_duration)
+        self.position += sent if speed > 0 else -sent
+        if sent == impulses:
+            return True
+
+    def speed_impulses(self, speed: float | int, duration: float | int) -> int | None:
+        """
+        Check speed and set PUL LOW before speed move
+        :param speed: rotates / min
+        :param duration: time in seconds
+        :return: amount of impulses or None when speed is not available
+        """
         if speed > self.MAX_SPEED_RPM:
-            print(f'Speed {speed} r/min more than max speed {self.MAX_SPEED_RPM}')
+            logger.warning('Speed %s r/min more than max speed %s', speed, self.MAX_SPEED_RPM)
             return  # Don't move
         elif speed > self.max_speed:
-            print(f'Speed {speed} r/min more than max speed {self.max_speed} for microstep {self.microstep}')
+            logger.warning('Speed %s r/min more than max speed %s for microstep %s', speed, self.max_speed, self.microstep)
             return  # Don't move
-        if speed < 0 and (self.pi.read(gpio=self.dir_gpio) != pigpio.LOW):  # CCW DIR
-            self.change_lvl(gpio_name='DIR', lvl=pigpio.LOW)  # Needs to change
-        elif speed > 0 and (self.pi.read(gpio=self.dir_gpio) != pigpio.HIGH):  # CW DIR
-            self.change_lvl(gpio_name='DIR', lvl=pigpio.HIGH)  # Needs to change
-        impulses_per_second: int = int(speed / 60 * self.full_rotate_steps)  # Calculate need amount of steps for second
-        current_lvl_duration = self.convert_speed_to_lvl_duration(speed=speed)
-        print(f'Speed {speed} Lvl duration: {current_lvl_duration}')
-        if current_lvl_duration < self.lv_min_duration:
-            current_lvl_duration = self.lv_min_duration
-            print(f'Lvl duration {self.lv_min_duration}')
-        self.pi.write(gpio=self.pul_gpio, level=pigpio.LOW)  # LVL LOW (0)
-        for _ in range(int(impulses_per_second * duration)):
-            self.pi.write(gpio=self.pul_gpio, level=pigpio.HIGH)  # LVL HIGH (1)
-            sleep(current_lvl_duration)
-            self.pi.write(gpio=self.pul_gpio, level=pigpio.LOW)  # LVL LOW (0)
-            sleep(current_lvl_duration)
-        else:
-            return True
+        impulses_per_second: int = int(abs(speed) / 60 * self.full_rotate_steps)  # Amount of steps for second
+        self.write_bank(low=('PULL',))  # LVL LOW (0)
+        return int(impulses_per_second * duration)
+
+    def queue_speed(self, speed: float | int = 5, duration: float | int = 6) -> float | None:
+        """
+        Start waveform speed move without waiting its end (needs waveform engine)
+        :param speed: rotates / min
+        :param duration: time in seconds
+        :return: expected move time in seconds or None when don't move
+        """
+        impulses: int | None = self.speed_impulses(speed=speed, duration=duration)
+        if impulses is None:
+            return  # Don't move
+        current_lvl_duration: float = self.sector_lvl_duration(speed=abs(speed))
+        self.begin_move(pulses=impulses, lvl_duration=current_lvl_duration)
+        self.position += impulses if speed > 0 else -impulses
+        return self.pulse_engine.send_pulses(pulses=impulses, lvl_duration=current_lvl_duration,
+                                             wait=False, setup=self.set_direction(value=speed) if impulses else [])
+
+    def abort(self) -> None:
+        """
+        Abort move in safe state: transmission stopped, PUL LOW and ENA off (1) like stop_driver
+        Connection to pigpiod stays opened, could be called from other thread than running move
+        (bit-bang loop and batch of running move end at next impulse / transmission)
+        Position is resynced by encoder, else by PUL impulses of waveform move not sent until stop
+        :return: None
+        """
+        self.aborting = True
+        if self.pulse_engine is not None:
+            self.pulse_engine.stop()  # Abort DMA transmission
+        self.write_lvl(gpio_name='PULL', lvl=pigpio.LOW)
+        logger.info('PULL off (0)')
+        if self.ena_gpio is not None:
+            self.write_lvl(gpio_name='ENA', lvl=pigpio.HIGH)
+            logger.info('ENA off (1)')
+        self.pin_state['DIR'] = None  # Setup wave could be stopped before DIR
+        if self.encoder is not None:  # Not sent pulses are not commanded any more
+            self.position = round(self.measured_position())
+        elif self.pulse_engine is not None:
+            dir_lvl: int = pigpio.HIGH if self.dir_gpio is None else self.pi.read(self.dir_gpio)
+            unsent: int | None = self.pulse_engine.unsent_steps(
+                chains=self.pending, dir_mask=0 if self.dir_gpio is None else 1 << self.dir_gpio, dir_lvl=dir_lvl)
+            if unsent is None:
+                logger.warning('Position %s is not resynced (stopped stream)', self.position)
+            else:
+                self.position -= unsent
+        self.pending = []
+
+    def measured_position(self) -> float:
+        """
+        :return: encoder position in microsteps since zero
+        """
+        return self.encoder.position * self.full_rotate_steps / self.encoder.counts_per_rotation
+
+    def following_error(self) -> float | None:
+        """
+        :return: commanded - encoder position in microsteps (None without encoder)
+        """
+        if self.encoder is None:
+            logger.warning('No encoder connection (EA / EB)')
+            return
+        return self.position - self.measured_position()
+
+    def correct_position(self, tolerance: float = 1, speed: float | int | None = None,
+                         settle: float = 0.02) -> float | None:
+        """
+        Compare end position with encoder and send missing (or extra) microsteps by one corrective move
+        Commanded position is not changed by correction
+        :param tolerance: accepted following error in microsteps
+        :param speed: float speed of correction r/min
+        :param settle: seconds for motor to settle after last PUL
+        :return: following error after correction (None without encoder)
+        """
+        if self.encoder is None:
+            logger.warning('No encoder connection (EA / EB)')
+            return
+        self.sleep(settle)
+        error: float = self.following_error()
+        if abs(error) > tolerance:
+            logger.info('Following error %.1f microsteps, correcting', error)
+            correction: int = round(error)
+            self.rotate_steps(steps=correction, speed=speed)
+            self.position -= correction
+            self.sleep(settle)
+            error = self.following_error()
+        logger.info('Following error %.1f microsteps', error)
+        return error
+
+    def zero_position(self) -> None:
+        """
+        Set commanded and encoder position to 0 (after homing)
+        :return: None
+        """
+        self.position = 0
+        self.step_remainder = Fraction(0)
+        if self.encoder is not None:
+            self.encoder.zero()
 
     def stop_driver(self) -> None:
         """
@@ -320,16 +857,22 @@ class DL57D:
         :return: None
         """
         try:
+            if self.pulse_engine is not None:
+                self.pulse_engine.stop()  # Abort DMA transmission
+                self.profile_compiler.clear()
+                self.pulse_engine.clear()
+                self.setup_waves.clear()
+            if self.encoder is not None:
+                self.encoder.cancel()
             self.pi.write(gpio=self.pul_gpio, level=pigpio.LOW)
-            print('PULL off (0)')
+            logger.info('PULL off (0)')
             self.pi.write(gpio=self.ena_gpio, level=pigpio.HIGH)
-            print('ENA off (1)')
+            logger.info('ENA off (1)')
         except Exception as e:
-            print('While disabling:')
-            print(e)
+            logger.error('While disabling: %s', e)
         finally:
             self.pi.stop()
-            print('GPIO stops')
+            logger.info('GPIO stops')
 
     def print_mode(self) -> None:
         if self.ena_gpio is not None:
@@ -340,14 +883,21 @@ class DL57D:
         if self.pend_gpio is not None:
             print(f"PEND pin read : {self.pi.read(gpio=self.pend_gpio)}")
 
-    def print_state(self) -> None:
+    def print_state(self, resync: bool = True) -> None:
+        """
+        Print gpio lvls
+        :param resync: read all lvls by one read_bank_1 (False -> shadow state without commands)
+        :return: None
+        """
+        if resync:
+            self.resync_state()
         if self.ena_gpio is not None:
-            print(f"ENA gpio state : {self.pi.read(gpio=self.ena_gpio)}")
+            print(f"ENA gpio state : {self.pin_state['ENA']}")
         if self.dir_gpio is not None:
-            print(f"DIR gpio state : {self.pi.read(gpio=self.dir_gpio)}")
-        print(f"PUL pin read : {self.pi.read(gpio=self.pul_gpio)}")
+            print(f"DIR gpio state : {self.pin_state['DIR']}")
+        print(f"PUL pin read : {self.pin_state['PULL']}")
         if self.pend_gpio is not None:
-            print(f"PEND gpio state : {self.pi.read(gpio=self.pend_gpio)}")
+            print(f"PEND gpio state : {self.pin_state['PEND']}")
         print('#' * 40)
 
 
@@ -453,6 +1003,7 @@ def run_driver(driver: DL57D) -> None:
 
 
 def main() -> None:
+    logging.basicConfig(level=logging.INFO, format='%(message)s')  # Interactive run shows driver diagnostics
     driver: DL57D = setup_driver()
     run_driver(driver=driver)
 
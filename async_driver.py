@@ -0,0 +1,207 @@
+"""
+asyncio API of DL57D driver
+Moves are queued as DMA waveforms and awaited without blocking event loop
+    move = await driver.move_sectors(90)  # Returns as soon as move queued
+    await move                            # Move ended (PEND in position)
+Completion is signalled by pigpio edge callback on PEND, faults by edge callback on ALM
+Cancel of move task aborts transmission in safe state (PUL LOW, ENA off like stop_driver)
+Batch split into several transmissions sends next one from move task after end of previous one
+"""
+import asyncio
+
+from DL57D import DL57D
+from pi_backend import pigpio
+
+
+class DriverAlarm(Exception):
+    """
+    ALM signal of driver while moving
+    """
+
+
+class AsyncDL57D:
+    """
+    Non-blocking moves for DL57D driver with waveform engine
+    """
+    BUSY_POLL: float = 1e-3  # 1 ms between wave_tx_busy polls at the end of move
+
+    def __init__(self, driver: DL57D, pend_lvl: int = pigpio.HIGH, alm_lvl: int = pigpio.HIGH):
+        """
+        :param driver: DL57D driver with waveform engine (use_waves)
+        :param pend_lvl: lvl of PEND gpio when in position
+        :param alm_lvl: lvl of ALM gpio when alarm
+        """
+        if driver.pulse_engine is None:
+            raise ValueError('Async moves need waveform engine (use_waves=True)')
+        self.driver: DL57D = driver
+        self.pend_lvl: int = pend_lvl
+        self.alm_lvl: int = alm_lvl
+        self.loop: asyncio.AbstractEventLoop | None = None  # Loop of callbacks (set on first move)
+        self.move: asyncio.Task | None = None  # Current move
+        self.pend_waiter: asyncio.Future | None = None  # Resolved by PEND in position edge
+        self.alarm: asyncio.Future | None = None  # Resolved by ALM edge while moving
+        self.callbacks: list = []
+        if driver.pend_gpio is not None:
+            self.callbacks.append(driver.pi.callback(driver.pend_gpio, pigpio.EITHER_EDGE, self.pend_callback))
+        if driver.alm_gpio is not None:
+            self.callbacks.append(driver.pi.callback(driver.alm_gpio, pigpio.EITHER_EDGE, self.alm_callback))
+
+    def pend_callback(self, gpio: int, level: int, tick: int) -> None:
+        """
+        pigpio thread callback of PEND edge
+        """
+        if level == self.pend_lvl and self.loop is not None:
+            self.loop.call_soon_threadsafe(self.resolve, self.pend_waiter, tick)
+
+    def alm_callback(self, gpio: int, level: int, tick: int) -> None:
+        """
+        pigpio thread callback of ALM edge, aborts transmission at once
+        """
+        if level == self.alm_lvl:
+            self.driver.pulse_engine.stop()
+            if self.loop is not None:
+                self.loop.call_soon_threadsafe(self.resolve, self.alarm, tick)
+
+    @staticmethod
+    def resolve(future: asyncio.Future | None, tick: int) -> None:
+        """
+        Set result of future from event loop thread
+        """
+        if future is not None and not future.done():
+            future.set_result(tick)
+
+    async def prepare(self) -> None:
+        """
+        Wait previous move and create futures of new one
+        :return: None
+        """
+        self.loop = asyncio.get_running_loop()
+        if self.move is not None and not self.move.done():
+            await asyncio.shield(self.move)  # One move at time
+        self.alarm = self.loop.create_future()
+        self.pend_waiter = self.loop.create_future()
+
+    async def queue(self, start, *args, **kwargs) -> asyncio.Task:
+        """
+        Wait previous move, start new one and create task of its completion
+        :param start: DL57D queue method
+        :return: move task
+        """
+        await self.prepare()
+        duration: float | None = start(*args, **kwargs)
+        self.move = self.loop.create_task(self.complete(duration=duration or 0))
+        return self.move
+
+    async def move_sectors(self, sector: float, speed: float | int | None = None,
+                           accel: float | None = None, jerk: float | None = None) -> asyncio.Task:
+        """
+        Queue sectors move
+        :param sector: degree of rotation ( - sign mean DIR change)
+        :param speed: float speed of rotation r/min
+        :param accel: acceleration r/min per second (None -> driver default)
+        :param jerk: jerk r/min per second^2 (None -> driver default)
+        :return: move task (awaitable, cancel aborts move)
+        """
+        return await self.queue(self.driver.queue_sectors, sector=sector, speed=speed, accel=accel, jerk=jerk)
+
+    async def move_many(self, sectors: list[float], speed: float | int | None = None, accel: float | None = None,
+                        jerk: float | None = None, dwell: float = 0, reductor: bool = False) -> asyncio.Task:
+        """
+        Queue batch of absolute moves (one wave_chain transmission when it fits limits)
+        :param sectors: positions from zero in sectors
+        :param speed: float speed of rotation r/min
+        :param accel: acceleration r/min per second (None -> driver default)
+        :param jerk: jerk r/min per second^2 (None -> driver default)
+        :param dwell: pause after every move in seconds
+        :param reductor: sectors are of system rotation (after reductor)
+        :return: move task (awaitable, cancel aborts batch)
+        """
+        await self.prepare()
+        chains, pinned = self.driver.compile_many(sectors=sectors, speed=speed, accel=accel, jerk=jerk,
+                                                  dwell=dwell, reductor=reductor)
+        engine = self.driver.pulse_engine
+        try:
+            if chains:
+                engine.transmit(chain=chains[0][0])  # Previous move ended, sent at once
+            self.driver.pending = [chain for chain, _ in chains[1:]]  # Not sent when cancelled
+        except BaseException:
+            engine.cache.unpin(pinned)
+            raise
+        self.move = self.loop.create_task(self.complete(duration=chains[0][1] if chains else 0, rest=chains[1:]))
+        self.move.add_done_callback(lambda _: engine.cache.unpin(pinned))
+        return self.move
+
+    async def run_speed(self, speed: float | int = 5, duration: float | int = 6) -> asyncio.Task:
+        """
+        Queue speed move
+        :param speed: rotates / min
+        :param duration: time in seconds
+        :return: move task (awaitable, cancel aborts move)
+        """
+        return await self.queue(self.driver.queue_speed, speed=speed, duration=duration)
+
+    async def complete(self, duration: float, rest: list[tuple[list[int], float]] = ()) -> None:
+        """
+        Wait end of transmission and PEND in position, abort on cancel
+        :param duration: expected move time in seconds
+        :param rest: next transmissions of batch (chain, expected time in seconds), sent after end of previous one
+            (driver.pending until sent)
+        :return: None
+        """
+        try:
+            for chain, chain_duration in rest:
+                await self.wait_for_alarm(self.transmission_end(duration=duration))
+                if self.driver.pulse_engine.halted or self.driver.aborting:
+                    return  # Stopped by safety monitor or abort()
+                self.driver.pending.pop(0)
+                self.driver.pulse_engine.transmit(chain=chain)
+                duration = chain_duration
+            await self.wait_for_alarm(self.transmission_end(duration=duration))
+            if self.driver.pend_gpio is not None and self.driver.pi.read(self.driver.pend_gpio) != self.pend_lvl:
+                await self.wait_for_alarm(self.pend_waiter)
+        except asyncio.CancelledError:
+            self.driver.abort()
+            raise
+
+    async def transmission_end(self, duration: float) -> None:
+        """
+        :param duration: expected move time in seconds
+        :return: None
+        """
+        await asyncio.sleep(duration)
+        while self.driver.pulse_engine.busy():
+            await asyncio.sleep(self.BUSY_POLL)
+
+    async def wait_for_alarm(self, awaitable) -> None:
+        """
+        Await awaitable, raise DriverAlarm when ALM comes first
+        :param awaitable: coroutine or future
+        :return: None
+        """
+        waiter: asyncio.Future = asyncio.ensure_future(awaitable)
+        try:
+            done, _ = await asyncio.wait({waiter, self.alarm}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if not waiter.done():  # Alarm or cancel
+                waiter.cancel()
+        if self.alarm in done:
+            self.driver.abort()
+            raise DriverAlarm(f'ALM on gpio {self.driver.alm_gpio} at tick {self.alarm.result()}')
+
+    def stop(self) -> None:
+        """
+        Abort current move (move task ends with CancelledError)
+        :return: None
+        """
+        if self.move is not None and not self.move.done():
+            self.move.cancel()
+        self.driver.abort()
+
+    def close(self) -> None:
+        """
+        Cancel PEND / ALM callbacks
+        :return: None
+        """
+        for callback in self.callbacks:
+            callback.cancel()
+        self.callbacks.clear()
@@ -0,0 +1,339 @@
+"""
+Pulse timing benchmarks of DL57D driver on simulated pigpio backend (plain Linux, CI)
+Reports achieved pulse rate, command round-trips per move, host side time and stream underruns
+Simulator is deterministic (no period jitter), so timing regressions are caught on host side:
+python time until first transmission command (planning) and of whole call (planning and submits),
+time of simulator playing edges is excluded
+    python benchmarks.py          # Table report
+    python benchmarks.py --json   # JSON report
+    python benchmarks.py --check  # Exit code 1 when any scenario breaks its limits (regression)
+"""
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+from time import perf_counter
+from typing import Callable
+
+import trajectory
+from DL57D import BAD_CODE, DL57D
+from jog import SpeedJog
+from motion_queue import MotionQueue
+from multi_axis import AxisConfig, MultiAxis
+from sim_pigpio import SimulatedPi
+from trajectory import TrajectoryCompiler, Waypoint
+
+PUL_GPIO: int = 18
+TRANSMISSIONS: frozenset[str] = frozenset(('wave_chain', 'wave_send_using_mode', 'wave_send_once', 'wave_send_repeat',
+                                           'hardware_PWM', 'set_PWM_dutycycle', 'write'))  # Commands starting pulses
+
+
+class HostTimedPi(SimulatedPi):
+    """
+    Simulator measuring host side time: time of playing edges (advance of virtual clock) is excluded
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.simulated: float = 0  # Seconds of playing edges
+        self.first_transmission: float | None = None  # Host clock of first transmission command
+
+    def host_clock(self) -> float:
+        """
+        :return: perf_counter seconds without simulation
+        """
+        return perf_counter() - self.simulated
+
+    def advance(self, tick: int) -> None:
+        start: float = perf_counter()
+        super().advance(tick)
+        self.simulated += perf_counter() - start
+
+    def command(self, name: str, *args) -> None:
+        if name in TRANSMISSIONS and self.first_transmission is None:
+            self.first_transmission = self.host_clock()
+        super().command(name, *args)
+
+    def measure(self) -> None:
+        """
+        Start measurement of next call
+        :return: None
+        """
+        self.commands.clear()
+        self.edges.clear()
+        self.first_transmission = None
+
+
+class BenchmarkResult:
+    """
+    Metrics of one benchmark scenario
+    """
+
+    def __init__(self, name: str, pi: SimulatedPi, commanded_freq: float, expected_pulses: int,
+                 planning_time: float, host_time: float, round_trips: int, min_rate_ratio: float,
+                 max_round_trips: int, max_host_time: float, underruns: int = 0):
+        """
+        :param name: scenario name
+        :param pi: simulator after move
+        :param commanded_freq: commanded PUL frequency of cruise (Hz)
+        :param expected_pulses: commanded amount of PUL impulses
+        :param planning_time: host side seconds before first transmission command
+        :param host_time: host side seconds of whole call (planning and submits)
+        :param round_trips: commands to start move (end of move polling excluded)
+        :param min_rate_ratio: limit of achieved / commanded frequency
+        :param max_round_trips: limit of commands per move
+        :param max_host_time: limit of host side seconds (about 10 times of reference run, CI machines are slower)
+        :param underruns: stream underruns (transmitter idle between chunks)
+        """
+        self.name: str = name
+        rises: list[int] = [tick for tick, gpio, level in pi.edges if gpio == PUL_GPIO and level]
+        periods: list[int] = [after - before for before, after in zip(rises, rises[1:])]
+        cruise: list[int] = periods[len(periods) // 4:len(periods) * 3 // 4] or periods  # Without ramps
+        self.pulses: int = len(rises)
+        self.expected_pulses: int = expected_pulses
+        self.commanded_freq: float = commanded_freq
+        self.achieved_freq: float = 1e6 * len(cruise) / sum(cruise) if cruise else 0
+        self.round_trips: int = round_trips
+        self.planning_time: float = planning_time
+        self.host_time: float = host_time
+        self.min_rate_ratio: float = min_rate_ratio
+        self.max_round_trips: int = max_round_trips
+        self.max_host_time: float = max_host_time
+        self.underruns: int = underruns
+
+    def regressions(self) -> list[str]:
+        """
+        :return: broken limits
+        """
+        broken: list[str] = []
+        if self.pulses != self.expected_pulses:
+            broken.append(f'pulses {self.pulses} != {self.expected_pulses}')
+        if self.achieved_freq < self.min_rate_ratio * self.commanded_freq:
+            broken.append(f'rate {self.achieved_freq:.0f} < {self.min_rate_ratio} * {self.commanded_freq:.0f}')
+        if self.round_trips > self.max_round_trips:
+            broken.append(f'round-trips {self.round_trips} > {self.max_round_trips}')
+        if self.host_time > self.max_host_time:
+            broken.append(f'host time {self.host_time * 1e3:.1f} ms > {self.max_host_time * 1e3:.1f} ms')
+        if self.underruns:
+            broken.append(f'underruns {self.underruns}')
+        return broken
+
+    def as_dict(self) -> dict:
+        return {'name': self.name,
+                'pulses': self.pulses,
+                'expected_pulses': self.expected_pulses,
+                'commanded_freq': self.commanded_freq,
+                'achieved_freq': self.achieved_freq,
+                'round_trips': self.round_trips,
+                'planning_time_s': self.planning_time,
+                'host_time_s': self.host_time,
+                'underruns': self.underruns,
+                'regressions': self.regressions()}
+
+
+def timed(pi: HostTimedPi, func: Callable, *args, **kwargs) -> tuple[float, float]:
+    """
+    :param pi: simulator of func
+    :return: host side seconds before first transmission command and of whole func call
+    """
+    pi.measure()
+    start: float = pi.host_clock()
+    func(*args, **kwargs)
+    end: float = pi.host_clock()
+    return (end if pi.first_transmission is None else pi.first_transmission) - start, end - start
+
+
+def driver_scenario(name: str, move: Callable[[DL57D], object], speed: float, min_rate_ratio: float,
+                    max_round_trips: int, max_host_time: float, sectors: float = 0,
+                    expected_pulses: int | None = None, warm: bool = False, **driver_kwargs) -> BenchmarkResult:
+    """
+    Run move of DL57D on fresh simulator
+    :param name: scenario name
+    :param move: queue move
+    :param speed: r/min of cruise
+    :param min_rate_ratio: limit of achieved / commanded frequency
+    :param max_round_trips: limit of commands per move
+    :param max_host_time: limit of host side seconds
+    :param sectors: sectors of move
+    :param expected_pulses: commanded impulses of not sectors move
+    :param warm: measure second same move (cached waves)
+    :param driver_kwargs: DL57D params
+    :return: result
+    """
+    pi: HostTimedPi = HostTimedPi()
+    driver: DL57D = DL57D(pi=pi, pul_gpio=PUL_GPIO, **driver_kwargs)
+    driver.set_direction(value=1)  # DIR setup is not part of benchmark
+    if warm:
+        move(driver)
+        driver.pulse_engine.wait()
+    planning_time, host_time = timed(pi, move, driver)
+    round_trips: int = len(pi.commands)
+    if driver.pulse_engine is not None:
+        driver.pulse_engine.wait()
+    return BenchmarkResult(name=name, pi=pi, round_trips=round_trips,
+                           commanded_freq=speed / 60 * driver.full_rotate_steps,
+                           expected_pulses=abs(int(sectors * driver.sector_steps))
+                           if expected_pulses is None else expected_pulses,
+                           planning_time=planning_time, host_time=host_time, min_rate_ratio=min_rate_ratio,
+                           max_round_trips=max_round_trips, max_host_time=max_host_time)
+
+
+def polled(pi: SimulatedPi) -> int:
+    """
+    :return: commands without end of transmission polling
+    """
+    return len([command for command in pi.commands if command[1] not in ('wave_tx_busy', 'wave_tx_at')])
+
+
+def multi_axis_scenario() -> BenchmarkResult:
+    """
+    Two axes coordinated move, metrics of first axis
+    """
+    pi: HostTimedPi = HostTimedPi()
+    axes: MultiAxis = MultiAxis([AxisConfig('x', pul_gpio=PUL_GPIO, dir_gpio=23, ena_gpio=13),
+                                 AxisConfig('y', pul_gpio=19, dir_gpio=24, ena_gpio=6)], pi=pi)
+    planning_time, host_time = timed(pi, axes.move_sectors, {'x': 400, 'y': -300}, speed=1000)
+    return BenchmarkResult(name='multi_axis 2 axes', pi=pi, round_trips=polled(pi),
+                           commanded_freq=1000 / 60 * axes.axes['x'].full_rotate_steps,
+                           expected_pulses=400 * axes.axes['x'].sector_steps,
+                           planning_time=planning_time, host_time=host_time, min_rate_ratio=0.95,
+                           max_round_trips=20, max_host_time=0.01)
+
+
+def motion_queue_scenario() -> BenchmarkResult:
+    """
+    Program of blended segments streamed by motion queue
+    """
+    pi: HostTimedPi = HostTimedPi()
+    driver: DL57D = DL57D(pi=pi, pul_gpio=PUL_GPIO)
+    motion: MotionQueue = MotionQueue(driver, accel=5000)
+    for sectors in (1000, 500, 1500, 1000):
+        motion.add_sectors(sectors, speed=1000)
+    planning_time, host_time = timed(pi, motion.run)
+    return BenchmarkResult(name='motion_queue 4 segments', pi=pi, round_trips=polled(pi),
+                           commanded_freq=1000 / 60 * driver.full_rotate_steps,
+                           expected_pulses=4000 * driver.sector_steps,
+                           planning_time=planning_time, host_time=host_time, min_rate_ratio=0.99,
+                           max_round_trips=120, max_host_time=0.7, underruns=motion.underruns)
+
+
+def move_many_scenario() -> BenchmarkResult:
+    """
+    Batch of absolute moves compiled into wave_chain transmissions (ramps of short moves lower rate)
+    """
+    pi: HostTimedPi = HostTimedPi()
+    driver: DL57D = DL57D(pi=pi, pul_gpio=PUL_GPIO, accel=5000)
+    targets: list[float] = [400 * (index % 2) + 10 * index for index in range(1, 41)]
+    planning_time, host_time = timed(pi, driver.move_many, targets, speed=300)
+    ends: list[float] = [0, *targets]
+    return BenchmarkResult(name='move_many 40 moves', pi=pi, round_trips=polled(pi),
+                           commanded_freq=300 / 60 * driver.full_rotate_steps,
+                           expected_pulses=sum(abs(end - start) for start, end in zip(ends, ends[1:]))
+                           * driver.sector_steps,
+                           planning_time=planning_time, host_time=host_time, min_rate_ratio=0.75,
+                           max_round_trips=30, max_host_time=0.07)
+
+
+def jog_scenario() -> BenchmarkResult:
+    """
+    PWM jog: ramp up, 1 s cruise, ramp down (retarget commands of ramp thread counted)
+    """
+    pi: HostTimedPi = HostTimedPi()
+    driver: DL57D = DL57D(pi=pi, pul_gpio=PUL_GPIO)
+    jog: SpeedJog = SpeedJog(driver, accel=5000)
+    driver.set_direction(value=1)
+
+    def run() -> None:
+        jog.set_speed(1000)
+        driver.sleep(1)
+        jog.stop()
+
+    planning_time, host_time = timed(pi, run)
+    jog.close()
+    return BenchmarkResult(name='jog ramp and cruise', pi=pi, round_trips=len(pi.commands),
+                           commanded_freq=1000 / 60 * driver.full_rotate_steps, expected_pulses=driver.position,
+                           planning_time=planning_time, host_time=host_time, min_rate_ratio=0.99,
+                           max_round_trips=60, max_host_time=0.03)
+
+
+def replay_scenario() -> BenchmarkResult | None:
+    """
+    Replay of compiled trajectory file (None without numpy)
+    """
+    if trajectory.np is None:
+        return
+    pi: HostTimedPi = HostTimedPi()
+    driver: DL57D = DL57D(pi=pi, pul_gpio=PUL_GPIO)
+    with tempfile.TemporaryDirectory() as directory:
+        path: str = os.path.join(directory, 'program.dl57')
+        TrajectoryCompiler(driver).compile([Waypoint(2000, speed=300, accel=5000),
+                                            Waypoint(1500, speed=300, accel=5000)], path)
+        underruns: list[int] = []
+        planning_time, host_time = timed(pi, lambda: underruns.append(trajectory.replay(driver, path)))
+    return BenchmarkResult(name='trajectory replay 2 legs', pi=pi, round_trips=polled(pi),
+                           commanded_freq=300 / 60 * driver.full_rotate_steps,
+                           expected_pulses=2500 * driver.sector_steps,
+                           planning_time=planning_time, host_time=host_time, min_rate_ratio=0.99,
+                           max_round_trips=100, max_host_time=0.8, underruns=underruns[0])
+
+
+def run_benchmarks() -> list[BenchmarkResult]:
+    """
+    :return: results of all scenarios
+    """
+    with contextlib.redirect_stdout(io.StringIO()):  # Driver diagnostics are not part of report
+        results: list[BenchmarkResult | None] = [
+            driver_scenario('rotate_sectors bit-bang', sectors=40, speed=1000, use_waves=False,
+                            move=lambda driver: driver.rotate_sectors(40, speed=1000),
+                            min_rate_ratio=0, max_round_trips=1000, max_host_time=0.05),
+            driver_scenario('rotate_sectors waves', sectors=400, speed=1000,
+                            move=lambda driver: driver.queue_sectors(400, speed=1000),
+                            min_rate_ratio=0.99, max_round_trips=10, max_host_time=0.01),
+            driver_scenario('rotate_sectors trapezoidal', sectors=4000, speed=1000, accel=5000,
+                            move=lambda driver: driver.queue_sectors(4000, speed=1000),
+                            min_rate_ratio=0.99, max_round_trips=120, max_host_time=0.2),
+            driver_scenario('rotate_sectors trapezoidal warm', sectors=4000, speed=1000, accel=5000, warm=True,
+                            move=lambda driver: driver.queue_sectors(4000, speed=1000),
+                            min_rate_ratio=0.99, max_round_trips=5, max_host_time=0.01),
+            driver_scenario('rotate_sectors s-curve', sectors=4000, speed=1000, accel=5000, jerk=50000,
+                            move=lambda driver: driver.queue_sectors(4000, speed=1000),
+                            min_rate_ratio=0.99, max_round_trips=120, max_host_time=0.25),
+            driver_scenario('rotate_sectors s-curve warm', sectors=4000, speed=1000, accel=5000, jerk=50000,
+                            warm=True, move=lambda driver: driver.queue_sectors(4000, speed=1000),
+                            min_rate_ratio=0.99, max_round_trips=5, max_host_time=0.01),
+            driver_scenario('rotate_speed waves', speed=1000, expected_pulses=int(1000 / 60 * 2000) * 3,
+                            move=lambda driver: driver.queue_speed(speed=1000, duration=3),
+                            min_rate_ratio=0.99, max_round_trips=10, max_host_time=0.01),
+            multi_axis_scenario(),
+            motion_queue_scenario(),
+            move_many_scenario(),
+            jog_scenario(),
+            replay_scenario(),
+        ]
+    return [result for result in results if result is not None]
+
+
+def main() -> None:
+    results: list[BenchmarkResult] = run_benchmarks()
+    if '--json' in sys.argv:
+        print(json.dumps([result.as_dict() for result in results], indent=2))
+    else:
+        print(f'{"scenario":<34}{"pulses":>8}{"rate Hz":>10}{"cmd Hz":>10}'
+              f'{"cmds":>7}{"plan ms":>9}{"host ms":>9}{"under":>7}')
+        for result in results:
+            print(f'{result.name:<34}{result.pulses:>8}{result.achieved_freq:>10.0f}{result.commanded_freq:>10.0f}'
+                  f'{result.round_trips:>7}{result.planning_time * 1e3:>9.2f}{result.host_time * 1e3:>9.2f}'
+                  f'{result.underruns:>7}')
+    if '--check' in sys.argv:
+        broken: dict[str, list[str]] = {result.name: result.regressions() for result in results}
+        broken = {name: limits for name, limits in broken.items() if limits}
+        for name, limits in broken.items():
+            print(f'REGRESSION {name}: {limits}')
+        if broken:
+            sys.exit(-BAD_CODE)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,485 @@
+"""
+asyncio command server of DL57D driver (replaces blocking input() loop of run_driver for line controllers)
+    python command_server.py --unix /tmp/dl57d.sock
+    python command_server.py --tcp 0.0.0.0:8757
+Frame: 4 bytes big-endian length + payload
+Request payload:  request id (uint32) + opcode (uint8) + packed args (ARGS)
+Reply payload:    request id (uint32) + opcode (uint8) + status (uint8) + packed result (RESULTS) or error text
+Telemetry:        reply of SUBSCRIBE request id with TELEMETRY opcode, sent every interval until UNSUBSCRIBE
+Requests are pipelined (replies carry request id), driver commands run in one worker thread in arrival order,
+STOP acts at once on its own thread (running command of worker is interrupted), then cleans up in worker order
+MOVE_SECTORS / RUN_SPEED are rejected while jog runs on PUL gpio (JOG 0 or STOP before moves)
+Backpressure: no more than max_inflight requests per connection are read (socket is not read while full),
+telemetry frames are dropped while client does not read its socket
+"""
+import argparse
+import asyncio
+import logging
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import count
+
+from DL57D import DL57D
+from jog import SpeedJog
+
+PING: int = 1
+MOVE_SECTORS: int = 2  # sector, speed (NaN -> driver default)
+RUN_SPEED: int = 3  # speed, duration
+JOG: int = 4  # speed (0 -> ramp down)
+STOP: int = 5  # Abort move / jog at once
+STATE: int = 6
+WAIT: int = 7  # End of transmission
+SUBSCRIBE: int = 8  # interval seconds
+UNSUBSCRIBE: int = 9  # request id of subscription
+SET_LVL: int = 10  # gpio name index of LVL_NAMES, lvl (-1 -> change)
+TELEMETRY: int = 128
+
+OK: int = 0
+BAD_REQUEST: int = 1
+FAILED: int = 2
+
+LVL_NAMES: tuple[str, ...] = ('PULL', 'ENA', 'DIR')
+LENGTH: struct.Struct = struct.Struct('!I')
+HEADER: struct.Struct = struct.Struct('!IB')  # request id, opcode
+REPLY: struct.Struct = struct.Struct('!IBB')  # request id, opcode, status
+STATE_STRUCT: struct.Struct = struct.Struct('!IqB')  # gpio bank 1 lvls, position microsteps, transmitting
+EMPTY: struct.Struct = struct.Struct('!')
+ARGS: dict[int, struct.Struct] = {PING: EMPTY,
+                                  MOVE_SECTORS: struct.Struct('!dd'),
+                                  RUN_SPEED: struct.Struct('!dd'),
+                                  JOG: struct.Struct('!d'),
+                                  STOP: EMPTY,
+                                  STATE: EMPTY,
+                                  WAIT: EMPTY,
+                                  SUBSCRIBE: struct.Struct('!d'),
+                                  UNSUBSCRIBE: struct.Struct('!I'),
+                                  SET_LVL: struct.Struct('!Bb')}
+RESULTS: dict[int, struct.Struct] = {MOVE_SECTORS: struct.Struct('!d'),  # Expected move time
+                                     RUN_SPEED: struct.Struct('!d'),
+                                     STATE: STATE_STRUCT,
+                                     TELEMETRY: STATE_STRUCT}
+MAX_FRAME: int = 256
+
+logger: logging.Logger = logging.getLogger('dl57d.command_server')
+
+
+class CommandError(Exception):
+    """
+    Not OK status of reply
+    """
+
+    def __init__(self, status: int, message: str):
+        super().__init__(f'Status {status}: {message}')
+        self.status: int = status
+
+
+def frame(payload: bytes) -> bytes:
+    """
+    :return: length prefixed payload
+    """
+    return LENGTH.pack(len(payload)) + payload
+
+
+async def read_frame(reader: asyncio.StreamReader) -> bytes:
+    """
+    :return: payload of next frame (IncompleteReadError at end of stream)
+    """
+    (length,) = LENGTH.unpack(await reader.readexactly(LENGTH.size))
+    if length > MAX_FRAME:
+        raise ConnectionError(f'Frame of {length} bytes is too long')
+    return await reader.readexactly(length)
+
+
+class Connection:
+    """
+    Client connection state of server
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter, max_inflight: int):
+        self.writer: asyncio.StreamWriter = writer
+        self.inflight: asyncio.Semaphore = asyncio.Semaphore(max_inflight)
+        self.subscriptions: dict[int, asyncio.Task] = {}  # Request id -> telemetry task
+        self.dropped: int = 0  # Telemetry frames dropped by backpressure
+
+    async def send(self, payload: bytes) -> None:
+        self.writer.write(frame(payload))
+        await self.writer.drain()
+
+
+class CommandServer:
+    """
+    Binary protocol server of one driver
+    """
+    BUSY_POLL: float = 1e-3  # 1 ms between wave_tx_busy polls while waiting end of move
+
+    def __init__(self, driver: DL57D, max_inflight: int = 64, telemetry_buffer: int = 64 * 1024):
+        """
+        :param driver: DL57D driver
+        :param max_inflight: max amount of not replied requests of connection
+        :param telemetry_buffer: bytes in socket write buffer above which telemetry frames are dropped
+        """
+        self.driver: DL57D = driver
+        self.max_inflight: int = max_inflight
+        self.telemetry_buffer: int = telemetry_buffer
+        self.executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='dl57d')
+        self.stopper: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='dl57d-stop')
+        self.motion: asyncio.Lock | None = None  # One queued move at time (created in loop)
+        self.jog: SpeedJog | None = None
+        self.server: asyncio.AbstractServer | None = None
+        self.handlers: dict = {PING: self.ping, MOVE_SECTORS: self.move_sectors, RUN_SPEED: self.run_speed,
+                               JOG: self.jog_speed, STOP: self.stop, STATE: self.state, WAIT: self.wait,
+                               SUBSCRIBE: self.subscribe, UNSUBSCRIBE: self.unsubscribe, SET_LVL: self.set_lvl}
+
+    async def start_unix(self, path: str) -> asyncio.AbstractServer:
+        self.motion = asyncio.Lock()
+        self.server = await asyncio.start_unix_server(self.connection, path=path)
+        return self.server
+
+    async def start_tcp(self, host: str, port: int) -> asyncio.AbstractServer:
+        self.motion = asyncio.Lock()
+        self.server = await asyncio.start_server(self.connection, host=host, port=port)
+        return self.server
+
+    async def call(self, func, *args, **kwargs):
+        """
+        Run driver command in worker thread (commands are serialized in arrival order)
+        """
+        return await asyncio.get_running_loop().run_in_executor(self.executor, partial(func, *args, **kwargs))
+
+    async def connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Read requests of one client
+        """
+        connection: Connection = Connection(writer=writer, max_inflight=self.max_inflight)
+        requests: set[asyncio.Task] = set()
+        try:
+            while True:
+                payload: bytes = await read_frame(reader)
+                await connection.inflight.acquire()  # Full -> socket is not read (client is blocked by TCP window)
+                task: asyncio.Task = asyncio.create_task(self.request(connection=connection, payload=payload))
+                requests.add(task)
+                task.add_done_callback(requests.discard)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for task in [*connection.subscriptions.values(), *requests]:
+                task.cancel()
+            writer.close()
+
+    async def request(self, connection: Connection, payload: bytes) -> None:
+        """
+        Handle one request and send its reply
+        """
+        request_id: int = 0
+        opcode: int = 0
+        try:
+            request_id, opcode = HEADER.unpack_from(payload)
+            args: tuple = ARGS[opcode].unpack_from(payload, HEADER.size)
+        except (struct.error, KeyError):
+            status, result = BAD_REQUEST, b'Bad request'
+        else:
+            try:
+                result: bytes = await self.handlers[opcode](connection, request_id, *args)
+                status = OK
+            except Exception as e:
+                status, result = FAILED, str(e).encode()[:MAX_FRAME - REPLY.size]
+        finally:
+            connection.inflight.release()
+        try:
+            await connection.send(REPLY.pack(request_id, opcode, status) + result)
+        except ConnectionError:
+            pass
+
+    async def idle(self) -> None:
+        """
+        Wait end of transmission and ramp down of stopping jog without blocking worker thread
+        """
+        if self.driver.pulse_engine is not None:
+            while await self.call(self.driver.pulse_engine.busy):
+                await asyncio.sleep(self.BUSY_POLL)
+        while self.jog is not None and self.jog.active and not self.jog.target:
+            await asyncio.sleep(self.BUSY_POLL)
+
+    def check_jog(self) -> None:
+        """
+        :raise RuntimeError: while jog PWM runs on PUL gpio (its pulses are not counted by moves)
+        """
+        if self.jog is not None and self.jog.active:
+            raise RuntimeError('Jog is running, JOG 0 or STOP before moves')
+
+    def halt(self) -> None:
+        """
+        Stop PUL at once (stop thread): jog PWM off, transmission stopped, bit-bang loop of worker ends
+        """
+        if self.jog is not None:
+            self.jog.abort()
+        self.driver.abort()
+
+    def snapshot(self) -> bytes:
+        """
+        :return: packed pin lvls, position and transmitting state (worker thread)
+        """
+        bank: int = self.driver.resync_state()
+        position: int = self.driver.position if self.jog is None else self.jog.position
+        busy: bool = self.driver.pulse_engine is not None and self.driver.pulse_engine.busy()
+        return STATE_STRUCT.pack(bank, position, busy)
+
+    # Handlers (connection, request id, *args) -> packed result
+
+    async def ping(self, connection: Connection, request_id: int) -> bytes:
+        return b''
+
+    async def move_sectors(self, connection: Connection, request_id: int, sector: float, speed: float) -> bytes:
+        speed = None if speed != speed else speed  # NaN -> driver default
+        async with self.motion:
+            await self.idle()
+            self.check_jog()
+            if self.driver.pulse_engine is None:
+                await self.call(self.driver.rotate_sectors, sector=sector, speed=speed)
+                return RESULTS[MOVE_SECTORS].pack(0)
+            return RESULTS[MOVE_SECTORS].pack(await self.call(self.driver.queue_sectors, sector=sector, speed=speed))
+
+    async def run_speed(self, connection: Connection, request_id: int, speed: float, duration: float) -> bytes:
+        async with self.motion:
+            await self.idle()
+            self.check_jog()
+            if self.driver.pulse_engine is None:
+                moved: bool | None = await self.call(self.driver.rotate_speed, speed=speed, duration=duration)
+                move_time: float | None = 0 if moved else None
+            else:
+                move_time = await self.call(self.driver.queue_speed, speed=speed, duration=duration)
+        if move_time is None:
+            raise ValueError(f'Speed {speed} r/min is not available')
+        return RESULTS[RUN_SPEED].pack(move_time)
+
+    async def jog_speed(self, connection: Connection, request_id: int, speed: float) -> bytes:
+        async with self.motion:
+            await self.idle()
+            if self.jog is None:
+                self.jog = await self.call(SpeedJog, self.driver)
+            await self.call(self.jog.set_speed, speed, wait=False)  # Ramp thread follows new target
+        return b''
+
+    async def stop(self, connection: Connection, request_id: int) -> bytes:
+        await asyncio.get_running_loop().run_in_executor(self.stopper, self.halt)
+        await self.call(self.driver.abort)  # After interrupted command: its state is cleaned up
+        return b''
+
+    async def state(self, connection: Connection, request_id: int) -> bytes:
+        return await self.call(self.snapshot)
+
+    async def wait(self, connection: Connection, request_id: int) -> bytes:
+        async with self.motion:
+            await self.idle()
+        return b''
+
+    async def set_lvl(self, connection: Connection, request_id: int, name: int, lvl: int) -> bytes:
+        await self.call(self.driver.change_lvl, gpio_name=LVL_NAMES[name], lvl=None if lvl < 0 else lvl)
+        return b''
+
+    async def subscribe(self, connection: Connection, request_id: int, interval: float) -> bytes:
+        if interval <= 0:
+            raise ValueError(f'Bad telemetry interval {interval}')
+        connection.subscriptions[request_id] = asyncio.create_task(
+            self.telemetry(connection=connection, request_id=request_id, interval=interval))
+        return b''
+
+    async def unsubscribe(self, connection: Connection, request_id: int, subscription: int) -> bytes:
+        task: asyncio.Task | None = connection.subscriptions.pop(subscription, None)
+        if task is None:
+            raise KeyError(f'No subscription {subscription}')
+        task.cancel()
+        return b''
+
+    async def telemetry(self, connection: Connection, request_id: int, interval: float) -> None:
+        """
+        Send state every interval, frames are dropped while socket write buffer is full (slow client)
+        """
+        while True:
+            state: bytes = await self.call(self.snapshot)
+            if connection.writer.transport.get_write_buffer_size() > self.telemetry_buffer:
+                connection.dropped += 1
+            else:
+                connection.writer.write(frame(REPLY.pack(request_id, TELEMETRY, OK) + state))
+            await asyncio.sleep(interval)
+
+    async def close(self) -> None:
+        """
+        Close server and stop driver
+        """
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.jog is not None:
+            await self.call(self.jog.abort)
+            await self.call(self.jog.close)
+        await self.call(self.driver.stop_driver)
+        self.executor.shutdown()
+        self.stopper.shutdown()
+
+
+class CommandClient:
+    """
+    asyncio client of command server (requests could be pipelined by gather)
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, telemetry_size: int = 1024):
+        """
+        :param reader: stream of connection
+        :param writer: stream of connection
+        :param telemetry_size: kept telemetry states (oldest are dropped)
+        """
+        self.reader: asyncio.StreamReader = reader
+        self.writer: asyncio.StreamWriter = writer
+        self.ids = count(1)
+        self.pending: dict[int, asyncio.Future] = {}
+        self.telemetry: asyncio.Queue[tuple[int, int, int]] = asyncio.Queue(maxsize=telemetry_size)
+        self.receiver: asyncio.Task = asyncio.create_task(self.receive())
+
+    @classmethod
+    async def connect(cls, path: str | None = None, host: str | None = None, port: int | None = None) -> 'CommandClient':
+        """
+        :param path: unix socket path (None -> TCP host, port)
+        """
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path=path)
+        else:
+            reader, writer = await asyncio.open_connection(host=host, port=port)
+        return cls(reader=reader, writer=writer)
+
+    async def receive(self) -> None:
+        """
+        Resolve replies by request id, queue telemetry
+        """
+        try:
+            while True:
+                payload: bytes = await read_frame(self.reader)
+                request_id, opcode, status = REPLY.unpack_from(payload)
+                result: bytes = payload[REPLY.size:]
+                if opcode == TELEMETRY:
+                    if self.telemetry.full():
+                        self.telemetry.get_nowait()
+                    self.telemetry.put_nowait(STATE_STRUCT.unpack(result))
+                    continue
+                future: asyncio.Future | None = self.pending.pop(request_id, None)
+                if future is None or future.done():
+                    continue
+                if status == OK:
+                    future.set_result(result)
+                else:
+                    future.set_exception(CommandError(status=status, message=result.decode(errors='replace')))
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError(f'Connection closed: {e}'))
+            self.pending.clear()
+
+    async def send(self, opcode: int, *args) -> tuple[int, asyncio.Future]:
+        """
+        Send request
+        :return: request id, future of packed result
+        """
+        request_id: int = next(self.ids)
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        self.writer.write(frame(HEADER.pack(request_id, opcode) + ARGS[opcode].pack(*args)))
+        await self.writer.drain()
+        return request_id, future
+
+    async def call(self, opcode: int, *args) -> bytes:
+        """
+        Send request and wait its reply
+        :return: packed result
+        """
+        _, future = await self.send(opcode, *args)
+        return await future
+
+    async def ping(self) -> None:
+        await self.call(PING)
+
+    async def move_sectors(self, sector: float, speed: float | None = None) -> float:
+        """
+        :return: expected move time in seconds (reply comes when move is queued)
+        """
+        result: bytes = await self.call(MOVE_SECTORS, sector, float('nan') if speed is None else speed)
+        return RESULTS[MOVE_SECTORS].unpack(result)[0]
+
+    async def run_speed(self, speed: float, duration: float) -> float:
+        return RESULTS[RUN_SPEED].unpack(await self.call(RUN_SPEED, speed, duration))[0]
+
+    async def jog(self, speed: float) -> None:
+        await self.call(JOG, speed)
+
+    async def stop(self) -> None:
+        await self.call(STOP)
+
+    async def state(self) -> tuple[int, int, int]:
+        """
+        :return: gpio bank 1 lvls, position microsteps, transmitting
+        """
+        return STATE_STRUCT.unpack(await self.call(STATE))
+
+    async def wait(self) -> None:
+        await self.call(WAIT)
+
+    async def set_lvl(self, gpio_name: str, lvl: int | None = None) -> None:
+        await self.call(SET_LVL, LVL_NAMES.index(gpio_name), -1 if lvl is None else lvl)
+
+    async def subscribe(self, interval: float) -> int:
+        """
+        :return: subscription id (telemetry states are put into telemetry queue)
+        """
+        request_id, future = await self.send(SUBSCRIBE, interval)
+        await future
+        return request_id
+
+    async def unsubscribe(self, subscription: int) -> None:
+        await self.call(UNSUBSCRIBE, subscription)
+
+    async def close(self) -> None:
+        self.writer.close()
+        await self.writer.wait_closed()
+        self.receiver.cancel()
+
+
+async def serve(driver: DL57D, path: str | None = None, host: str = '0.0.0.0', port: int = 8757) -> None:
+    """
+    Run server until cancelled
+    :param driver: DL57D driver
+    :param path: unix socket path (None -> TCP host, port)
+    """
+    server: CommandServer = CommandServer(driver=driver)
+    if path is not None:
+        await server.start_unix(path=path)
+        logger.info('Serving on %s', path)
+    else:
+        await server.start_tcp(host=host, port=port)
+        logger.info('Serving on %s:%s', host, port)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+def main() -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description='DL57D command server')
+    parser.add_argument('--unix', help='unix socket path')
+    parser.add_argument('--tcp', default='0.0.0.0:8757', help='host:port (when no --unix)')
+    options: argparse.Namespace = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    host, _, port = options.tcp.rpartition(':')
+    driver: DL57D = DL57D(pul_gpio=18,  # PIN 12
+                          ena_gpio=13,  # PIN 33
+                          dir_gpio=23,  # PIN 16
+                          pend_gpio=12,  # PIN 32
+                          microstep=10,
+                          sectors=360)
+    try:
+        asyncio.run(serve(driver=driver, path=options.unix, host=host, port=int(port)))
+    except KeyboardInterrupt:
+        logger.info('Server closed')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Shared pigpiod connections of DL57D drivers: one connection per daemon (host, port) for all drivers of it
+Lost connection is reopened and edge callbacks are registered again on new connection,
+read-only and idempotent commands are retried, others raise ConnectionError (daemon state is unknown:
+wave created or not, chain sent or not) after transmission is stopped and wave cache is resynced
+    pool = ConnectionPool()
+    pi = pool.get('cell-1.local', 8888)  # Same PooledPi for every driver of daemon
+    x, y = DL57D(pi=pi, pul_gpio=18, dir_gpio=23), DL57D(pi=pi, pul_gpio=19, dir_gpio=24, ena_gpio=25)
+    x.stop_driver()  # Connection stays opened for y, move of y goes on
+Drivers of one daemon share its wave transmitter: their moves are transmitted one after other,
+stop / abort / safety stop of driver aborts only its own transmission (PUL of others is not touched)
+"""
+import logging
+import struct
+import time
+from typing import Callable
+
+from pi_backend import SIMULATED, pigpio
+from wave_cache import CACHES
+
+logger: logging.Logger = logging.getLogger('dl57d.connection_pool')
+
+
+def connect(host: str = 'localhost', port: int = 8888) -> pigpio.pi:
+    """
+    :return: new connection to pigpiod (simulated daemon without pigpio)
+    """
+    return pigpio.pi() if SIMULATED else pigpio.pi(host, port)
+
+
+class PooledCallback:
+    """
+    Edge callback kept over reconnects (pigpio._callback API)
+    """
+
+    def __init__(self, pooled: 'PooledPi', user_gpio: int, edge: int, func: Callable | None):
+        self.pooled: PooledPi = pooled
+        self.args: tuple = (user_gpio, edge, func)
+        self.callback = pooled.pi.callback(*self.args)
+
+    def register(self) -> None:
+        """
+        Register again on new connection (tally starts from 0)
+        """
+        self.callback = self.pooled.pi.callback(*self.args)
+
+    def cancel(self) -> None:
+        self.callback.cancel()
+        if self in self.pooled.callbacks:
+            self.pooled.callbacks.remove(self)
+
+    def tally(self) -> int:
+        return self.callback.tally()
+
+    def reset_tally(self) -> None:
+        self.callback.reset_tally()
+
+
+class PooledPi:
+    """
+    pigpio.pi shared by several drivers: reconnects on lost connection, closed by last user
+    """
+    RETRY_ERRORS: tuple = (OSError, struct.error)  # Socket errors (closed socket gives empty reply)
+    IDEMPOTENT: frozenset[str] = frozenset((  # Read-only or same effect when sent twice -> retried after reconnect
+        'read', 'read_bank_1', 'get_mode', 'get_current_tick', 'get_PWM_frequency', 'wave_tx_busy', 'wave_tx_at',
+        'wave_get_pulses', 'wave_get_cbs', 'wave_get_max_pulses', 'wave_get_max_cbs', 'set_mode', 'set_pull_up_down',
+        'write', 'set_bank_1', 'clear_bank_1', 'set_glitch_filter', 'hardware_PWM', 'set_PWM_frequency',
+        'set_PWM_dutycycle', 'wave_add_new', 'wave_tx_stop', 'wave_clear'))
+    RECONNECT_ATTEMPTS: int = 5
+    RECONNECT_DELAY: float = 0.2  # Seconds between reconnect attempts
+
+    def __init__(self, factory: Callable[[], pigpio.pi]):
+        """
+        :param factory: opens new connection
+        """
+        self.factory: Callable[[], pigpio.pi] = factory
+        self.pi: pigpio.pi = factory()
+        self.users: int = 0
+        self.callbacks: list[PooledCallback] = []
+        self.reconnects: int = 0
+
+    @property
+    def connected(self) -> bool:
+        return bool(self.pi.connected)
+
+    def __getattr__(self, name: str):
+        if name == 'pi':  # Not opened yet
+            raise AttributeError(name)
+        attr = getattr(self.pi, name)
+        if not callable(attr):
+            return attr
+
+        def command(*args, **kwargs):
+            try:
+                return getattr(self.pi, name)(*args, **kwargs)
+            except self.RETRY_ERRORS as e:
+                logger.warning('pigpiod connection lost on %s: %s', name, e)
+                self.reconnect()
+                if name in self.IDEMPOTENT:
+                    return getattr(self.pi, name)(*args, **kwargs)
+                cache = CACHES.get(self)
+                if cache is not None:
+                    cache.resync()
+                raise ConnectionError(f'pigpiod connection lost on {name}, command is not repeated') from e
+
+        self.__dict__[name] = command  # Next lookups skip __getattr__
+        return command
+
+    def reconnect(self) -> None:
+        """
+        Open new connection and register callbacks again
+        :raise ConnectionError: daemon is not reachable
+        """
+        try:
+            self.pi.stop()
+        except self.RETRY_ERRORS:
+            pass
+        for attempt in range(self.RECONNECT_ATTEMPTS):
+            self.pi = self.factory()
+            if self.pi.connected:
+                break
+            time.sleep(self.RECONNECT_DELAY)
+        else:
+            raise ConnectionError(f'pigpiod is not reachable after {self.RECONNECT_ATTEMPTS} attempts')
+        self.reconnects += 1
+        for callback in self.callbacks:
+            callback.register()
+        logger.info('pigpiod reconnected, %s callbacks registered again', len(self.callbacks))
+
+    def callback(self, user_gpio: int, edge: int = pigpio.RISING_EDGE, func: Callable | None = None) -> PooledCallback:
+        callback: PooledCallback = PooledCallback(pooled=self, user_gpio=user_gpio, edge=edge, func=func)
+        self.callbacks.append(callback)
+        return callback
+
+    def stop(self) -> None:
+        """
+        Release connection of one user (driver.stop_driver), closed by last one
+        """
+        self.users -= 1
+        if self.users <= 0:
+            self.pi.stop()
+
+
+class ConnectionPool:
+    """
+    One PooledPi per pigpiod (host, port)
+    """
+
+    def __init__(self, factory: Callable[[str, int], pigpio.pi] = connect):
+        """
+        :param factory: opens connection to (host, port)
+        """
+        self.factory: Callable[[str, int], pigpio.pi] = factory
+        self.connections: dict[tuple[str, int], PooledPi] = {}
+
+    def get(self, host: str = 'localhost', port: int = 8888) -> PooledPi:
+        """
+        Shared connection to daemon, one more user
+        :raise ConnectionError: daemon is not connected
+        """
+        pooled: PooledPi | None = self.connections.get((host, port))
+        if pooled is None or pooled.users <= 0:
+            pooled = PooledPi(factory=lambda: self.factory(host, port))
+            if not pooled.connected:
+                raise ConnectionError(f'pigpiod {host}:{port} is not connected')
+            self.connections[(host, port)] = pooled
+            logger.debug('pigpiod %s:%s connected', host, port)
+        pooled.users += 1
+        return pooled
+
+    def close(self) -> None:
+        """
+        Close all connections
+        """
+        for pooled in self.connections.values():
+            if pooled.users > 0:
+                pooled.pi.stop()
+            pooled.users = 0
+        self.connections.clear()
@@ -0,0 +1,178 @@
+"""
+Config driven setup of many DL57D drivers (dict or TOML file)
+Drivers of one pigpiod share pooled connection, turn ON lvls of all of them are written
+by one clear_bank_1 and one set_bank_1 per daemon
+    [pigpiod]                # Default daemon
+    host = "localhost"
+    port = 8888
+
+    [defaults]               # Options of every driver (DL57D arguments)
+    microstep = 10
+    accel = 5000
+
+    [drivers.x]
+    pul_gpio = 18
+    dir_gpio = 23
+    ena_gpio = 13
+
+    [drivers.y]
+    pul_gpio = 19
+    dir_gpio = 24
+    ena_gpio = 25
+    host = "cell-2.local"    # Other daemon
+
+    drivers = build_drivers(load_config('cell.toml'))  # {'x': DL57D, 'y': DL57D}
+"""
+import inspect
+import logging
+import typing
+
+from connection_pool import ConnectionPool, PooledPi
+from DL57D import DL57D, DriverConfigError
+from pi_backend import pigpio
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    tomllib = None
+
+logger: logging.Logger = logging.getLogger('dl57d.driver_factory')
+
+SECTIONS: frozenset[str] = frozenset(('pigpiod', 'defaults', 'drivers'))
+CONNECTION_OPTIONS: frozenset[str] = frozenset(('host', 'port'))
+DRIVER_OPTIONS: frozenset[str] = frozenset(inspect.signature(DL57D).parameters) - {'pi', 'turn_on'}
+
+
+def option_types(annotation) -> tuple[type, ...]:
+    """
+    :param annotation: annotation of DL57D argument
+    :return: accepted config value types (int is accepted for float)
+    """
+    types: tuple[type, ...] = tuple(type(None) if option is None else option
+                                    for option in typing.get_args(annotation) or (annotation,))
+    return (int, *types) if float in types else types
+
+
+OPTION_TYPES: dict[str, tuple[type, ...]] = {name: option_types(parameter.annotation)
+                                             for name, parameter in inspect.signature(DL57D).parameters.items()
+                                             if name in DRIVER_OPTIONS}
+
+
+def load_config(path: str) -> dict:
+    """
+    :param path: TOML file
+    :return: config dict
+    :raise DriverConfigError: file is not valid TOML
+    """
+    if tomllib is None:
+        raise ImportError('TOML config needs Python 3.11+ (tomllib)')
+    try:
+        with open(path, 'rb') as file:
+            return tomllib.load(file)
+    except tomllib.TOMLDecodeError as e:
+        raise DriverConfigError(f'{path}: {e}') from e
+
+
+def driver_options(config: dict) -> dict[str, tuple[tuple[str, int], dict]]:
+    """
+    Validate config
+    :return: driver name -> ((host, port), DL57D arguments)
+    :raise DriverConfigError: unknown sections or options, bad option types, missing drivers,
+        gpio used twice on one daemon
+    """
+    unknown: set = set(config) - SECTIONS
+    if unknown:
+        raise DriverConfigError(f'Unknown config sections {sorted(unknown)}, expected {sorted(SECTIONS)}')
+    drivers: dict = config.get('drivers') or {}
+    if not isinstance(drivers, dict) or not drivers:
+        raise DriverConfigError('Config has no [drivers.<name>] sections')
+    daemon: dict = config.get('pigpiod', {})
+    unknown = set(daemon) - CONNECTION_OPTIONS
+    if unknown:
+        raise DriverConfigError(f'Unknown pigpiod options {sorted(unknown)}')
+    defaults: dict = config.get('defaults', {})
+    options: dict[str, tuple[tuple[str, int], dict]] = {}
+    used: dict[tuple[str, int], dict[int, str]] = {}  # Daemon -> gpio -> driver name
+    for name, section in drivers.items():
+        merged: dict = {**defaults, **section}
+        address: tuple[str, int] = (merged.pop('host', daemon.get('host', 'localhost')),
+                                    merged.pop('port', daemon.get('port', 8888)))
+        if not isinstance(address[0], str) or not isinstance(address[1], int) or isinstance(address[1], bool):
+            raise DriverConfigError(f'pigpiod {address[0]!r}:{address[1]!r} of driver {name} is not host:port')
+        unknown = set(merged) - DRIVER_OPTIONS
+        if unknown:
+            raise DriverConfigError(f'Unknown options {sorted(unknown)} of driver {name}, '
+                                    f'expected {sorted(DRIVER_OPTIONS | CONNECTION_OPTIONS)}')
+        for key, value in merged.items():
+            types: tuple[type, ...] = OPTION_TYPES[key]
+            if not isinstance(value, types) or (isinstance(value, bool) and bool not in types):
+                expected: str = ' or '.join('none' if option is type(None) else option.__name__ for option in types)
+                raise DriverConfigError(f'{key} {value!r} of driver {name} is not {expected}')
+            if key.endswith('_gpio') and value is not None:
+                if not isinstance(value, int) or not 0 <= value <= 53:
+                    raise DriverConfigError(f'{key} {value!r} of driver {name} is not gpio num')
+                other: str | None = used.setdefault(address, {}).setdefault(value, name)
+                if other != name:
+                    raise DriverConfigError(f'GPIO {value} of driver {name} is used by driver {other}')
+        options[name] = (address, merged)
+    return options
+
+
+def turn_on_drivers(drivers: list[DL57D]) -> None:
+    """
+    Turn ON drivers sharing one connection by one clear_bank_1 and one set_bank_1
+    :param drivers: drivers created with turn_on=False
+    :return: None
+    """
+    pi = drivers[0].pi
+    for names, lvl, command in ((DL57D.TURN_ON_LOW, pigpio.LOW, pi.clear_bank_1),
+                                (DL57D.TURN_ON_HIGH, pigpio.HIGH, pi.set_bank_1)):
+        bits: int = 0
+        for driver in drivers:
+            for name in names:
+                if driver.gpios[name] is not None:
+                    bits |= 1 << driver.gpios[name]
+                    driver.pin_state[name] = lvl
+        if bits:
+            command(bits)
+    drivers[0].sleep(DL57D.SLEEP_AFTER_DIR)
+
+
+def build_drivers(config: dict, pool: ConnectionPool | None = None) -> dict[str, DL57D]:
+    """
+    Create drivers of config with pooled connections and batched turn ON
+    :param config: config dict (load_config for TOML)
+    :param pool: connection pool (None -> new pool)
+    :return: driver name -> DL57D
+    :raise DriverConfigError: bad config
+    :raise ConnectionError: pigpiod is not connected
+    On any error already created drivers are stopped (their pooled connections released) before raise
+    """
+    options: dict[str, tuple[tuple[str, int], dict]] = driver_options(config)
+    pool = ConnectionPool() if pool is None else pool
+    drivers: dict[str, DL57D] = {}
+    connections: dict[tuple[str, int], list[DL57D]] = {}
+    try:
+        for name, (address, arguments) in options.items():
+            pi: PooledPi = pool.get(*address)
+            try:
+                drivers[name] = DL57D(pi=pi, turn_on=False, **arguments)
+            except DriverConfigError as e:
+                pi.stop()
+                raise DriverConfigError(f'Driver {name}: {e}') from e
+            except BaseException:
+                pi.stop()  # Connection user of not created driver
+                raise
+            connections.setdefault(address, []).append(drivers[name])
+        for address, connected in connections.items():
+            turn_on_drivers(connected)
+            logger.info('Drivers %s turned ON on pigpiod %s:%s', [name for name, driver in drivers.items()
+                                                                  if driver in connected], *address)
+    except BaseException:
+        for name, driver in drivers.items():
+            try:
+                driver.stop_driver()  # Safe state, releases its pooled connection
+            except Exception as e:
+                logger.error('While stopping driver %s: %s', name, e)
+        raise
+    return drivers
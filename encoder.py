@@ -0,0 +1,144 @@
+"""
+Quadrature encoder feedback of DL57D servo-motor (EA / EB outputs of motor encoder)
+A / B edges are decoded by pigpio callbacks with 4x counting (every edge of both channels is a count)
+    encoder = QuadratureEncoder(pi, ea_gpio=5, eb_gpio=6)
+    encoder.position  # Counts since zero (4 * ENCODER_RESOLUTION per motor rotation)
+    encoder.velocity()  # r/min of motor averaged over last 10 ms
+Counter is written only by pigpio callback thread, readers never lock it (int assignment is atomic)
+Samples (tick, count) are kept in fixed-size ring buffer of arrays, oldest samples are overwritten
+"""
+from array import array
+
+from pi_backend import pigpio
+
+# (previous AB state << 2 | new AB state) -> count delta (A leading B is +1)
+# 0 for no change or invalid transition (both channels changed)
+TRANSITIONS: tuple[int, ...] = (0, -1, 1, 0,
+                                1, 0, 0, -1,
+                                -1, 0, 0, 1,
+                                0, 1, -1, 0)
+
+
+class QuadratureEncoder:
+    """
+    4x decoder of A / B encoder channels with position, velocity and sample history
+    """
+    COUNTS_PER_LINE: int = 4  # Edges of A and B per encoder line
+
+    def __init__(self, pi: pigpio.pi, ea_gpio: int, eb_gpio: int, resolution: int = 1000,
+                 buffer_size: int = 1024, glitch: int = 0, invert: bool = False):
+        """
+        :param pi: connected backend (pigpio.pi or sim_pigpio.SimulatedPi)
+        :param ea_gpio: raspberry pi GPIO num of EA + connection
+        :param eb_gpio: raspberry pi GPIO num of EB + connection
+        :param resolution: encoder lines per motor rotation (ENCODER_RESOLUTION)
+        :param buffer_size: amount of kept (tick, count) samples
+        :param glitch: glitch filter of pigpiod in micro s (0 -> off)
+        :param invert: count is negative for A leading B (encoder mounted against DIR HIGH rotation)
+        """
+        self.pi: pigpio.pi = pi
+        self.ea_gpio: int = ea_gpio
+        self.eb_gpio: int = eb_gpio
+        self.counts_per_rotation: int = self.COUNTS_PER_LINE * resolution
+        self.sign: int = -1 if invert else 1
+        self.count: int = 0  # Written by callback thread only
+        self.errors: int = 0  # Invalid transitions (missed edge, both channels changed)
+        self.ticks: array = array('q', bytes(8 * buffer_size))  # Unwrapped micro s of samples
+        self.counts: array = array('q', bytes(8 * buffer_size))
+        self.samples: int = 0  # Samples written (next index is samples % buffer_size)
+        self.buffer_size: int = buffer_size
+        for gpio in (ea_gpio, eb_gpio):
+            pi.set_mode(gpio, pigpio.INPUT)
+            if glitch:
+                pi.set_glitch_filter(gpio, glitch)
+        bank: int = pi.read_bank_1()
+        self.state: int = ((bank >> ea_gpio) & 1) << 1 | (bank >> eb_gpio) & 1  # AB
+        self.last_tick: int = pi.get_current_tick()  # Raw 32 bit tick of last sample
+        self.tick: int = 0  # Unwrapped micro s of last sample
+        self.record(tick=self.last_tick)
+        self.callbacks: list = [pi.callback(ea_gpio, pigpio.EITHER_EDGE, self.edge),
+                                pi.callback(eb_gpio, pigpio.EITHER_EDGE, self.edge)]
+
+    def edge(self, gpio: int, level: int, tick: int) -> None:
+        """
+        pigpio thread callback of A or B edge
+        """
+        if level > pigpio.HIGH:  # Watchdog timeout, no edge
+            return
+        bit: int = 2 if gpio == self.ea_gpio else 1
+        state: int = self.state | bit if level else self.state & ~bit
+        delta: int = TRANSITIONS[self.state << 2 | state]
+        if not delta and state != self.state:
+            self.errors += 1
+        self.state = state
+        self.count += self.sign * delta
+        self.record(tick=tick)
+
+    def record(self, tick: int) -> None:
+        """
+        Write sample into ring buffer (index is published after sample is written)
+        :param tick: raw 32 bit tick of pigpio
+        """
+        self.tick += pigpio.tickDiff(self.last_tick, tick)
+        self.last_tick = tick
+        index: int = self.samples % self.buffer_size
+        self.ticks[index] = self.tick
+        self.counts[index] = self.count
+        self.samples += 1
+
+    @property
+    def position(self) -> int:
+        """
+        :return: counts since zero
+        """
+        return self.count
+
+    def rotations(self) -> float:
+        """
+        :return: motor rotations since zero
+        """
+        return self.count / self.counts_per_rotation
+
+    def history(self) -> list[tuple[int, int]]:
+        """
+        :return: kept samples (unwrapped tick micro s, count) oldest first
+        """
+        samples: int = self.samples
+        first: int = max(samples - self.buffer_size, 0)
+        return [(self.ticks[index % self.buffer_size], self.counts[index % self.buffer_size])
+                for index in range(first, samples)]
+
+    def velocity(self, window: float = 0.01) -> float:
+        """
+        Average speed over last window (stopped motor has 0 speed, costs one get_current_tick command)
+        :param window: seconds
+        :return: r/min of motor ( - sign mean CCW)
+        """
+        samples: int = self.samples
+        now: int = self.tick + pigpio.tickDiff(self.last_tick, self.pi.get_current_tick())
+        start: int = now - round(window * 1e6)
+        count: int = self.count
+        before: int = count
+        index: int = samples - 1
+        while index >= max(samples - self.buffer_size, 0):  # Count at start of window
+            position: int = index % self.buffer_size
+            before = self.counts[position]
+            if self.ticks[position] <= start:
+                break
+            index -= 1
+        return (count - before) / self.counts_per_rotation / window * 60
+
+    def zero(self, count: int = 0) -> None:
+        """
+        Set current position
+        :param count: counts of current position
+        """
+        self.count = count
+
+    def cancel(self) -> None:
+        """
+        Cancel A / B callbacks
+        """
+        for callback in self.callbacks:
+            callback.cancel()
+        self.callbacks.clear()
@@ -0,0 +1,230 @@
+"""
+Speed -> PUL timing planner of DL57D driver for one (microstep, pigpiod sample rate)
+Wave edges are quantised to daemon sample rate, so achievable PUL periods are whole multiples of it
+(HIGH lvl at least 2.5 us), software PWM frequencies are 40000 / (sample rate * divider) Hz
+    planner = planner_for(microstep=10, sample_rate=5)  # Cached per key
+    planner.nearest(speed=1234)  # TimingSetting(period=25, high=10, speed=1200.0, error=-0.0275)
+    planner.error_bound(speed=1234)  # Max relative error of nearest setting
+    planner.dither_period(period=24.3, pulses=5000)  # [((20, 25, 25, ...), 100)] average period is 24.3
+    planner.nearest_pwm(freq=1234)  # (1000, 8) software PWM frequency and divider
+Lookups are O(1) arithmetic on period grid (bisect for PWM table), so planner runs per segment of moves
+"""
+from bisect import bisect_left
+from fractions import Fraction
+from functools import lru_cache
+from math import ceil, floor
+from typing import Iterable, NamedTuple
+
+from pulse_engine import PulseEngine
+
+SAMPLE_RATES: tuple[int, ...] = (1, 2, 4, 5, 8, 10)  # pigpiod -s options (micro s)
+PWM_DIVIDERS: tuple[int, ...] = (1, 2, 4, 5, 8, 10, 16, 20, 25, 32, 40, 50, 80, 100, 160, 200, 400, 800)
+PWM_BASE_FREQ: int = 40000  # Software PWM Hz of divider 1 at sample rate 1 us
+
+
+class TimingSetting(NamedTuple):
+    """
+    Achievable PUL timing of commanded speed
+    """
+    period: int  # PUL period micro s (multiple of sample rate)
+    high: int  # HIGH lvl micro s (multiple of sample rate)
+    speed: float  # Achieved r/min
+    error: float  # Relative error of achieved vs commanded speed ( - sign mean slower)
+
+
+class FrequencyPlanner:
+    """
+    Achievable speeds, nearest setting, error bound and dithering of one period grid
+    """
+    STEPS_RATIO: int = 200  # Steps for motor (without microsteps)
+    MAX_SPEED_RPM: float = 2000
+    DITHER_PATTERN: int = 64  # Max periods of dither pattern (one wave of 2 gpioPulse per period)
+
+    def __init__(self, microstep: int, sample_rate: int, max_speed_rpm: float = MAX_SPEED_RPM):
+        """
+        :param microstep: driver setted P001 parameter
+        :param sample_rate: pigpiod sample rate micro s (one of SAMPLE_RATES)
+        :param max_speed_rpm: speed limit of motor r/min
+        """
+        if sample_rate not in SAMPLE_RATES:
+            raise ValueError(f'Not available pigpiod sample rate {sample_rate}, available: {list(SAMPLE_RATES)}')
+        self.microstep: int = microstep
+        self.sample_rate: int = sample_rate
+        self.full_rotate_steps: int = microstep * self.STEPS_RATIO
+        self.speed_period: float = 60e6 / self.full_rotate_steps  # speed * period (r/min * micro s)
+        self.min_lvl: int = ceil(PulseEngine.MIN_LVL_MICROS / sample_rate) * sample_rate  # Shortest lvl on grid
+        speed_limit: int = ceil(self.speed_period / max_speed_rpm / sample_rate - 1e-9)  # Samples at max speed
+        self.min_period: int = max(2 * self.min_lvl, speed_limit * sample_rate)  # Shortest period of moves
+        self.max_speed: float = self.speed_period / self.min_period  # Fastest achievable r/min
+        self.pwm_freqs: tuple[int, ...] = tuple(int(PWM_BASE_FREQ / (sample_rate * divider) + 0.5)
+                                                for divider in PWM_DIVIDERS[::-1])  # Ascending as pigpiod reports
+        self.pwm_speeds: tuple[float, ...] = tuple(freq * 60 / self.full_rotate_steps for freq in self.pwm_freqs)
+
+    def period_of(self, speed: float) -> float:
+        """
+        :param speed: r/min (sign ignored)
+        :return: exact PUL period micro s of speed (not quantised)
+        """
+        return self.speed_period / abs(speed)
+
+    def speed_of(self, period: float) -> float:
+        """
+        :param period: PUL period micro s
+        :return: r/min
+        """
+        return self.speed_period / period
+
+    def split(self, period: int) -> tuple[int, int]:
+        """
+        :param period: period on grid micro s
+        :return: (HIGH micro s, LOW micro s) on grid, HIGH is not longer than LOW
+        """
+        high: int = max(period // 2 // self.sample_rate * self.sample_rate, self.min_lvl)
+        return high, period - high
+
+    def snap(self, period: float) -> int:
+        """
+        :param period: micro s
+        :return: nearest period on grid (not shorter than 2 min lvls)
+        """
+        return max(round(period / self.sample_rate) * self.sample_rate, 2 * self.min_lvl)
+
+    def nearest(self, speed: float) -> TimingSetting:
+        """
+        Nearest achievable setting of speed (max speed for faster ones)
+        :param speed: r/min (sign ignored)
+        :return: timing setting
+        """
+        samples: float = self.period_of(speed) / self.sample_rate
+        low: int = max(floor(samples) * self.sample_rate, self.min_period)
+        high: int = max(ceil(samples) * self.sample_rate, self.min_period)
+        period: int = min(low, high, key=lambda candidate: abs(self.speed_of(candidate) - abs(speed)))
+        achieved: float = self.speed_of(period)
+        return TimingSetting(period=period, high=self.split(period)[0], speed=achieved,
+                             error=achieved / abs(speed) - 1)
+
+    def achievable(self, speed: float) -> bool:
+        """
+        :return: True when speed is on period grid exactly (within float rounding)
+        """
+        return abs(self.nearest(speed).error) < 1e-9
+
+    def error_bound(self, speed: float) -> float:
+        """
+        Max relative speed error of nearest settings around speed (half sample of period)
+        :param speed: r/min (sign ignored)
+        :return: relative error (inf above max speed)
+        """
+        period: float = self.period_of(speed)
+        if period < self.min_period:
+            return float('inf')
+        return self.sample_rate / (2 * period - self.sample_rate)
+
+    def speeds(self, low: float, high: float | None = None) -> tuple[float, ...]:
+        """
+        Achievable speed set between low and high (fastest first)
+        :param low: slowest r/min (> 0)
+        :param high: fastest r/min (None -> max speed)
+        :return: speeds r/min
+        """
+        high = self.max_speed if high is None else min(high, self.max_speed)
+        first: int = ceil(self.period_of(high) / self.sample_rate - 1e-9)
+        last: int = floor(self.period_of(low) / self.sample_rate + 1e-9)
+        return tuple(self.speed_of(samples * self.sample_rate) for samples in range(first, last + 1))
+
+    def dither_period(self, period: float, pulses: int) -> list[tuple[tuple[int, ...], int]]:
+        """
+        Mix two adjacent grid periods so that average period of pulses is period
+        Bresenham pattern of at most DITHER_PATTERN periods (best fraction of sample) is repeated,
+        last repeat is pattern prefix, so longer periods are spread evenly between shorter ones
+        :param period: exact PUL period micro s
+        :param pulses: amount of PUL impulses
+        :return: list of (pattern periods micro s, repeats)
+        """
+        if pulses <= 0:
+            return []
+        samples: float = period / self.sample_rate
+        low: int = floor(samples)
+        if low * self.sample_rate < 2 * self.min_lvl:
+            return [((2 * self.min_lvl,), pulses)]  # No shorter period to mix
+        fraction: Fraction = Fraction(samples - low).limit_denominator(self.DITHER_PATTERN)
+        if fraction.numerator in (0, fraction.denominator):
+            return [(((low + fraction.numerator) * self.sample_rate,), pulses)]
+        count, extra = fraction.denominator, fraction.numerator
+        pattern: tuple[int, ...] = tuple((low + ((index + 1) * extra // count - index * extra // count))
+                                         * self.sample_rate for index in range(count))
+        repeats, rest = divmod(pulses, count)
+        runs: list[tuple[tuple[int, ...], int]] = [(pattern, repeats)] if repeats else []
+        if rest:
+            runs.append((pattern[:rest], 1))
+        return runs
+
+    def dither(self, speed: float, pulses: int) -> list[tuple[tuple[int, ...], int]]:
+        """
+        Dithered periods of speed cruise (speed limited by max speed)
+        :param speed: r/min (sign ignored)
+        :param pulses: amount of PUL impulses
+        :return: list of (pattern periods micro s, repeats)
+        """
+        return self.dither_period(period=max(self.period_of(speed), self.min_period), pulses=pulses)
+
+    def quantise(self, periods: Iterable[float]) -> tuple[int, ...]:
+        """
+        Periods on grid for ramps: rounding error is carried to next period (ramp time stays exact)
+        :param periods: exact periods micro s
+        :return: periods on grid micro s
+        """
+        quantised: list[int] = []
+        carry: float = 0
+        for period in periods:
+            snapped: int = self.snap(period + carry)
+            carry += period - snapped
+            quantised.append(snapped)
+        return tuple(quantised)
+
+    def nearest_pwm(self, freq: float) -> tuple[int, int]:
+        """
+        Nearest software PWM frequency (as pigpiod set_PWM_frequency picks it)
+        :param freq: PUL Hz
+        :return: (frequency Hz, divider)
+        """
+        index: int = bisect_left(self.pwm_freqs, freq)
+        if index == len(self.pwm_freqs) or (index and freq - self.pwm_freqs[index - 1] <= self.pwm_freqs[index] - freq):
+            index -= 1
+        return self.pwm_freqs[index], PWM_DIVIDERS[len(PWM_DIVIDERS) - 1 - index]
+
+    def pwm_error(self, speed: float) -> float:
+        """
+        :param speed: r/min (sign ignored)
+        :return: relative speed error of nearest software PWM frequency
+        """
+        freq: float = abs(speed) / 60 * self.full_rotate_steps
+        return self.nearest_pwm(freq)[0] / freq - 1
+
+
+@lru_cache(maxsize=32)
+def planner_for(microstep: int, sample_rate: int,
+                max_speed_rpm: float = FrequencyPlanner.MAX_SPEED_RPM) -> FrequencyPlanner:
+    """
+    :return: planner shared by drivers of same microstep and sample rate
+    """
+    return FrequencyPlanner(microstep=microstep, sample_rate=sample_rate, max_speed_rpm=max_speed_rpm)
+
+
+def best_sample_rate(microstep: int, speeds: Iterable[float], tolerance: float = 0.01, pwm: bool = False) -> int:
+    """
+    Slowest sample rate (least pigpiod CPU) whose nearest settings of speeds are within tolerance
+    :param microstep: driver setted P001 parameter
+    :param speeds: commanded r/min
+    :param tolerance: max relative speed error
+    :param pwm: software PWM speeds (jog) instead of wave periods
+    :return: sample rate micro s (smallest worst error when none is within tolerance)
+    """
+    speeds = [speed for speed in speeds if speed]
+    errors: dict[int, float] = {}
+    for sample_rate in SAMPLE_RATES:
+        planner: FrequencyPlanner = planner_for(microstep=microstep, sample_rate=sample_rate)
+        errors[sample_rate] = max((abs(planner.pwm_error(speed) if pwm else planner.nearest(speed).error)
+                                   for speed in speeds), default=0)
+    within: list[int] = [sample_rate for sample_rate, error in errors.items() if error <= tolerance]
+    return max(within) if within else min(errors, key=errors.get)
@@ -0,0 +1,298 @@
+"""
+Pulse timing instrumentation of DL57D driver
+PUL / DIR / ENA edges are sampled by pigpio callbacks (daemon ticks) and every move is recorded
+into fixed-size histograms: achieved vs commanded frequency, period jitter, command to first pulse latency,
+DIR setup margin and pulse count error
+    instruments = Instrumentation(driver)  # Registers callbacks, driver hooks are on
+    driver.rotate_speed(300, 2)
+    print(instruments.to_prometheus())
+    instruments.disable()  # Driver hooks are single None check again
+"""
+import json
+from bisect import bisect_left
+from collections import Counter, deque
+
+from DL57D import DL57D
+from pi_backend import pigpio
+
+TICK_WRAP: int = 1 << 32
+HALF_WRAP: int = 1 << 31
+
+
+def tick_after(tick: int, since: int) -> int:
+    """
+    :return: signed micro s from since to tick (32 bit wrap)
+    """
+    diff: int = (tick - since) % TICK_WRAP
+    return diff - TICK_WRAP if diff >= HALF_WRAP else diff
+
+
+class Histogram:
+    """
+    Fixed buckets histogram (bucket i counts values <= bounds[i], last bucket is +Inf)
+    """
+
+    def __init__(self, name: str, bounds: tuple[float, ...], unit: str = ''):
+        """
+        :param name: metric name
+        :param bounds: ascending upper bounds of buckets
+        :param unit: unit of values (help text)
+        """
+        self.name: str = name
+        self.bounds: tuple[float, ...] = bounds
+        self.unit: str = unit
+        self.counts: list[int] = [0] * (len(bounds) + 1)
+        self.count: int = 0
+        self.sum: float = 0
+        self.min: float = float('inf')
+        self.max: float = float('-inf')
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q: float) -> float | None:
+        """
+        :param q: 0..1
+        :return: upper bound of bucket of q quantile (max value for +Inf bucket, None when empty)
+        """
+        if not self.count:
+            return
+        target: float = q * self.count
+        seen: int = 0
+        for index, amount in enumerate(self.counts):
+            seen += amount
+            if seen >= target and amount:
+                return min(self.bounds[index], self.max) if index < len(self.bounds) else self.max
+
+    def snapshot(self) -> dict:
+        return {'unit': self.unit,
+                'bounds': list(self.bounds),
+                'counts': list(self.counts),
+                'count': self.count,
+                'sum': self.sum,
+                'min': self.min if self.count else None,
+                'max': self.max if self.count else None,
+                'p50': self.percentile(0.5),
+                'p90': self.percentile(0.9),
+                'p99': self.percentile(0.99)}
+
+    def prometheus(self, prefix: str) -> list[str]:
+        """
+        :return: lines of Prometheus text format
+        """
+        name: str = f'{prefix}_{self.name}'
+        lines: list[str] = [f'# HELP {name} {self.name.replace("_", " ")} ({self.unit})', f'# TYPE {name} histogram']
+        cumulative: int = 0
+        for bound, amount in zip((*self.bounds, '+Inf'), self.counts):
+            cumulative += amount
+            lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+        lines += [f'{name}_sum {self.sum}', f'{name}_count {self.count}']
+        return lines
+
+
+class MoveRecord:
+    """
+    Edges of one move
+    """
+
+    def __init__(self, command_tick: int, pulses: int, freq: float, cruise_span: int = 0):
+        """
+        :param command_tick: daemon tick when move was commanded
+        :param pulses: commanded PUL impulses
+        :param freq: commanded cruise PUL frequency
+        :param cruise_span: micro s over shortest period still counted as cruise (dithered cruise mixes
+            two periods one sample rate apart)
+        """
+        self.command_tick: int = command_tick
+        self.pulses: int = pulses
+        self.freq: float = freq
+        self.cruise_span: int = cruise_span
+        self.rises: int = 0
+        self.first_rise: int | None = None
+        self.last_rise: int | None = None
+        self.min_period: int = 0  # Shortest PUL period
+        self.periods: Counter[int] = Counter()  # PUL period -> amount (few distinct periods on sample grid)
+        self.setup_tick: int | None = None  # Last DIR / ENA edge of move
+
+    def cruise_freq(self) -> float:
+        """
+        :return: PUL frequency of mean cruise period (periods within cruise span of shortest one, ramps excluded)
+        """
+        cruise: list[tuple[int, int]] = [(period, amount) for period, amount in self.periods.items()
+                                         if period <= self.min_period + self.cruise_span]
+        total: int = sum(period * amount for period, amount in cruise)
+        return 1e6 * sum(amount for _, amount in cruise) / total if total else 0
+
+    def metrics(self) -> dict:
+        mean: float = 0
+        if self.rises > 1:
+            mean = 1e6 * (self.rises - 1) / max(tick_after(self.last_rise, self.first_rise), 1)
+        return {'pulses': self.pulses, 'counted': self.rises, 'commanded_freq': self.freq,
+                'achieved_freq': self.cruise_freq(), 'peak_freq': 1e6 / self.min_period if self.min_period else 0,
+                'mean_freq': mean}
+
+
+class Instrumentation:
+    """
+    Per move metrics of driver (enabled on creation)
+    """
+    HISTORY: int = 64  # Last moves kept with their metrics
+
+    def __init__(self, driver: DL57D):
+        """
+        :param driver: DL57D driver
+        """
+        self.driver: DL57D = driver
+        self.pi: pigpio.pi = driver.pi
+        self.freq_error: Histogram = Histogram(
+            'freq_error', (-50, -20, -10, -5, -2, -1, -0.5, -0.1, 0.1, 0.5, 1, 2, 5, 10, 20, 50),
+            unit='achieved vs commanded %')
+        self.jitter: Histogram = Histogram('period_jitter', (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+                                           unit='micro s change of period')
+        self.latency: Histogram = Histogram(
+            'first_pulse_latency', (50, 100, 200, 500, 1e3, 2e3, 5e3, 1e4, 2e4, 5e4, 1e5, 2e5, 5e5, 1e6),
+            unit='micro s from command to first pulse')
+        self.dir_margin: Histogram = Histogram('dir_setup_margin', (-100, -50, -20, -10, 0, 10, 20, 50, 100, 200,
+                                                                    500, 1000, 1e4), unit='micro s over 100 us')
+        self.pulse_error: Histogram = Histogram('pulse_count_error', (-100, -10, -2, -1, 0, 1, 2, 10, 100),
+                                                unit='counted - commanded pulses')
+        self.histograms: tuple[Histogram, ...] = (self.freq_error, self.jitter, self.latency, self.dir_margin,
+                                                  self.pulse_error)
+        self.moves: int = 0
+        self.history: deque[dict] = deque(maxlen=self.HISTORY)
+        self.current: MoveRecord | None = None
+        self.previous: MoveRecord | None = None  # Closed for new moves, still gets its late edges
+        self.previous_period: int = 0
+        self.dir_settle: int = round(driver.SLEEP_AFTER_DIR * 1e6)
+        self.callbacks: list = []
+        self.enable()
+
+    def enable(self) -> None:
+        """
+        Register edge callbacks and driver hooks
+        """
+        if self.callbacks:
+            return
+        self.callbacks.append(self.pi.callback(self.driver.pul_gpio, pigpio.RISING_EDGE, self.pul_edge))
+        for gpio in (self.driver.dir_gpio, self.driver.ena_gpio):
+            if gpio is not None:
+                self.callbacks.append(self.pi.callback(gpio, pigpio.EITHER_EDGE, self.setup_edge))
+        self.driver.instruments = self
+
+    def disable(self) -> None:
+        """
+        Cancel callbacks and driver hooks (recorded moves are finished)
+        """
+        self.flush()
+        for callback in self.callbacks:
+            callback.cancel()
+        self.callbacks.clear()
+        self.driver.instruments = None
+
+    def start(self, pulses: int, freq: float) -> None:
+        """
+        Driver hook: move is commanded (one get_current_tick command)
+        :param pulses: commanded PUL impulses
+        :param freq: commanded cruise PUL frequency
+        """
+        self.finish(self.previous)
+        self.previous = self.current
+        self.current = MoveRecord(command_tick=self.pi.get_current_tick(), pulses=pulses, freq=freq,
+                                  cruise_span=self.driver.pigpiod_sample_rate)
+
+    def record_of(self, tick: int) -> MoveRecord | None:
+        """
+        :return: move of edge (previous move until it got all its pulses or edge is before current command)
+        """
+        previous: MoveRecord | None = self.previous
+        current: MoveRecord | None = self.current
+        if previous is not None and (previous.rises < previous.pulses or current is None
+                                     or tick_after(tick, current.command_tick) < 0):
+            return previous
+        return current
+
+    def pul_edge(self, gpio: int, level: int, tick: int) -> None:
+        """
+        pigpio thread callback of PUL rising edge
+        """
+        move: MoveRecord | None = self.record_of(tick)
+        if move is None:
+            return
+        if move.last_rise is not None:
+            period: int = tick_after(tick, move.last_rise)
+            if self.previous_period:
+                self.jitter.observe(abs(period - self.previous_period))
+            self.previous_period = period
+            move.periods[period] += 1
+            if not move.min_period or period < move.min_period:
+                move.min_period = period
+        else:
+            move.first_rise = tick
+            self.previous_period = 0
+        move.last_rise = tick
+        move.rises += 1
+
+    def setup_edge(self, gpio: int, level: int, tick: int) -> None:
+        """
+        pigpio thread callback of DIR / ENA edge
+        """
+        move: MoveRecord | None = self.current
+        if move is not None and move.first_rise is None and tick_after(tick, move.command_tick) >= 0:
+            move.setup_tick = tick
+
+    def finish(self, move: MoveRecord | None) -> None:
+        """
+        Record metrics of ended move into histograms
+        """
+        if move is None:
+            return
+        metrics: dict = move.metrics()
+        self.moves += 1
+        self.pulse_error.observe(move.rises - move.pulses)
+        if move.first_rise is not None:
+            metrics['latency_us'] = tick_after(move.first_rise, move.command_tick)
+            self.latency.observe(metrics['latency_us'])
+            if move.setup_tick is not None:
+                metrics['dir_margin_us'] = tick_after(move.first_rise, move.setup_tick) - self.dir_settle
+                self.dir_margin.observe(metrics['dir_margin_us'])
+        if metrics['achieved_freq'] and move.freq:
+            metrics['freq_error'] = (metrics['achieved_freq'] / move.freq - 1) * 100
+            self.freq_error.observe(metrics['freq_error'])
+        self.history.append(metrics)
+
+    def flush(self) -> None:
+        """
+        Finish recorded moves (call after end of transmission)
+        """
+        self.finish(self.previous)
+        self.finish(self.current)
+        self.previous = self.current = None
+
+    def snapshot(self) -> dict:
+        """
+        :return: histograms and last moves (finished moves only)
+        """
+        self.finish(self.previous)
+        self.previous = None
+        return {'moves': self.moves,
+                'histograms': {histogram.name: histogram.snapshot() for histogram in self.histograms},
+                'last_moves': list(self.history)}
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self, prefix: str = 'dl57d') -> str:
+        """
+        :return: Prometheus text exposition format
+        """
+        self.snapshot()
+        lines: list[str] = [f'# TYPE {prefix}_moves_total counter', f'{prefix}_moves_total {self.moves}']
+        for histogram in self.histograms:
+            lines += histogram.prometheus(prefix=prefix)
+        return '\n'.join(lines) + '\n'
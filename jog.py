@@ -0,0 +1,261 @@
+"""
+Continuous speed (jog) mode of DL57D driver: PUL is generated by PWM, python only changes frequency
+    jog = SpeedJog(driver, accel=5000)
+    jog.set_speed(300)   # Ramp up to 300 r/min, returns while motor keeps rotating
+    jog.set_speed(-100)  # Ramp down, DIR change at standstill, ramp up CCW
+    jog.set_speed(500, wait=False)  # Retarget at once, ramp thread follows new target
+    jog.stop()           # Ramp down, driver.position is exact
+Ramp runs on its own thread, so new target (or abort) interrupts ramp within RAMP_INTERVAL
+PUL gpio with hardware PWM channel (12, 13, 18, 19) uses hardware_PWM (any frequency),
+other gpios use set_PWM_frequency with nearest frequency of PWM table of daemon sample rate (driver planner)
+Emitted pulses are counted by pigpio tally callback on PUL rising edges
+Stop of safety monitor aborts jog, speed can be set again after SafetyMonitor.reset()
+"""
+import logging
+import threading
+
+from DL57D import DL57D
+from motion_profile import speed_to_freq
+from pi_backend import pigpio
+
+logger: logging.Logger = logging.getLogger('dl57d.jog')
+
+
+class SpeedJog:
+    """
+    PWM velocity mode with live speed changes
+    """
+    HARDWARE_PWM_GPIOS: tuple[int, ...] = (12, 13, 18, 19)  # GPIOs of PWM0 / PWM1 channels
+    HARDWARE_DUTY: int = 500000  # 50 % of hardware_PWM duty range 1e6
+    SOFTWARE_DUTY: int = 128  # 50 % of set_PWM_dutycycle range 255
+    RAMP_INTERVAL: float = 0.01  # 10 ms between frequency updates of ramp
+    NOTIFY_LATENCY: float = 0.01  # pigpiod reports edges to callbacks with delay
+
+    def __init__(self, driver: DL57D, accel: float | None = None):
+        """
+        :param driver: DL57D driver
+        :param accel: acceleration of speed changes r/min per second (None -> driver default, both None -> at once)
+        """
+        self.driver: DL57D = driver
+        self.pi: pigpio.pi = driver.pi
+        self.gpio: int = driver.pul_gpio
+        self.hardware: bool = self.gpio in self.HARDWARE_PWM_GPIOS
+        accel = driver.accel if accel is None else accel
+        self.accel: float | None = None if accel is None else speed_to_freq(speed=accel,
+                                                                             full_rotate_steps=driver.full_rotate_steps)
+        self.freq: float = 0  # Current PUL frequency of ramp
+        self.target: float = 0  # Signed PUL frequency of set speed ( - sign mean CCW)
+        self.pwm_freq: float = 0  # Set PWM frequency (nearest of pwm_freqs for software PWM)
+        self.sign: int = 0  # 1 CW, -1 CCW, 0 standstill
+        self.counter = self.pi.callback(self.gpio, pigpio.RISING_EDGE)  # Tally of emitted pulses
+        self.changed: threading.Condition = threading.Condition(threading.RLock())  # Target / ramp state changes
+        self.ramper: threading.Thread | None = None  # Ramp thread (started by first set_speed)
+        self.failure: Exception | None = None  # Error of ramp thread
+        self.closed: bool = False
+        driver.jog = self
+        logger.debug('Jog on gpio %s by %s PWM', self.gpio, 'hardware' if self.hardware else 'software')
+
+    @property
+    def position(self) -> int:
+        """
+        :return: microsteps since zero including pulses of running jog
+        """
+        return self.driver.position + self.sign * self.counter.tally()
+
+    def speed_freq(self, speed: float) -> float:
+        """
+        :param speed: r/min (sign ignored)
+        :return: PUL frequency (limited by max speed of driver)
+        """
+        if abs(speed) > self.driver.max_speed:
+            logger.warning('Speed %s r/min more than max speed %s for microstep %s',
+                           speed, self.driver.max_speed, self.driver.microstep)
+        freq: float = speed_to_freq(speed=min(abs(speed), self.driver.max_speed),
+                                    full_rotate_steps=self.driver.full_rotate_steps)
+        if not self.hardware and freq > self.driver.planner.pwm_freqs[-1]:
+            logger.warning('Speed %s r/min is clamped to %s Hz, highest software PWM frequency of sample rate %s',
+                           speed, self.driver.planner.pwm_freqs[-1], self.driver.planner.sample_rate)
+        return freq
+
+    def write_freq(self, freq: float) -> None:
+        """
+        Set PWM frequency of PUL (0 -> PWM off), command is skipped when set frequency does not change
+        :param freq: PUL frequency
+        :return: None
+        """
+        if self.hardware:
+            set_freq: float = round(freq)
+            if set_freq != self.pwm_freq:
+                self.pi.hardware_PWM(self.gpio, set_freq, self.HARDWARE_DUTY if set_freq else 0)
+        elif not freq:
+            set_freq = 0
+            if self.pwm_freq:
+                self.pi.set_PWM_dutycycle(self.gpio, 0)
+        else:
+            set_freq = self.driver.planner.nearest_pwm(freq)[0]  # Bisect of sample rate table
+            if set_freq != self.pwm_freq:
+                set_freq = self.pi.set_PWM_frequency(self.gpio, int(set_freq))
+                if not self.pwm_freq:
+                    self.pi.set_PWM_dutycycle(self.gpio, self.SOFTWARE_DUTY)
+        self.pwm_freq = set_freq
+
+    def count_pulses(self) -> int:
+        """
+        Add pulses of stopped jog to commanded position of driver
+        :return: amount of pulses
+        """
+        self.driver.sleep(self.NOTIFY_LATENCY)
+        pulses: int = self.counter.tally()
+        self.counter.reset_tally()
+        self.driver.position += self.sign * pulses
+        return pulses
+
+    @property
+    def settled(self) -> bool:
+        """
+        :return: True when ramp reached target (standstill PWM off for 0 target)
+        """
+        return self.sign == (self.target > 0) - (self.target < 0) and self.freq == abs(self.target)
+
+    @property
+    def active(self) -> bool:
+        """
+        :return: True while PWM runs on PUL gpio or target speed is set
+        """
+        return bool(self.sign or self.target)
+
+    @property
+    def tripped(self) -> bool:
+        """
+        :return: True when safety monitor stopped PUL (until its reset)
+        """
+        return self.driver.safety is not None and self.driver.safety.tripped is not None
+
+    def step(self) -> None:
+        """
+        One RAMP_INTERVAL step of frequency toward target (at once without accel),
+        DIR change is done at standstill
+        :return: None
+        """
+        if self.tripped:
+            self.trip()
+            return
+        sign: int = (self.target > 0) - (self.target < 0)
+        if sign and not self.sign:
+            if self.driver.pulse_engine is not None:
+                self.driver.pulse_engine.wait()  # Waveform move of same PUL gpio
+            self.counter.reset_tally()
+            self.driver.write_direction(dir_lvl=pigpio.HIGH if sign > 0 else pigpio.LOW)
+            self.sign = sign
+        goal: float = abs(self.target) if sign == self.sign else 0  # Stop before DIR change
+        step: float = float('inf') if self.accel is None else self.accel * self.RAMP_INTERVAL
+        self.freq = min(self.freq + step, goal) if goal > self.freq else max(self.freq - step, goal)
+        self.write_freq(self.freq)
+        if self.tripped:  # Stop input while frequency was written
+            self.trip()
+        elif not self.freq:
+            self.halt()
+
+    def run(self) -> None:
+        """
+        Ramp thread: steps toward target, sleeps without lock so target changes take effect at next step
+        :return: None
+        """
+        while True:
+            with self.changed:
+                while not self.closed and self.settled:
+                    self.changed.notify_all()
+                    self.changed.wait()
+                if self.closed:
+                    return
+                try:
+                    self.step()
+                except Exception as exc:
+                    logger.exception('Jog ramp on gpio %s failed', self.gpio)
+                    self.failure = exc
+                    self.closed = True
+                    self.changed.notify_all()
+                    return
+                ramping: bool = self.accel is not None and not self.settled
+            if ramping:
+                self.driver.sleep(self.RAMP_INTERVAL)
+
+    def set_speed(self, speed: float, wait: bool = True) -> None:
+        """
+        Retarget speed while rotating (DIR change and stop are done at standstill)
+        :param speed: r/min ( - sign mean CCW DIR, 0 -> stop)
+        :param wait: block until ramp reaches speed (False -> return at once, ramp thread follows target)
+        :return: None
+        """
+        with self.changed:
+            if self.failure is not None:
+                raise RuntimeError(f'Jog ramp on gpio {self.gpio} failed') from self.failure
+            if self.closed:
+                raise RuntimeError(f'Jog on gpio {self.gpio} is closed')
+            if self.driver.safety is not None:
+                self.driver.safety.check()
+            self.target = ((speed > 0) - (speed < 0)) * self.speed_freq(speed)
+            if self.ramper is None:
+                self.ramper = threading.Thread(target=self.run, name=f'jog-{self.gpio}', daemon=True)
+                self.ramper.start()
+            self.changed.notify_all()
+            if wait:
+                self.changed.wait_for(lambda: self.settled or self.closed)
+
+    def halt(self) -> None:
+        """
+        PWM is off: count pulses and return PUL gpio to output mode
+        :return: None
+        """
+        self.count_pulses()
+        self.sign = 0
+        self.pi.set_mode(self.gpio, pigpio.OUTPUT)  # PWM mode off
+        self.driver.write_lvl(gpio_name='PULL', lvl=pigpio.LOW)
+
+    def stop(self) -> None:
+        """
+        Ramp down to standstill, position of driver is updated by emitted pulses
+        :return: None
+        """
+        self.set_speed(0)
+
+    def abort(self) -> None:
+        """
+        Stop PWM at once (no ramp), position of driver is updated by emitted pulses
+        :return: None
+        """
+        with self.changed:
+            self.target = 0
+            if self.sign:
+                self.freq = 0
+                self.write_freq(0)
+                self.halt()
+            self.changed.notify_all()
+
+    def trip(self) -> None:
+        """
+        Stop of safety monitor (its callback thread, not locked: ramp thread holds lock while commanding pigpiod)
+        PWM off at once, tally is not added (SafetyMonitor.reset() resyncs position by its own PUL count)
+        :return: None
+        """
+        self.target = 0
+        self.freq = 0
+        self.sign = 0
+        self.pwm_freq = 0
+        self.pi.write(self.gpio, pigpio.LOW)  # PWM off, again after frequency written meanwhile by ramp thread
+
+    def close(self) -> None:
+        """
+        Stop, end ramp thread and cancel pulse counter
+        :return: None
+        """
+        if not self.closed and not self.tripped:  # Tripped jog is stopped
+            self.stop()
+        with self.changed:
+            self.closed = True
+            self.changed.notify_all()
+        if self.ramper is not None:
+            self.ramper.join()
+        self.counter.cancel()
+        if self.driver.jog is self:
+            self.driver.jog = None
@@ -0,0 +1,259 @@
+"""
+Acceleration profiled moves for DL57D driver
+Planner turns (pulses, peak speed, accel, jerk) into per-pulse periods (micro s)
+Trapezoidal profile: constant accel ramp (jerk is None)
+S-curve profile: jerk limited accel ramp (accel rises to max, holds and falls to 0 at peak speed)
+Decel ramp is reversed accel ramp, short moves use prefix of ramp (peak speed is not reached)
+Compiled ramps (waves and chains) are kept in LRU cache, so repeated index moves cost nothing to plan
+"""
+from collections import OrderedDict
+from functools import lru_cache
+from math import sqrt
+
+from pulse_engine import PulseEngine
+
+TRAPEZOIDAL: str = 'trapezoidal'
+S_CURVE: str = 's-curve'
+
+
+def speed_to_freq(speed: float, full_rotate_steps: int) -> float:
+    """
+    :param speed: r/min (or r/min per second for accel, r/min per second^2 for jerk)
+    :param full_rotate_steps: pulses per full rotation
+    :return: pulses per second (or pulses/s^2, pulses/s^3)
+    """
+    return speed / 60 * full_rotate_steps
+
+
+def _ramp_phases(peak_freq: float, accel: float, jerk: float | None) -> list[tuple[float, float, float]]:
+    """
+    Phases of accel ramp from 0 to peak_freq
+    :param peak_freq: pulses per second at end of ramp
+    :param accel: pulses / s^2
+    :param jerk: pulses / s^3 (None -> trapezoidal)
+    :return: list of (duration, accel at start, jerk)
+    """
+    if jerk is None:
+        return [(peak_freq / accel, accel, 0)]
+    if accel * accel / jerk > peak_freq:  # Max accel never reached
+        accel = sqrt(peak_freq * jerk)
+    jerk_time: float = accel / jerk
+    hold_time: float = peak_freq / accel - jerk_time
+    return [(jerk_time, 0, jerk), (hold_time, accel, 0), (jerk_time, accel, -jerk)]
+
+
+def _pulse_times(phases: list[tuple[float, float, float]]) -> list[float]:
+    """
+    Times (seconds) when position crosses every whole pulse during ramp
+    Position is cubic in each phase, solved by Newton iterations with bisection bounds
+    :param phases: list of (duration, accel at start, jerk)
+    :return: list of pulse times
+    """
+    times: list[float] = []
+    t = s = v = 0.0
+    for duration, a, j in phases:
+        s_end: float = s + v * duration + a * duration ** 2 / 2 + j * duration ** 3 / 6
+        k: int = len(times) + 1
+        tau: float = 0
+        while k <= s_end:
+            low, high = tau, duration
+            vel: float = v + a * tau + j * tau ** 2 / 2
+            tau = tau + 1 / vel if vel > 0 else (low + high) / 2  # Guess by previous pulse speed
+            if tau >= high:
+                tau = (low + high) / 2
+            for _ in range(50):
+                pos: float = s + v * tau + a * tau ** 2 / 2 + j * tau ** 3 / 6 - k
+                if abs(pos) < 1e-9:
+                    break
+                if pos > 0:
+                    high = tau
+                else:
+                    low = tau
+                vel: float = v + a * tau + j * tau ** 2 / 2
+                step: float = tau - pos / vel if vel > 0 else (low + high) / 2
+                tau = step if low < step < high else (low + high) / 2
+            times.append(t + tau)
+            k += 1
+        t += duration
+        s = s_end
+        v += a * duration + j * duration ** 2 / 2
+    return times
+
+
+@lru_cache(maxsize=64)
+def plan_ramp(peak_freq: float, accel: float, jerk: float | None = None) -> tuple[int, ...]:
+    """
+    Per-pulse periods of full accel ramp from standstill to peak_freq
+    Whole micro s rounding error is carried to next pulse (timing stays exact)
+    :param peak_freq: pulses per second at end of ramp
+    :param accel: pulses / s^2
+    :param jerk: pulses / s^3 (None -> trapezoidal)
+    :return: tuple of periods in micro s
+    """
+    periods: list[int] = []
+    previous: int = 0
+    for time in _pulse_times(_ramp_phases(peak_freq=peak_freq, accel=accel, jerk=jerk)):
+        current: int = round(time * 1e6)
+        periods.append(max(current - previous, 2 * PulseEngine.MIN_LVL_MICROS))
+        previous = current
+    cruise: int = max(round(1e6 / peak_freq), 2 * PulseEngine.MIN_LVL_MICROS)
+    while periods and periods[-1] < cruise:  # Ramp never faster than cruise
+        periods.pop()
+    return tuple(periods)
+
+
+class MotionProfile:
+    """
+    Timing schedule of one move: accel ramp, cruise loop and decel ramp
+    """
+
+    def __init__(self, pulses: int, peak_freq: float, accel: float, jerk: float | None = None):
+        """
+        :param pulses: amount of PUL impulses of move
+        :param peak_freq: pulses per second of cruise
+        :param accel: pulses / s^2
+        :param jerk: pulses / s^3 (None -> trapezoidal)
+        """
+        self.kind: str = TRAPEZOIDAL if jerk is None else S_CURVE
+        self.pulses: int = pulses
+        ramp: tuple[int, ...] = plan_ramp(peak_freq=peak_freq, accel=accel, jerk=jerk)
+        self.ramp_pulses: int = min(len(ramp), pulses // 2)  # Short move -> peak speed not reached
+        self.accel_periods: tuple[int, ...] = ramp[:self.ramp_pulses]
+        self.decel_periods: tuple[int, ...] = self.accel_periods[::-1]
+        if self.ramp_pulses < len(ramp) and self.ramp_pulses:
+            self.cruise_period: int = ramp[self.ramp_pulses - 1]  # Top of truncated ramp
+        elif ramp and not self.ramp_pulses:
+            self.cruise_period = ramp[0]  # Single pulse move
+        else:
+            self.cruise_period = max(round(1e6 / peak_freq), 2 * PulseEngine.MIN_LVL_MICROS)
+        self.peak_period: float = self.cruise_period  # Exact cruise period (dithered by frequency planner)
+        if self.ramp_pulses == len(ramp):
+            self.peak_period = max(1e6 / peak_freq, 2 * PulseEngine.MIN_LVL_MICROS)
+        self.cruise_pulses: int = pulses - 2 * self.ramp_pulses
+
+    @property
+    def duration(self) -> float:
+        """
+        :return: move time in seconds
+        """
+        return (2 * sum(self.accel_periods) + self.cruise_pulses * self.cruise_period) * 1e-6
+
+
+class ProfileCompiler:
+    """
+    Compiles MotionProfile into waves: accel ramp, cruise loop and decel ramp
+    Start of ramp (low, fast changing speeds) is sent pulse by pulse as one wave,
+    rest of ramp is staircase of constant period loops (DMA memory and 600 bytes of wave_chain are limited)
+    Ramps are kept in LRU cache keyed by profile parameters, microstep and sector_steps,
+    their waves are pinned in WaveCache of engine while ramp is kept
+    """
+    MAX_EXPLICIT_PERIODS: int = 500  # Exact periods at start of ramp (2 gpioPulse each)
+    RAMP_SEGMENTS: int = 30  # Constant period loops of the rest of ramp (7 chain bytes each)
+
+    def __init__(self, engine: PulseEngine, microstep: int, sector_steps: int, max_ramps: int = 4):
+        """
+        :param engine: pulse engine of driver
+        :param microstep: driver setted P001 parameter
+        :param sector_steps: microsteps per sector
+        :param max_ramps: amount of compiled ramps kept in cache
+        """
+        self.engine: PulseEngine = engine
+        self.microstep: int = microstep
+        self.sector_steps: int = sector_steps
+        self.max_ramps: int = max_ramps
+        self.ramps: OrderedDict[tuple, tuple[list[int], list[int], set[int]]] = OrderedDict()
+        self.generation: int = engine.cache.generation  # Wave cache generation of compiled ramps
+        # key -> accel chain, decel chain, pinned wave ids
+
+    def explicit_wave(self, periods: tuple[int, ...]) -> int:
+        """
+        Create wave of periods pulse by pulse
+        :param periods: periods in micro s
+        :return: wave id
+        """
+        return self.engine.pattern_wave(periods)
+
+    def staircase(self, periods: tuple[int, ...]) -> list[tuple[int, int]]:
+        """
+        Split periods into RAMP_SEGMENTS of equal time with constant (average) period
+        Rounding error of segment is carried to next one
+        :param periods: periods in micro s
+        :return: list of (period, amount of pulses)
+        """
+        steps: list[tuple[int, int]] = []
+        segment_time: float = sum(periods) / self.RAMP_SEGMENTS
+        pulses: int = 0
+        time: int = 0
+        carry: float = 0
+        for period in periods:
+            pulses += 1
+            time += period
+            if time >= segment_time or pulses + len(steps) == len(periods):
+                average: int = self.engine.snap((time + carry) / pulses)
+                carry += time - average * pulses
+                steps.append((average, pulses))
+                pulses = time = 0
+        if pulses:
+            steps.append((self.engine.snap((time + carry) / pulses), pulses))
+        return steps
+
+    def loop_chain(self, steps: list[tuple[int, int]]) -> list[int]:
+        """
+        :param steps: list of (period, amount of pulses)
+        :return: wave_chain data of period loops
+        """
+        chain: list[int] = []
+        for period, pulses in steps:
+            high, low = self.engine.split(period)
+            chain += self.engine.repeat_chain(self.engine.period_wave(high=high, low=low), pulses)
+        return chain
+
+    def compiled_ramps(self, profile: MotionProfile, key: tuple) -> tuple[list[int], list[int]]:
+        """
+        Accel and decel chains of profile from cache (compiled on miss)
+        :param profile: motion profile
+        :param key: profile parameters
+        :return: accel wave_chain data, decel wave_chain data
+        """
+        key = (*key, profile.ramp_pulses, self.microstep, self.sector_steps)
+        if self.generation != self.engine.cache.generation:  # Waves cleared by resync
+            self.ramps.clear()
+            self.generation = self.engine.cache.generation
+        if key in self.ramps:
+            self.ramps.move_to_end(key)
+            return self.ramps[key][:2]
+        while len(self.ramps) >= self.max_ramps:
+            _, (_, _, pinned) = self.ramps.popitem(last=False)  # Least recently used
+            self.engine.cache.unpin(pinned)
+        periods: tuple[int, ...] = profile.accel_periods
+        if self.engine.planner is not None:  # Ramp on sample rate grid, rounding carried along ramp
+            periods = self.engine.planner.quantise(periods)
+        explicit: tuple[int, ...] = periods[:self.MAX_EXPLICIT_PERIODS]
+        steps: list[tuple[int, int]] = self.staircase(periods[self.MAX_EXPLICIT_PERIODS:])
+        waves: list[int] = [self.explicit_wave(explicit), self.explicit_wave(explicit[::-1])] if explicit else []
+        accel: list[int] = [*waves[:1], *self.loop_chain(steps)]
+        decel: list[int] = [*self.loop_chain(steps[::-1]), *waves[1:]]
+        pinned: set[int] = self.engine.cache.chain_waves([*accel, *decel])
+        self.engine.cache.pin(pinned)
+        self.ramps[key] = (accel, decel, pinned)
+        return accel, decel
+
+    def compile(self, profile: MotionProfile, key: tuple) -> list[int]:
+        """
+        :param profile: motion profile
+        :param key: profile parameters (kind, speed, accel, jerk)
+        :return: wave_chain data of whole move
+        """
+        with self.engine.cache.compiling():
+            accel, decel = self.compiled_ramps(profile=profile, key=key)
+            cruise, _ = self.engine.cruise_chain(period=profile.peak_period, pulses=profile.cruise_pulses)
+        return [*accel, *cruise, *decel]
+
+    def clear(self) -> None:
+        """
+        Forget all compiled ramps (their waves could be evicted from WaveCache)
+        :return: None
+        """
+        for _, _, pinned in self.ramps.values():
+            self.engine.cache.unpin(pinned)
+        self.ramps.clear()
@@ -0,0 +1,362 @@
+"""
+Streaming motion queue of DL57D driver: program of segments runs as one uninterrupted pulse stream
+    motion = MotionQueue(driver, accel=5000)
+    motion.add_sectors(90, speed=500)
+    motion.add_sectors(180, speed=1000, absolute=True)
+    motion.add_dwell(0.5)
+    motion.run()  # Or start() / finish() to keep adding segments while streaming
+Junction speeds are planned with look-ahead over queued segments (grbl like backward / forward passes):
+speed only falls to 0 at DIR change, dwell and end of queue, so segments are blended without stops
+Ramps at junctions are compiled pulse by pulse into chunks of gpioPulse (DIR change and dwell included),
+cruise is looped: block wave of dithered cruise periods is sent again and again (two alternating copies,
+WAVE_MODE_ONE_SHOT_SYNC queues single waves only, not wave_chain loops)
+Waves are double-buffered by PulseEngine.stream, python is busy only per chunk or block
+"""
+import threading
+from collections import deque
+from fractions import Fraction
+from math import ceil, sqrt
+from typing import Iterator
+
+from DL57D import DL57D
+from motion_profile import speed_to_freq
+from pi_backend import pigpio
+from pulse_engine import PulseEngine
+
+
+class Segment:
+    """
+    One queued move (or dwell) with planned entry / exit speed
+    """
+
+    def __init__(self, steps: int, freq: float, dwell: float = 0, remainder: Fraction | None = None):
+        """
+        :param steps: microsteps of move ( - sign mean CCW DIR)
+        :param freq: pulses per second of cruise
+        :param dwell: seconds of standstill (move of 0 steps)
+        :param remainder: fraction of microstep carried after move (None -> carried fraction is kept)
+        """
+        self.steps: int = steps
+        self.freq: float = freq
+        self.dwell: float = dwell
+        self.remainder: Fraction | None = remainder
+
+    def junction(self, previous: 'Segment | None') -> float:
+        """
+        Max speed between previous segment and this one
+        :param previous: segment before (None -> standstill)
+        :return: pulses per second
+        """
+        if previous is None or not previous.steps or not self.steps or (previous.steps > 0) != (self.steps > 0):
+            return 0  # Standstill, dwell or DIR change
+        return min(previous.freq, self.freq)
+
+
+class MotionQueue:
+    """
+    Bounded queue of segments streamed by waveform engine of driver
+    """
+    CHUNK_PULSES: int = 2000  # gpioPulse per chunk wave (1000 PUL periods)
+    CRUISE_PULSES: int = 1000  # gpioPulse of looped cruise block wave
+    WAIT_SEGMENT: float = 0.1  # Seconds between checks of closed queue while waiting segments
+
+    def __init__(self, driver: DL57D, max_depth: int = 32, accel: float | None = None):
+        """
+        :param driver: DL57D driver with waveform engine (use_waves)
+        :param max_depth: max amount of queued segments (add blocks while queue is full)
+        :param accel: acceleration r/min per second (None -> driver default, both None -> no ramps)
+        """
+        if driver.pulse_engine is None:
+            raise ValueError('Motion queue needs waveform engine (use_waves=True)')
+        self.driver: DL57D = driver
+        self.engine: PulseEngine = driver.pulse_engine
+        self.max_depth: int = max_depth
+        accel = driver.accel if accel is None else accel
+        self.accel: float | None = None if accel is None else speed_to_freq(speed=accel,
+                                                                             full_rotate_steps=driver.full_rotate_steps)
+        self.segments: deque[Segment] = deque()
+        self.condition: threading.Condition = threading.Condition()
+        self.planned: int = driver.position  # Commanded microsteps at end of queued segments
+        self.remainder: Fraction = driver.step_remainder  # Carried fraction of microstep after planned
+        self.current: Segment | None = None  # Last compiled segment
+        self.speed: float = 0  # Pulses per second at end of last compiled segment
+        self.underruns: int = 0  # Transmitter was idle before next chunk was queued
+        self.sent: int = 0  # Compiled segments
+        self.closed: bool = True  # No more segments are expected (start() opens queue)
+        self.worker: threading.Thread | None = None
+        self.unit_pulses: dict[tuple[int, int], list] = {}  # (HIGH, LOW) micro s -> gpioPulse of one period
+        self.pinned: list[int] = []  # Cruise block waves of current run
+
+    @property
+    def depth(self) -> int:
+        """
+        :return: amount of queued segments
+        """
+        return len(self.segments)
+
+    def add(self, segment: Segment) -> None:
+        """
+        Queue segment, blocks while queue is full
+        :param segment: segment
+        :return: None
+        """
+        with self.condition:
+            while len(self.segments) >= self.max_depth:
+                if self.worker is None:
+                    raise OverflowError(f'Motion queue is full ({self.max_depth} segments), run() it first')
+                self.condition.wait()
+            self.segments.append(segment)
+            self.planned += segment.steps
+            if segment.remainder is not None:
+                self.remainder = segment.remainder
+            self.condition.notify_all()
+
+    def add_sectors(self, sector: float, speed: float | int | None = None, absolute: bool = False) -> None:
+        """
+        Queue move of sectors, fraction of microstep is carried to next move (like DL57D.move_to)
+        :param sector: degree of rotation ( - sign mean DIR change), position of sectors for absolute
+        :param speed: float speed of rotation r/min
+        :param absolute: sector is position from zero (not distance)
+        :return: None
+        """
+        with self.condition:  # Planned position of concurrent add
+            target: Fraction = self.driver.sector_microsteps(sector)
+            if not absolute:
+                target += self.planned + self.remainder
+            self.add(Segment(steps=round(target) - self.planned,
+                             freq=1 / (2 * self.driver.sector_lvl_duration(speed=speed)),
+                             remainder=target - round(target)))
+
+    def add_dwell(self, seconds: float) -> None:
+        """
+        Queue standstill
+        :param seconds: dwell time
+        :return: None
+        """
+        self.add(Segment(steps=0, freq=0, dwell=seconds))
+
+    def plan(self) -> tuple[float, float]:
+        """
+        Look-ahead over queued segments: backward pass from standstill at end of queue,
+        forward pass from current speed (accel limited in both directions)
+        :return: entry and exit speed of first queued segment (pulses per second)
+        """
+        segments: list[Segment] = list(self.segments)
+        speeds: list[float] = [self.speed, *(segment.junction(previous)
+                                             for previous, segment in zip(segments, segments[1:])), 0]
+        for index in range(len(segments) - 1, 0, -1):  # Backward (decel before next junction)
+            speeds[index] = min(speeds[index], self.reachable(speeds[index + 1], abs(segments[index].steps)))
+        speeds[1] = min(speeds[1], self.reachable(speeds[0], abs(segments[0].steps)))  # Forward (only head is used)
+        return speeds[0], speeds[1]
+
+    def reachable(self, speed: float, steps: int) -> float:
+        """
+        :param speed: pulses per second at one end of segment
+        :param steps: pulses of segment
+        :return: max speed at other end of segment
+        """
+        if self.accel is None:
+            return float('inf')
+        return sqrt(speed * speed + 2 * self.accel * steps)
+
+    def next_segment(self) -> tuple[Segment, float, float] | None:
+        """
+        Take first queued segment with planned speeds (waits segments while queue is opened)
+        :return: segment, entry and exit speed (None when queue is closed and empty)
+        """
+        with self.condition:
+            while not self.segments:
+                if self.closed:
+                    return
+                self.condition.wait(self.WAIT_SEGMENT)
+            junction: float = self.segments[0].junction(self.current)
+            self.speed = min(self.speed, junction)  # Previous segment ended at standstill when this one was unknown
+            entry, exit_speed = self.plan()
+            segment: Segment = self.segments.popleft()
+            self.condition.notify_all()
+        self.current = segment
+        self.speed = exit_speed
+        self.sent += 1
+        return segment, entry, exit_speed
+
+    def unit(self, period: int) -> list:
+        """
+        :param period: PUL period of grid micro s
+        :return: gpioPulse of one PUL period
+        """
+        key: tuple[int, int] = self.engine.split(period)
+        if key not in self.unit_pulses:
+            self.unit_pulses[key] = [pigpio.pulse(self.engine.pul_mask, 0, key[0]),  # LVL HIGH (1)
+                                     pigpio.pulse(0, self.engine.pul_mask, key[1])]  # LVL LOW (0)
+        return self.unit_pulses[key]
+
+    def ramp(self, freqs: Iterator[float]) -> Iterator[tuple[list, int]]:
+        """
+        Ramp pulse by pulse, grid rounding error is carried to next period
+        :param freqs: pulses per second of every pulse
+        :return: iterator of (gpioPulse unit, repeats)
+        """
+        carry: float = 0
+        run_period: int = 0
+        repeats: int = 0
+        for freq in freqs:
+            exact: float = 1e6 / freq + carry
+            period: int = self.engine.snap(exact)
+            carry = exact - period
+            if period != run_period and repeats:
+                yield self.unit(run_period), repeats
+                repeats = 0
+            run_period = period
+            repeats += 1
+        if repeats:
+            yield self.unit(run_period), repeats
+
+    def cruise(self, freq: float, pulses: int) -> Iterator[tuple[list | tuple[int, int], int]]:
+        """
+        Cruise of dithered periods (average period is exact), long cruise is looped block wave
+        :param freq: pulses per second
+        :param pulses: amount of PUL impulses
+        :return: iterator of (gpioPulse unit, repeats) and ((block wave, its copy), sends)
+        """
+        for pattern, repeats in self.driver.planner.dither_period(period=1e6 / freq, pulses=pulses):
+            unit: list = [pulse for period in pattern for pulse in self.unit(period)]
+            block: int = max(self.CRUISE_PULSES // len(unit), 1)  # Pattern repeats in block wave
+            sends: int = repeats // block if repeats >= 2 * block else 0
+            if sends:
+                yield self.block_waves(unit * block), sends
+            if repeats - sends * block:
+                yield unit, repeats - sends * block
+
+    def block_waves(self, pulses: list) -> tuple[int, int]:
+        """
+        Cached cruise block wave and its copy, pinned until end of run
+        Stream waits end of wave by wave_tx_at, so the same wave id is never queued twice in a row
+        :param pulses: gpioPulse of block
+        :return: wave ids
+        """
+        waves: tuple[int, ...] = ()
+        for block in (pulses, pulses + [pigpio.pulse(0, 0, 0)]):  # Empty entry makes other cache content
+            wave_id: int = self.engine.create_wave(block)
+            self.engine.cache.pin([wave_id])  # Not evicted by next chunks
+            self.pinned.append(wave_id)
+            waves += (wave_id,)
+        return waves
+
+    def runs(self, segment: Segment, entry: float,
+             exit_speed: float) -> Iterator[tuple[list | tuple[int, int], int]]:
+        """
+        Compile segment: accel ramp and decel ramp pulse by pulse (period of every pulse follows speed
+        at its middle), cruise between them looped
+        :param segment: segment
+        :param entry: pulses per second at start
+        :param exit_speed: pulses per second at end
+        :return: iterator of (gpioPulse unit, repeats) and ((block wave, its copy), sends)
+        """
+        driver: DL57D = self.driver
+        if segment.dwell:
+            yield [pigpio.pulse(0, 0, round(segment.dwell * 1e6))], 1
+            return
+        dir_lvl: int = pigpio.LOW if segment.steps < 0 else pigpio.HIGH
+        if driver.dir_gpio is not None and driver.pin_state['DIR'] != dir_lvl:  # After DIR needs 100 us Before PUL
+            dir_mask: int = 1 << driver.dir_gpio
+            yield [pigpio.pulse(dir_mask if dir_lvl else 0, 0 if dir_lvl else dir_mask,
+                                round(driver.SLEEP_AFTER_DIR * 1e6))], 1
+            driver.pin_state['DIR'] = dir_lvl
+        driver.position += segment.steps
+        if segment.remainder is not None:
+            driver.step_remainder = segment.remainder
+        pulses: int = abs(segment.steps)
+        accel: float | None = self.accel
+        cruise: float = segment.freq
+        if accel is None:
+            yield from self.cruise(freq=cruise, pulses=pulses)
+            return
+
+        def freq(pulse: int) -> float:
+            middle: float = pulse + 0.5
+            return min(cruise, sqrt(entry * entry + 2 * accel * middle),
+                       sqrt(exit_speed * exit_speed + 2 * accel * (pulses - middle)))
+
+        up: int = max(ceil((cruise * cruise - entry * entry) / (2 * accel) - 0.5), 0)  # Pulses below cruise
+        down: int = max(ceil((cruise * cruise - exit_speed * exit_speed) / (2 * accel) - 0.5), 0)
+        if up + down >= pulses:  # No cruise
+            up, down = pulses, 0
+        yield from self.ramp(freq(pulse) for pulse in range(up))
+        if pulses - up - down:
+            yield from self.cruise(freq=cruise, pulses=pulses - up - down)
+        yield from self.ramp(freq(pulse) for pulse in range(pulses - down, pulses))
+
+    def chunks(self) -> Iterator[list | int]:
+        """
+        Chunks of gpioPulse of queued segments (partial chunk is sent when queue runs empty or before cruise block)
+        :return: iterator of gpioPulse lists and cruise block wave ids
+        """
+        chunk: list = []
+        last: int | None = None  # Last sent cruise block wave (blended cruises of same speed share blocks)
+        while True:
+            if chunk and not self.segments:  # Do not hold compiled pulses while waiting segments
+                yield chunk
+                chunk = []
+            planned: tuple[Segment, float, float] | None = self.next_segment()
+            if planned is None:
+                break
+            for unit, repeats in self.runs(*planned):
+                if isinstance(unit, tuple):  # Looped cruise
+                    if chunk:
+                        yield chunk
+                        chunk = []
+                    first: int = 1 if unit[0] == last else 0
+                    for send in range(first, first + repeats):
+                        last = unit[send % 2]
+                        yield last
+                    continue
+                while repeats:
+                    room: int = max((self.CHUNK_PULSES - len(chunk)) // len(unit), 1)
+                    taken: int = min(room, repeats)
+                    chunk += unit * taken
+                    repeats -= taken
+                    if len(chunk) >= self.CHUNK_PULSES:
+                        yield chunk
+                        chunk = []
+                last = None
+        if chunk:
+            yield chunk
+
+    def run(self) -> int:
+        """
+        Stream queued segments and wait end of transmission
+        :return: amount of underruns of this run
+        """
+        driver: DL57D = self.driver
+        if driver.ena_gpio is not None and driver.pin_state['ENA'] != pigpio.LOW:
+            driver.write_bank(low=('ENA',))  # Command round-trip is longer than 5 us after ENA
+        self.current = None
+        self.speed = 0
+        try:
+            underruns: int = self.engine.stream(self.chunks())
+        finally:
+            self.engine.cache.unpin(self.pinned)
+            self.pinned.clear()
+        self.underruns += underruns
+        return underruns
+
+    def start(self) -> None:
+        """
+        Stream segments in background thread while they are added (add blocks while queue is full)
+        :return: None
+        """
+        self.closed = False
+        self.worker = threading.Thread(target=self.run, name='motion-queue', daemon=True)
+        self.worker.start()
+
+    def finish(self) -> None:
+        """
+        Close queue and wait end of program
+        :return: None
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        if self.worker is not None:
+            self.worker.join()
+            self.worker = None
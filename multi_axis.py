@@ -0,0 +1,224 @@
+"""
+Coordinated motion of several DL57D axes through one pigpio connection
+Pulses of all axes are packed into same gpioPulse entries (combined on / off masks),
+so axes start, interpolate linearly and finish together
+Rising edge of k pulse of axis with n pulses during move of T micro s is at k * T // n micro s
+Periodic pattern (gcd of pulses amounts) is created once and looped by wave_chain,
+not periodic moves are streamed by chunks
+"""
+import heapq
+import logging
+from fractions import Fraction
+from math import ceil, gcd
+from typing import Iterator
+
+from DL57D import DL57D, exact_fraction
+from pi_backend import pigpio
+from pulse_engine import PulseEngine
+
+logger: logging.Logger = logging.getLogger('dl57d.multi_axis')
+
+
+class AxisConfig:
+    """
+    Config of one DL57D axis
+    """
+
+    def __init__(self,
+                 name: str,
+                 pul_gpio: int,
+                 dir_gpio: int,
+                 ena_gpio: int | None = None,
+                 microstep: int = 10,
+                 reductor_ratio: int = 100,
+                 sectors: int = 400):
+        """
+        :param name: name of axis
+        :param pul_gpio: raspberry pi GPIO num of PUL + connection to pin
+        :param dir_gpio: raspberry pi GPIO num of DIR + connection to pin
+        :param ena_gpio: raspberry pi GPIO num of ENA + connection to pin
+        :param microstep:  driver setted P001 parameter
+        :param reductor_ratio:  reductor ratio of connected to NEMA motor
+        :param sectors: sectors in full rotation
+        """
+        self.name: str = name
+        self.pul_gpio: int = pul_gpio
+        self.dir_gpio: int = dir_gpio
+        self.ena_gpio: int | None = ena_gpio
+        self.microstep: int = microstep
+        self.reductor_ratio: int = reductor_ratio
+        self.sectors: int = sectors
+        self.full_rotate_steps: int = self.microstep * DL57D.STEPS_RATIO  # Pulses per full rotation
+        if self.full_rotate_steps % self.sectors != 0:
+            logger.warning('Bad sectors %s for full circle of %s steps of %s', self.sectors, self.full_rotate_steps, name)
+        self.sector_steps: int = int(self.full_rotate_steps / self.sectors)
+        self.sector_ratio: Fraction = Fraction(self.full_rotate_steps, self.sectors)  # Exact microsteps per sector
+
+    def min_period(self, speed: float | int) -> float:
+        """
+        :param speed: r/min (limited by MAX_SPEED_RPM)
+        :return: PUL period in micro s for speed
+        """
+        speed = min(abs(speed), DL57D.MAX_SPEED_RPM)
+        return max(60e6 / (speed * self.full_rotate_steps), 2 * PulseEngine.MIN_LVL_MICROS)
+
+
+class MultiAxis:
+    """
+    Controller of N DL57D axes sharing one pigpio connection and one merged waveform
+    """
+    MAX_WAVE_PULSES: int = 10000  # gpioPulse entries in one wave (pigpiod max 12000)
+    MAX_BLOCK_PULSES: int = 4000  # gpioPulse entries of looped pattern
+
+    def __init__(self, axes: list[AxisConfig], pi: pigpio.pi | None = None):
+        """
+        :param axes: configs of axes
+        :param pi: connected pigpio.pi (None -> open new connection)
+        """
+        logger.debug('Init multi axis')
+        self.axes: dict[str, AxisConfig] = {axis.name: axis for axis in axes}
+        self.pi: pigpio.pi = pigpio.pi() if pi is None else pi
+        if not self.pi.connected:
+            raise ConnectionError('pigpiod is not connected')
+        self.engine: PulseEngine = PulseEngine(pi=self.pi, pul_gpio=axes[0].pul_gpio)
+        self.pul_mask: int = 0
+        self.dir_mask: int = 0
+        self.ena_mask: int = 0
+        for axis in axes:
+            self.pi.set_mode(axis.pul_gpio, pigpio.OUTPUT)
+            self.pi.set_mode(axis.dir_gpio, pigpio.OUTPUT)
+            self.pul_mask |= 1 << axis.pul_gpio
+            self.dir_mask |= 1 << axis.dir_gpio
+            if axis.ena_gpio is not None:
+                self.pi.set_mode(axis.ena_gpio, pigpio.OUTPUT)
+                self.ena_mask |= 1 << axis.ena_gpio
+        self.pi.clear_bank_1(self.pul_mask | self.ena_mask)  # PUL LOW, turn ON drivers (ENA LOW)
+        self.enabled: bool = True  # ENA LOW (turned OFF by stop, ON again by setup of next move)
+        self.positions: dict[str, int] = {name: 0 for name in self.axes}  # Commanded microsteps of axes
+        self.step_remainders: dict[str, Fraction] = {name: Fraction(0) for name in self.axes}  # Not sent fractions
+        logger.debug('Axes %s connected', list(self.axes))
+
+    @staticmethod
+    def merged_pulses(edges: list[tuple[int, int]], duration: int, width: int) -> Iterator:
+        """
+        Merged gpioPulse entries of all axes
+        :param edges: (PUL mask, amount of pulses) of each axis
+        :param duration: micro s of pattern
+        :param width: PUL HIGH lvl micro s
+        :return: iterator of pigpio.pulse
+        """
+        def axis_edges(mask: int, pulses: int) -> Iterator[tuple[int, int, int]]:
+            for k in range(pulses):
+                rise: int = k * duration // pulses
+                yield rise, mask, 0  # LVL HIGH (1)
+                yield rise + width, 0, mask  # LVL LOW (0)
+
+        time: int = 0
+        on: int = 0
+        off: int = 0
+        for edge_time, edge_on, edge_off in heapq.merge(*(axis_edges(*edge) for edge in edges)):
+            if edge_time != time:
+                yield pigpio.pulse(on, off, edge_time - time)
+                time, on, off = edge_time, 0, 0
+            on |= edge_on
+            off |= edge_off
+        yield pigpio.pulse(on, off, duration - time)
+
+    def chunks(self, pulses: Iterator, prefix: list | None = None) -> Iterator[list]:
+        """
+        Split gpioPulse entries by MAX_WAVE_PULSES
+        :param pulses: iterator of pigpio.pulse
+        :param prefix: entries in front of first chunk
+        :return: iterator of gpioPulse lists
+        """
+        chunk: list = list(prefix or [])
+        for pulse in pulses:
+            chunk.append(pulse)
+            if len(chunk) == self.MAX_WAVE_PULSES:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def move_sectors(self, sectors: dict[str, float], speed: float | int = DL57D.NORMAL_SPEED_RPM) -> float:
+        """
+        Coordinated move, axes start and finish together
+        Axis with longest move runs with speed, others are scaled by their pulses
+        Fraction of microstep of every axis is carried to next move (like DL57D.move_to)
+        Setup in front of PUL: ENA ON -> 5 us (after stop) -> DIR -> 100 us
+        :param sectors: name of axis -> sectors of rotation ( - sign mean DIR change, Fraction for thirds etc.)
+        :param speed: r/min of longest axis
+        :return: move time in seconds
+        """
+        dir_on: int = 0
+        dir_off: int = 0
+        counts: list[tuple[AxisConfig, int]] = []
+        for name, sector in sectors.items():
+            axis: AxisConfig = self.axes[name]
+            target: Fraction = self.step_remainders[name] + exact_fraction(sector) * axis.sector_ratio
+            steps: int = round(target)
+            self.step_remainders[name] = target - steps
+            self.positions[name] += steps
+            if steps:
+                counts.append((axis, abs(steps)))  # Sign is DIR
+            if steps < 0:
+                dir_off |= 1 << axis.dir_gpio  # CCW DIR
+            elif steps > 0:
+                dir_on |= 1 << axis.dir_gpio  # CW DIR
+        if not counts:
+            return 0
+        repeats: int = 0
+        for _, pulses in counts:
+            repeats = gcd(repeats, pulses)
+        duration: int = ceil(max(pulses * axis.min_period(speed=speed) for axis, pulses in counts) / repeats)
+        duration *= repeats  # Whole micro s for each of repeated blocks
+        width: int = max(min(duration // pulses for _, pulses in counts) // 2, PulseEngine.MIN_LVL_MICROS)
+        logger.debug('Move %s pulses in %s micro s', [(axis.name, pulses) for axis, pulses in counts], duration)
+        dir_setup: list = []
+        if not self.enabled and self.ena_mask:  # After ENA needs 5 us Before DIR
+            dir_setup.append(pigpio.pulse(0, self.ena_mask, max(round(DL57D.SLEEP_AFTER_ENA * 1e6), 1)))
+        dir_setup.append(pigpio.pulse(dir_on, dir_off, int(DL57D.SLEEP_AFTER_DIR * 1e6)))  # DIR before PUL
+        self.enabled = True
+        block_pulses: int = 2 * sum(pulses for _, pulses in counts) // repeats
+        if block_pulses <= self.MAX_BLOCK_PULSES:  # Periodic pattern -> one looped block
+            block: list = list(self.merged_pulses(
+                edges=[(1 << axis.pul_gpio, pulses // repeats) for axis, pulses in counts],
+                duration=duration // repeats, width=width))
+            with self.engine.cache.compiling():  # Block wave does not evict setup wave before transmit
+                waves: list[int] = [self.engine.create_wave(dir_setup), self.engine.create_wave(block)]  # Cached
+                self.engine.transmit(chain=[waves[0], *self.engine.repeat_chain(waves[1], repeats)])
+            self.engine.wait(duration=duration * 1e-6)
+        else:
+            underruns: int = self.engine.stream(self.chunks(
+                pulses=self.merged_pulses(edges=[(1 << axis.pul_gpio, pulses) for axis, pulses in counts],
+                                          duration=duration, width=width),
+                prefix=dir_setup))
+            if underruns:
+                logger.warning('Stream underruns %s', underruns)
+        return duration * 1e-6
+
+    def stop(self) -> None:
+        """
+        Abort transmission, all PUL LOW and turn OFF drivers (ENA HIGH)
+        :return: None
+        """
+        self.pi.wave_tx_stop()
+        self.pi.clear_bank_1(self.pul_mask)
+        logger.info('PULL off (0)')
+        self.pi.set_bank_1(self.ena_mask)
+        self.enabled = False
+        logger.info('ENA off (1)')
+
+    def stop_driver(self) -> None:
+        """
+        Turn off all axes and close connection
+        :return: None
+        """
+        try:
+            self.stop()
+            self.engine.clear()
+        except Exception as e:
+            logger.error('While disabling: %s', e)
+        finally:
+            self.pi.stop()
+            logger.info('GPIO stops')
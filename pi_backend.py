@@ -0,0 +1,82 @@
+"""
+Backend of DL57D driver: pigpio daemon connection or its pure python simulator
+Every driver class takes pi (pigpio.pi or SimulatedPi), so backend is pluggable
+Without installed pigpio (plain Linux, CI) pigpio module is replaced by sim_pigpio
+"""
+import logging
+import time
+from typing import Callable, Protocol
+
+try:
+    import pigpio
+    SIMULATED: bool = False
+except ImportError:  # Plain Linux -> simulated daemon
+    import sim_pigpio as pigpio
+    SIMULATED: bool = True
+    logging.getLogger('dl57d').warning('pigpio is not installed, simulated backend is used')
+
+
+class PiBackend(Protocol):
+    """
+    Subset of pigpio.pi used by driver
+    """
+    connected: bool
+
+    def set_mode(self, gpio: int, mode: int) -> int: ...
+
+    def get_mode(self, gpio: int) -> int: ...
+
+    def read(self, gpio: int) -> int: ...
+
+    def set_pull_up_down(self, gpio: int, pud: int) -> int: ...
+
+    def write(self, gpio: int, level: int) -> int: ...
+
+    def set_bank_1(self, bits: int) -> int: ...
+
+    def clear_bank_1(self, bits: int) -> int: ...
+
+    def read_bank_1(self) -> int: ...
+
+    def get_current_tick(self) -> int: ...
+
+    def callback(self, user_gpio: int, edge: int = 0, func: Callable | None = None): ...
+
+    def set_glitch_filter(self, user_gpio: int, steady: int) -> int: ...
+
+    def hardware_PWM(self, gpio: int, PWMfreq: int, PWMduty: int) -> int: ...
+
+    def set_PWM_frequency(self, user_gpio: int, frequency: int) -> int: ...
+
+    def set_PWM_dutycycle(self, user_gpio: int, dutycycle: int) -> int: ...
+
+    def wave_add_new(self) -> int: ...
+
+    def wave_add_generic(self, pulses: list) -> int: ...
+
+    def wave_create(self) -> int: ...
+
+    def wave_get_max_cbs(self) -> int: ...
+
+    def wave_delete(self, wave_id: int) -> int: ...
+
+    def wave_chain(self, data: list[int]) -> int: ...
+
+    def wave_send_using_mode(self, wave_id: int, mode: int) -> int: ...
+
+    def wave_tx_busy(self) -> int: ...
+
+    def wave_tx_at(self) -> int: ...
+
+    def wave_tx_stop(self) -> int: ...
+
+    def stop(self) -> None: ...
+
+
+def backend_sleep(pi: PiBackend) -> Callable[[float], None]:
+    """
+    Host side sleep of backend (virtual clock of simulator)
+    :param pi: pigpio.pi or SimulatedPi
+    :return: sleep function
+    """
+    return getattr(pi, 'sleep', time.sleep)
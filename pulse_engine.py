@@ -0,0 +1,442 @@
+"""
+Hardware timed PUL generation for DL57D driver through pigpio DMA waveforms
+Pulse train is built once with wave_add_generic / wave_create
+and repeated by wave_chain loops, so python is out of per-pulse path
+wave_chain loop:   255 0 <waves> 255 1 x y  -> repeat x + 256 * y times (max 65535)
+Loops could be nested (pigpiod supports up to 20 loop counters in one chain)
+Long not periodic trains are streamed: chunk waves double-buffered by WAVE_MODE_ONE_SHOT_SYNC
+Waves are created through WaveCache (identical trains shared, LRU eviction within daemon limits)
+With frequency planner periods are on pigpiod sample rate grid and cruises dither two adjacent periods
+Stopped chain is replayed from its cached waves, so PUL impulses not sent until stop are known without encoder
+"""
+from collections import deque
+from itertools import groupby
+from typing import Iterable
+
+from pi_backend import backend_sleep, pigpio
+from wave_cache import WaveCache, shared_cache
+
+
+class PulseEngine:
+    """
+    Waveform backed pulse engine for one PUL gpio
+    One period of PUL signal (HIGH lvl + LOW lvl) is created as wave and looped by DMA
+    """
+    CHAIN_LOOP_START: tuple[int, int] = (255, 0)  # Start of looped block
+    CHAIN_LOOP_END: int = 1  # 255 1 x y  End of looped block (repeat x + 256 * y)
+    CHAIN_DELAY: int = 2  # 255 2 x y  Delay x + 256 * y micro s
+    CHAIN_MAX_REPEAT: int = 65535  # Max repeat of one loop (2 bytes counter)
+    CHAIN_MAX_BYTES: int = 600  # wave_chain data of one transmission
+    CHAIN_MAX_LOOPS: int = 20  # Loop counters of one transmission
+    MIN_LVL_MICROS: int = 3  # 2.5 micro s LVL_MIN_DURATION rounded up to whole micro s
+    BUSY_POLL: float = 1e-3  # 1 ms between wave_tx_busy polls while waiting end of move
+
+    def __init__(self, pi: pigpio.pi, pul_gpio: int, planner=None):
+        """
+        :param pi: connected pigpio.pi of driver
+        :param pul_gpio: raspberry pi GPIO num of PUL + connection to pin
+        :param planner: frequency_planner.FrequencyPlanner of sample rate grid (None -> whole micro s periods)
+        """
+        self.pi: pigpio.pi = pi
+        self.sleep = backend_sleep(pi)  # Host side sleep (virtual clock of simulator)
+        self.pul_gpio: int = pul_gpio
+        self.pul_mask: int = 1 << pul_gpio  # Bit mask of PUL gpio for gpioPulse
+        self.cache: WaveCache = shared_cache(pi)  # Wave ids and DMA memory of daemon (shared by its engines)
+        self.halted: bool = False  # Set by safety monitor stop: streams end until reset
+        self.planner = planner  # frequency_planner.FrequencyPlanner (None -> whole micro s grid)
+        self.transmitted: tuple[list[int] | None, int] | None = None  # Own last chain, tick of start (None -> stream)
+        self.elapsed: float = float('inf')  # Micro s of sent chain transmitted until stop()
+
+    def lvl_duration_to_micros(self, lvl_duration: float) -> tuple[int, int]:
+        """
+        Converts lvl duration (seconds) into HIGH and LOW durations of one period (whole micro s or sample grid)
+        Period rounded once, so HIGH + LOW keeps closest to 2 * lvl_duration
+        :param lvl_duration: duration of one lvl in seconds
+        :return: (HIGH micro s, LOW micro s)
+        """
+        return self.split(self.snap(2 * lvl_duration * 1e6))
+
+    def snap(self, period: float) -> int:
+        """
+        :param period: micro s
+        :return: nearest period of grid (whole micro s or sample rate of planner)
+        """
+        if self.planner is not None:
+            return self.planner.snap(period)
+        return max(round(period), 2 * self.MIN_LVL_MICROS)
+
+    def split(self, period: int) -> tuple[int, int]:
+        """
+        :param period: period of grid micro s
+        :return: (HIGH micro s, LOW micro s)
+        """
+        if self.planner is not None:
+            return self.planner.split(period)
+        high: int = max(period // 2, self.MIN_LVL_MICROS)
+        return high, period - high
+
+    def period_wave(self, high: int, low: int) -> int:
+        """
+        Wave of one PUL period, created once for each (HIGH, LOW) pair (while kept in cache)
+        :param high: HIGH lvl duration micro s
+        :param low: LOW lvl duration micro s
+        :return: wave id
+        """
+        return self.create_wave([pigpio.pulse(self.pul_mask, 0, high),  # LVL HIGH (1)
+                                 pigpio.pulse(0, self.pul_mask, low)])  # LVL LOW (0)
+
+    def pattern_wave(self, periods: tuple[int, ...]) -> int:
+        """
+        Wave of PUL periods pulse by pulse (dither pattern)
+        :param periods: periods of grid micro s
+        :return: wave id
+        """
+        pulses: list = []
+        for period in periods:
+            high, low = self.split(period)
+            pulses.append(pigpio.pulse(self.pul_mask, 0, high))  # LVL HIGH (1)
+            pulses.append(pigpio.pulse(0, self.pul_mask, low))  # LVL LOW (0)
+        return self.create_wave(pulses)
+
+    def create_wave(self, pulses: list) -> int:
+        """
+        Wave of list of gpioPulse from cache (created on miss)
+        :param pulses: list of pigpio.pulse
+        :return: wave id
+        """
+        return self.cache.wave(pulses)
+
+    def repeat_chain(self, wave_id: int | list[int], count: int) -> list[int]:
+        """
+        Chain commands to send wave (or list of waves) count times
+        Counts more than 65535 are nested in outer loop
+        :param wave_id: wave id or list of wave ids (or chain data) sending as one block
+        :param count: amount of repeats
+        :return: wave_chain data
+        """
+        waves: list[int] = wave_id if isinstance(wave_id, list) else [wave_id]
+        if count <= 0:
+            return []
+        if count == 1:
+            return list(waves)
+        if count <= self.CHAIN_MAX_REPEAT:
+            return [*self.CHAIN_LOOP_START, *waves, 255, self.CHAIN_LOOP_END, count & 255, count >> 8]
+        outer, rest = divmod(count, self.CHAIN_MAX_REPEAT)
+        return [*self.CHAIN_LOOP_START,
+                *self.repeat_chain(waves, self.CHAIN_MAX_REPEAT),
+                255, self.CHAIN_LOOP_END, outer & 255, outer >> 8,
+                *self.repeat_chain(waves, rest)]
+
+    def delay_chain(self, seconds: float) -> list[int]:
+        """
+        :param seconds: PUL LOW pause
+        :return: wave_chain data of delay (looped over 65535 micro s)
+        """
+        full, rest = divmod(round(seconds * 1e6), self.CHAIN_MAX_REPEAT)
+        chain: list[int] = self.repeat_chain([255, self.CHAIN_DELAY, 255, 255], full)
+        if rest:
+            chain += [255, self.CHAIN_DELAY, rest & 255, rest >> 8]
+        return chain
+
+    @staticmethod
+    def chain_loops(chain: list[int]) -> int:
+        """
+        :param chain: wave_chain data
+        :return: loop counters of chain
+        """
+        loops: int = 0
+        index: int = 0
+        while index < len(chain):
+            if chain[index] == 255:
+                loops += chain[index + 1] == 0
+                index += 4 if chain[index + 1] in (1, 2) else 2
+            else:
+                index += 1
+        return loops
+
+    @staticmethod
+    def sequence_period(keys: list) -> int:
+        """
+        Shortest period p of sequence (keys[i] == keys[i + p]), prefix function of KMP
+        :param keys: hashable items
+        :return: period (len(keys) when not periodic)
+        """
+        border: list[int] = [0] * len(keys)
+        matched: int = 0
+        for index in range(1, len(keys)):
+            while matched and keys[index] != keys[matched]:
+                matched = border[matched - 1]
+            if keys[index] == keys[matched]:
+                matched += 1
+            border[index] = matched
+        return len(keys) - border[-1] if keys else 0
+
+    def loop_blocks(self, blocks: list[list[int]], durations: list[float]) -> list[tuple[list[int], float]]:
+        """
+        Fold chain blocks (moves of batch) into loops: runs of equal blocks, or periodic sequence
+        (indexing through positions) as one loop of its period after first block (it could carry setup)
+        :param blocks: wave_chain data of each move
+        :param durations: transmission time of each move in seconds
+        :return: list of (wave_chain unit sent whole, its transmission time)
+        """
+        keys: list[tuple] = [tuple(block) for block in blocks]
+        best: list[tuple[list[int], float]] = []
+        for key, run in groupby(range(len(keys)), key=keys.__getitem__):
+            indexes: list[int] = list(run)
+            best.append((self.repeat_chain(list(key), len(indexes)), sum(durations[index] for index in indexes)))
+        for start in (0, 1):
+            period: int = self.sequence_period(keys[start:])
+            repeats: int = (len(keys) - start) // period if period else 0
+            body: list[int] = [code for block in blocks[start:start + period] for code in block]
+            if repeats < 2 or len(body) + 8 > self.CHAIN_MAX_BYTES:
+                continue
+            end: int = start + period * repeats
+            units: list[tuple[list[int], float]] = [
+                *zip(blocks[:start], durations[:start]),
+                (self.repeat_chain(body, repeats), sum(durations[start:end])),
+                *zip(blocks[end:], durations[end:])]
+            if sum(len(unit) for unit, _ in units) < sum(len(unit) for unit, _ in best):
+                best = units
+        return best
+
+    def batch_chains(self, blocks: list[list[int]], durations: list[float]) -> list[tuple[list[int], float]]:
+        """
+        Pack moves of batch into as few transmissions as fit wave_chain limits
+        :param blocks: wave_chain data of each move
+        :param durations: transmission time of each move in seconds
+        :return: list of (wave_chain data of transmission, its transmission time)
+        """
+        chains: list[tuple[list[int], float]] = []
+        for unit, duration in self.loop_blocks(blocks=blocks, durations=durations):
+            if chains and (len(chains[-1][0]) + len(unit) <= self.CHAIN_MAX_BYTES
+                           and self.chain_loops(chains[-1][0]) + self.chain_loops(unit) <= self.CHAIN_MAX_LOOPS):
+                chains[-1] = (chains[-1][0] + unit, chains[-1][1] + duration)
+            else:
+                chains.append((unit, duration))
+        return chains
+
+    def cruise_chain(self, period: float, pulses: int) -> tuple[list[int], float]:
+        """
+        Chain of constant speed pulses, planner dithers two adjacent grid periods (average period is exact)
+        :param period: exact PUL period micro s
+        :param pulses: amount of PUL impulses
+        :return: wave_chain data, transmission time in seconds
+        """
+        if self.planner is None:
+            high, low = self.split(self.snap(period))
+            return self.repeat_chain(self.period_wave(high=high, low=low), pulses), pulses * (high + low) * 1e-6
+        chain: list[int] = []
+        duration: int = 0
+        with self.cache.compiling():  # Prefix wave does not evict pattern wave
+            for pattern, repeats in self.planner.dither_period(period=period, pulses=pulses):
+                if len(pattern) == 1:
+                    high, low = self.split(pattern[0])
+                    wave_id: int = self.period_wave(high=high, low=low)
+                else:
+                    wave_id = self.pattern_wave(pattern)
+                chain += self.repeat_chain(wave_id, repeats)
+                duration += sum(pattern) * repeats
+        return chain, duration * 1e-6
+
+    def send_pulses(self, pulses: int, lvl_duration: float, wait: bool = True, setup: list[int] | None = None) -> float:
+        """
+        Send pulses amount of PUL periods as one DMA transaction
+        :param pulses: amount of PUL impulses
+        :param lvl_duration: duration of one lvl in seconds
+        :param wait: block until transmission ends
+        :param setup: wave_chain data sent in front of pulses (ENA / DIR setup)
+        :return: expected transmission time in seconds
+        """
+        if pulses <= 0:
+            return 0
+        with self.cache.compiling():
+            cruise, duration = self.cruise_chain(period=2 * lvl_duration * 1e6, pulses=pulses)
+            self.transmit(chain=[*(setup or []), *cruise])
+        if wait:
+            self.wait(duration=duration)
+        return duration
+
+    def transmit(self, chain: list[int]) -> None:
+        """
+        Start DMA transmission of chain (waits previous one)
+        :param chain: wave_chain data
+        :return: None
+        """
+        while self.busy():  # Previous move still transmitting
+            self.sleep(self.BUSY_POLL)
+        self.cache.transmit(chain=chain, sender=self)
+        self.pi.wave_chain(chain)
+        self.transmitted = (chain, self.pi.get_current_tick())
+        self.elapsed = float('inf')
+
+    def stream(self, chunks: Iterable[list | int]) -> int:
+        """
+        Send chunks of gpioPulse back to back, python only runs per chunk
+        Next chunk is created while current transmits and queued by WAVE_MODE_ONE_SHOT_SYNC
+        (no more than 2 chunk waves sent at once, finished ones are deleted)
+        :param chunks: iterable of gpioPulse lists (each fits one wave) or ids of waves owned by caller
+            (sent as they are, not deleted, same id must not follow itself)
+        :return: amount of underruns (transmitter was idle before next chunk was queued)
+        """
+        while self.busy():  # Previous move still transmitting
+            self.sleep(self.BUSY_POLL)
+        sent: deque[tuple[int, bool]] = deque()  # Queued and transmitting waves (wave id, created by stream)
+        underruns: int = 0
+        self.cache.transmit(chain=[], sender=self)
+        self.transmitted = (None, 0)  # Chunks are not cached
+        for pulses in chunks:
+            if self.halted:
+                break
+            created: bool = not isinstance(pulses, int)
+            wave_id: int = self.cache.create(pulses) if created else pulses  # Chunks are not cached
+            if len(sent) == 2:  # Wait first chunk end before queueing third one
+                while self.pi.wave_tx_at() == sent[0][0] and self.busy():
+                    self.sleep(self.BUSY_POLL)
+                done_id, done_created = sent.popleft()
+                if done_created:
+                    self.cache.delete(done_id)
+            if sent and not self.busy():
+                underruns += 1
+            self.pi.wave_send_using_mode(wave_id, pigpio.WAVE_MODE_ONE_SHOT_SYNC)
+            sent.append((wave_id, created))
+        self.wait()
+        for wave_id, created in sent:
+            if created:
+                self.cache.delete(wave_id)
+        if not self.halted:
+            self.transmitted = None  # Ended, nothing to resync
+        return underruns
+
+    def busy(self) -> bool:
+        """
+        :return: True while wave transmitting
+        """
+        return bool(self.pi.wave_tx_busy())
+
+    def wait(self, duration: float = 0) -> None:
+        """
+        Block until transmission ends
+        :param duration: expected transmission time, slept at once before polling
+        :return: None
+        """
+        if duration > 0:
+            self.sleep(duration)
+        while self.busy():
+            self.sleep(self.BUSY_POLL)
+
+    def stop(self) -> None:
+        """
+        Abort own transmission and set PUL LOW
+        pigpiod has one transmitter per daemon: transmission of other engine of connection
+        (pooled driver of other PUL gpio) is not stopped and its waves stay protected from eviction
+        :return: None
+        """
+        if self.cache.sender in (None, self):
+            self.pi.wave_tx_stop()
+            if self.transmitted is not None and self.elapsed == float('inf'):
+                self.elapsed = pigpio.tickDiff(self.transmitted[1], self.pi.get_current_tick())  # Tick read as at start
+            self.cache.transmit(chain=[])
+        self.pi.write(gpio=self.pul_gpio, level=pigpio.LOW)
+
+    @staticmethod
+    def chain_items(chain: list[int]) -> list:
+        """
+        :param chain: wave_chain data
+        :return: tree of ('wave', id) ('delay', micro s) ('loop', items, count | None -> forever)
+        """
+        stack: list[list] = [[]]
+        index: int = 0
+        while index < len(chain):
+            if chain[index] != 255:
+                stack[-1].append(('wave', chain[index]))
+                index += 1
+            elif chain[index + 1] in (0, 3):  # Loop start / end of loop forever
+                if chain[index + 1] == 0:
+                    stack.append([])
+                else:
+                    items: list = stack.pop()
+                    stack[-1].append(('loop', items, None))
+                index += 2
+            else:
+                value: int = chain[index + 2] + 256 * chain[index + 3]
+                if chain[index + 1] == 1:  # 255 1 x y loop end, 255 2 x y delay
+                    items = stack.pop()
+                    stack[-1].append(('loop', items, value))
+                else:
+                    stack[-1].append(('delay', value))
+                index += 4
+        return stack[0]
+
+    def unsent_steps(self, chains: list[list[int]], dir_mask: int, dir_lvl: int) -> int | None:
+        """
+        Signed PUL impulses not sent by stopped chain (after elapsed micro s of its start) and by chains
+        of batch not transmitted yet, replayed from content of cached waves
+        Accounted once: sent chain is forgotten
+        :param chains: wave_chain data of not transmitted chains
+        :param dir_mask: bit mask of DIR gpio (0 -> always CW)
+        :param dir_lvl: DIR lvl at stop (changed by setup waves of replayed rest)
+        :return: microsteps ( - sign mean CCW DIR), None when rest of transmission is not known (stream)
+        """
+        sent, self.transmitted = self.transmitted, None
+        if sent is not None and sent[0] is None:
+            return  # Stopped stream
+        durations: dict[int, int] = {}
+        state: list = [0, dir_lvl]  # Micro s from start of chain, DIR lvl
+
+        def duration(items: list) -> int:
+            total: int = 0
+            for item in items:
+                if item[0] == 'wave':
+                    if item[1] not in durations:
+                        durations[item[1]] = sum(delay for _, _, delay in self.cache.keys[item[1]])
+                    total += durations[item[1]]
+                elif item[0] == 'delay':
+                    total += item[1]
+                else:
+                    total += item[2] * duration(item[1])
+            return total
+
+        def replay(items: list, after: float) -> int:
+            steps: int = 0
+            for item in items:
+                length: int = duration([item])
+                if state[0] + length <= after:  # Sent before stop
+                    state[0] += length
+                elif item[0] == 'wave':
+                    for on, off, delay in self.cache.keys[item[1]]:
+                        if state[0] > after:
+                            state[1] = pigpio.HIGH if on & dir_mask else pigpio.LOW if off & dir_mask else state[1]
+                            if on & self.pul_mask:
+                                steps += 1 if state[1] else -1
+                        state[0] += delay
+                elif item[0] == 'delay':
+                    state[0] += item[1]
+                else:
+                    body: int = duration(item[1])
+                    skipped: int = max(int(after - state[0]) // body, 0) if body else 0
+                    state[0] += skipped * body
+                    repeats: int = item[2] - skipped
+                    steps += replay(item[1], after)
+                    if repeats > 1:  # Next passes start with same DIR lvl
+                        rest: int = replay(item[1], after)
+                        steps += (repeats - 1) * rest
+                        state[0] += (repeats - 2) * body
+            return steps
+
+        try:
+            unsent: int = 0
+            if sent is not None and sent[0] is not None:
+                unsent += replay(self.chain_items(sent[0]), self.elapsed)
+            for chain in chains:
+                state[0] = 0
+                unsent += replay(self.chain_items(chain), -1)
+        except (KeyError, TypeError):  # Wave not in cache or loop forever
+            return
+        return unsent
+
+    def clear(self) -> None:
+        """
+        Release wave cache, waves are deleted with last engine of connection
+        :return: None
+        """
+        self.cache.release()
@@ -0,0 +1,298 @@
+"""
+Real-time worker process of DL57D driver: all pigpio I/O (wave chaining, DIR / ENA sequencing) runs
+in separate process pinned to one CPU with SCHED_FIFO (when permitted), away from GIL, GC and logging
+of application process
+    driver = WorkerDriver(cpu=3, priority=50, microstep=10, accel=5000)  # DL57D arguments without pi
+    driver.rotate_sectors(90, speed=60)  # Same public methods as DL57D
+    driver.position  # Attribute reads too
+    driver.close()
+Application and worker talk through two single producer / single consumer rings in shared memory:
+fixed-size records (sequence, status, pickled call or result), each side keeps its own slot index and
+two semaphores count published records and free slots (no shared counters are read half written on 32-bit
+ARM, semaphore operations order slot writes and reads across CPUs), one lock keeps app threads a single producer
+Idle worker sleeps on semaphore of requests ring after short spin, app waiting result sleeps on semaphore
+of replies ring the same way (one app thread reads replies, others wait on condition)
+"""
+import gc
+import logging
+import multiprocessing
+import os
+import pickle
+import struct
+import threading
+import time
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+
+from DL57D import DL57D
+
+logger: logging.Logger = logging.getLogger('dl57d.pulse_worker')
+
+OK: int = 0
+FAILED: int = 1
+CLOSE: str = '__close__'  # Method of last record
+GETATTR: str = '__getattr__'  # Attribute read
+
+
+class SharedRing:
+    """
+    SPSC ring of fixed-size records in shared memory
+    Slot is written before release of records semaphore and read before release of free semaphore,
+    head (producer) and tail (consumer) indexes are local to their side
+    """
+    RECORD: struct.Struct = struct.Struct('<IBxH')  # sequence, status, payload length
+    SPIN: int = 200  # Polls before sleeping
+    POLL: float = 50e-6  # Sleep between polls after spinning (full ring)
+
+    def __init__(self, slots: int = 64, slot_size: int = 256, name: str | None = None,
+                 semaphores: tuple | None = None, context=multiprocessing):
+        """
+        :param slots: records of ring
+        :param slot_size: bytes of record (header + payload)
+        :param name: shared memory name to attach (None -> create)
+        :param semaphores: (records, free) semaphores of attached ring (None -> create)
+        :param context: multiprocessing context of created semaphores
+        """
+        self.slots: int = slots
+        self.slot_size: int = slot_size
+        self.max_payload: int = slot_size - self.RECORD.size
+        self.memory: SharedMemory = SharedMemory(name=name, create=name is None, size=slots * slot_size)
+        self.owner: bool = name is None
+        self.buffer: memoryview = self.memory.buf
+        self.name: str = self.memory.name
+        if semaphores is None:
+            semaphores = (context.Semaphore(0), context.Semaphore(slots))
+        self.semaphores: tuple = semaphores  # Passed to other process
+        self.records, self.free = semaphores  # Published records, free slots
+        self.head: int = 0  # Next slot of producer side
+        self.tail: int = 0  # Next slot of consumer side
+
+    def put(self, seq: int, status: int, payload: bytes) -> bool:
+        """
+        Producer side
+        :return: False when ring is full
+        """
+        if len(payload) > self.max_payload:
+            raise ValueError(f'Record payload {len(payload)} bytes more than slot payload {self.max_payload}')
+        if not self.free.acquire(False):
+            return False
+        offset: int = (self.head % self.slots) * self.slot_size
+        self.RECORD.pack_into(self.buffer, offset, seq, status, len(payload))
+        self.buffer[offset + self.RECORD.size:offset + self.RECORD.size + len(payload)] = payload
+        self.head += 1
+        self.records.release()  # Publish after record
+        return True
+
+    def get(self, block: bool = False, timeout: float | None = None) -> tuple[int, int, bytes] | None:
+        """
+        Consumer side
+        :param block: wait record (SPIN polls, then sleep on records semaphore)
+        :param timeout: seconds of sleep on records semaphore (None -> until record)
+        :return: (sequence, status, payload) or None when ring is empty (after timeout)
+        """
+        if not self.records.acquire(False):
+            if not block:
+                return
+            for _ in range(self.SPIN):
+                if self.records.acquire(False):
+                    break
+            else:
+                if not self.records.acquire(timeout=timeout):
+                    return
+        offset: int = (self.tail % self.slots) * self.slot_size
+        seq, status, length = self.RECORD.unpack_from(self.buffer, offset)
+        payload: bytes = bytes(self.buffer[offset + self.RECORD.size:offset + self.RECORD.size + length])
+        self.tail += 1
+        self.free.release()  # Slot is free after copy
+        return seq, status, payload
+
+    def wait(self, attempt) -> object:
+        """
+        Spin, then sleep POLL until attempt returns not None / not False
+        :param attempt: callable polled
+        :return: result of attempt
+        """
+        polls: int = 0
+        while True:
+            result = attempt()
+            if result is not None and result is not False:
+                return result
+            polls += 1
+            if polls > self.SPIN:
+                time.sleep(self.POLL)
+
+    def close(self) -> None:
+        self.buffer.release()
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+GC_THRESHOLD: tuple[int, int, int] = (50000, 50, 100)  # Rare automatic collections, young ones run when idle
+
+
+def realtime_setup(cpu: int | None, priority: int | None) -> None:
+    """
+    Pin process to cpu and switch to SCHED_FIFO priority (needs CAP_SYS_NICE, else stays SCHED_OTHER)
+    Objects of setup are frozen (never scanned), GC stays enabled with high thresholds
+    so reference cycles of driver calls are still collected
+    """
+    if cpu is not None:
+        os.sched_setaffinity(0, {cpu})
+        logger.info('Pulse worker pinned to CPU %s', cpu)
+    if priority is not None:
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+            logger.info('Pulse worker SCHED_FIFO priority %s', priority)
+        except PermissionError:
+            logger.warning('SCHED_FIFO is not permitted, pulse worker runs SCHED_OTHER')
+    gc.collect()
+    gc.freeze()
+    gc.set_threshold(*GC_THRESHOLD)
+
+
+def worker_main(requests_name: str, replies_name: str, slots: int, slot_size: int, driver_kwargs: dict,
+                cpu: int | None, priority: int | None, semaphores: tuple[tuple, tuple]) -> None:
+    """
+    Worker process: owns DL57D and its pigpio connection, executes records of requests ring in order
+    Young GC generations are collected while requests ring is empty, before sleeping on it
+    """
+    realtime_setup(cpu=cpu, priority=priority)
+    requests: SharedRing = SharedRing(slots=slots, slot_size=slot_size, name=requests_name,
+                                      semaphores=semaphores[0])
+    replies: SharedRing = SharedRing(slots=slots, slot_size=slot_size, name=replies_name, semaphores=semaphores[1])
+    try:
+        driver: DL57D | None = DL57D(**driver_kwargs)
+        status, result = OK, None
+    except (Exception, SystemExit) as e:  # Driver exits on bad setup
+        driver, status, result = None, FAILED, e
+    replies.wait(lambda: replies.put(0, status, pickle.dumps(result)))
+    while driver is not None:
+        record: tuple[int, int, bytes] | None = requests.get()
+        if record is None:  # Idle
+            gc.collect(1)
+            record = requests.get(block=True)
+        seq, _, payload = record
+        name, args, kwargs = pickle.loads(payload)
+        try:
+            if name == GETATTR:
+                result = getattr(driver, args[0])
+            elif name == CLOSE:
+                result = driver.stop_driver()
+            else:
+                result = getattr(driver, name)(*args, **kwargs)
+            status = OK
+        except (Exception, SystemExit) as e:
+            status, result = FAILED, e
+        try:
+            reply: bytes = pickle.dumps(result)
+            if len(reply) > replies.max_payload:
+                raise ValueError(f'Result of {name} is {len(reply)} bytes, more than slot payload')
+        except Exception as e:
+            status, reply = FAILED, pickle.dumps(RuntimeError(repr(e)))
+        replies.wait(lambda: replies.put(seq, status, reply))
+        if name == CLOSE:
+            break
+    requests.close()
+    replies.close()
+
+
+class WorkerDriver:
+    """
+    Proxy of DL57D running in pulse worker process (public methods and attribute reads)
+    """
+    ALIVE_CHECK: float = 0.5  # Seconds of sleep on replies semaphore between worker liveness checks
+
+    def __init__(self, cpu: int | None = None, priority: int | None = 50, slots: int = 64, slot_size: int = 256,
+                 start_method: str = 'spawn', **driver_kwargs):
+        """
+        :param cpu: CPU of worker (None -> not pinned), isolate it (isolcpus) for best timing
+        :param priority: SCHED_FIFO priority 1..99 (None -> SCHED_OTHER)
+        :param slots: records of each ring
+        :param slot_size: bytes of record
+        :param start_method: multiprocessing start method (spawn -> clean interpreter of worker)
+        :param driver_kwargs: DL57D arguments (pi is created by worker)
+        """
+        context = get_context(start_method)
+        self.requests: SharedRing = SharedRing(slots=slots, slot_size=slot_size, context=context)
+        self.replies: SharedRing = SharedRing(slots=slots, slot_size=slot_size, context=context)
+        self.lock: threading.Lock = threading.Lock()  # App threads -> single producer
+        self.replied: threading.Condition = threading.Condition()  # Replies read by one app thread for all
+        self.reading: bool = False  # App thread sleeps on replies semaphore
+        self.seq: int = 0
+        self.results: dict[int, tuple[int, bytes]] = {}  # Replies read while waiting other sequence
+        self.process = context.Process(
+            target=worker_main, name='dl57d-pulse-worker', daemon=True,
+            kwargs={'requests_name': self.requests.name, 'replies_name': self.replies.name, 'slots': slots,
+                    'slot_size': slot_size, 'driver_kwargs': driver_kwargs, 'cpu': cpu, 'priority': priority,
+                    'semaphores': (self.requests.semaphores, self.replies.semaphores)})
+        self.process.start()
+        self.result(0)  # Driver is set up
+        logger.info('Pulse worker pid %s ready', self.process.pid)
+
+    def submit(self, name: str, *args, **kwargs) -> int:
+        """
+        Queue call of driver method without waiting (pipelined calls run in order)
+        :return: sequence of call for result()
+        """
+        with self.lock:
+            self.seq += 1
+            seq: int = self.seq
+            payload: bytes = pickle.dumps((name, args, kwargs))
+            self.requests.wait(lambda: self.requests.put(seq, OK, payload))
+        return seq
+
+    def result(self, seq: int):
+        """
+        Wait reply of call (sleeps on replies semaphore, or on condition while other app thread reads replies)
+        :param seq: sequence of submit()
+        :return: result of driver method
+        :raise: exception of driver method
+        """
+        with self.replied:
+            while seq not in self.results:
+                if self.reading:  # Other app thread reads replies ring -> single consumer
+                    self.replied.wait()
+                    continue
+                self.reading = True
+                self.replied.release()  # Other threads take their replies while this one sleeps
+                try:
+                    record: tuple[int, int, bytes] | None = self.replies.get(block=True, timeout=self.ALIVE_CHECK)
+                finally:
+                    self.replied.acquire()
+                    self.reading = False
+                    self.replied.notify_all()
+                if record is not None:
+                    self.results[record[0]] = record[1:]
+                elif not self.process.is_alive():
+                    raise RuntimeError(f'Pulse worker exited with code {self.process.exitcode}')
+            status, payload = self.results.pop(seq)
+        result = pickle.loads(payload)
+        if status != OK:
+            raise result
+        return result
+
+    def call(self, name: str, *args, **kwargs):
+        """
+        Call driver method in worker and wait its result
+        """
+        return self.result(self.submit(name, *args, **kwargs))
+
+    def __getattr__(self, name: str):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if callable(getattr(DL57D, name, None)):
+            method = lambda *args, **kwargs: self.call(name, *args, **kwargs)
+            method.__name__ = name
+            return method
+        return self.call(GETATTR, name)
+
+    def close(self) -> None:
+        """
+        Stop driver (stop_driver), worker process and free shared memory
+        """
+        if self.process.is_alive():
+            self.call(CLOSE)
+        self.process.join(timeout=5)
+        self.requests.close()
+        self.replies.close()
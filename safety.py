@@ -0,0 +1,230 @@
+"""
+Safety monitor of DL57D driver: ALM, PEND and limit / home inputs stop PUL from their edge callbacks
+Stop is wave_tx_stop + PUL LOW (write switches PWM of PUL off too), sent by pigpio callback thread
+(transmission of other driver sharing pooled connection is not stopped)
+one notification latency after the edge, bit-bang loops end on next impulse
+Position is counted from PUL rising edges signed by DIR lvl, so pulses sent until stop are exact
+for every source (moves, motion queue, trajectory replay, jog)
+    safety = SafetyMonitor(driver)  # ALM stops, PEND is recorded
+    safety.add_input('HOME', gpio=5, edge=pigpio.FALLING_EDGE, pud=pigpio.PUD_UP)
+    safety.home('HOME', speed=-60, slow_speed=-6)  # Latched switch position becomes 0
+    ...
+    if safety.tripped is not None:  # Moves raise RuntimeError until reset
+        safety.reset()  # driver.position is pulses sent until stop
+"""
+import logging
+import threading
+from collections import deque
+from typing import NamedTuple
+
+from DL57D import DL57D
+from pi_backend import pigpio
+
+logger: logging.Logger = logging.getLogger('dl57d.safety')
+
+
+class SafetyInput(NamedTuple):
+    """
+    Monitored input
+    """
+    name: str
+    gpio: int
+    edge: int  # Active edge (pigpio.RISING_EDGE / FALLING_EDGE / EITHER_EDGE)
+    stop: bool  # Stop PUL on active edge (False -> only recorded)
+
+
+class SafetyMonitor:
+    """
+    Edge triggered stop of PUL with exact pulse count
+    """
+    GLITCH_MICROS: int = 100  # Steady time of glitch filter (edge is reported with its first tick)
+    NOTIFY_LATENCY: float = 0.01  # pigpiod reports edges to callbacks with delay
+    HISTORY: int = 64  # Last input events kept
+
+    def __init__(self, driver: DL57D, alm_edge: int = pigpio.RISING_EDGE, pend_edge: int = pigpio.RISING_EDGE,
+                 glitch: int = GLITCH_MICROS):
+        """
+        Driver must be idle (position of driver is start of pulse counting)
+        :param driver: DL57D driver
+        :param alm_edge: alarm edge of ALM input (active lvl depends on wiring of optocoupler output)
+        :param pend_edge: in position edge of PEND input
+        :param glitch: glitch filter micro s of ALM / PEND
+        """
+        self.driver: DL57D = driver
+        self.pi: pigpio.pi = driver.pi
+        self.inputs: dict[str, SafetyInput] = {}
+        self.callbacks: list = []
+        self.events: deque[dict] = deque(maxlen=self.HISTORY)
+        self.tripped: dict | None = None  # Event of stop until reset
+        self.stopped: threading.Event = threading.Event()
+        self.dir_level: int = pigpio.HIGH if driver.dir_gpio is None else self.pi.read(driver.dir_gpio)
+        self.steps: int = 0  # Signed PUL rising edges since creation
+        self.origin: int = driver.position  # Position of driver at steps 0
+        self.callbacks.append(self.pi.callback(driver.pul_gpio, pigpio.RISING_EDGE, self.pul_edge))
+        if driver.dir_gpio is not None:
+            self.callbacks.append(self.pi.callback(driver.dir_gpio, pigpio.EITHER_EDGE, self.dir_edge))
+        if driver.alm_gpio is not None:
+            self.add_input('ALM', gpio=driver.alm_gpio, edge=alm_edge, glitch=glitch)
+        if driver.pend_gpio is not None:
+            self.add_input('PEND', gpio=driver.pend_gpio, edge=pend_edge, glitch=glitch, stop=False)
+        driver.safety = self
+
+    @property
+    def position(self) -> int:
+        """
+        :return: microsteps since zero counted from sent PUL impulses
+        """
+        return self.origin + self.steps
+
+    def add_input(self, name: str, gpio: int, edge: int = pigpio.RISING_EDGE, glitch: int = GLITCH_MICROS,
+                  pud: int = pigpio.PUD_OFF, stop: bool = True) -> None:
+        """
+        Monitor input (limit switch, home switch, external trigger)
+        :param name: input name in events
+        :param gpio: raspberry pi GPIO num
+        :param edge: active edge
+        :param glitch: glitch filter micro s (0 -> off, mechanical switches need ms)
+        :param pud: pull up / down resistor (pigpio.PUD_OFF / PUD_UP / PUD_DOWN)
+        :param stop: stop PUL on active edge (False -> only recorded)
+        :return: None
+        """
+        self.pi.set_mode(gpio, pigpio.INPUT)
+        if pud != pigpio.PUD_OFF:
+            self.pi.set_pull_up_down(gpio, pud)
+        if glitch:
+            self.pi.set_glitch_filter(gpio, glitch)
+        trigger: SafetyInput = SafetyInput(name=name, gpio=gpio, edge=edge, stop=stop)
+        self.inputs[name] = trigger
+        self.callbacks.append(self.pi.callback(gpio, edge, lambda _gpio, level, tick: self.trip(trigger, level, tick)))
+        logger.debug('%s input monitored on gpio %s', name, gpio)
+
+    def pul_edge(self, gpio: int, level: int, tick: int) -> None:
+        """
+        pigpio thread callback of PUL rising edge
+        """
+        self.steps += 1 if self.dir_level else -1
+
+    def dir_edge(self, gpio: int, level: int, tick: int) -> None:
+        """
+        pigpio thread callback of DIR edge
+        """
+        self.dir_level = level
+
+    def trip(self, trigger: SafetyInput, level: int, tick: int) -> None:
+        """
+        pigpio thread callback of monitored input: stop PUL (stop inputs) and record event
+        Edges are notified in tick order, so pulses counted here are sent before input edge
+        """
+        event: dict = {'name': trigger.name, 'gpio': trigger.gpio, 'level': level, 'tick': tick,
+                       'trigger_position': self.position}
+        if trigger.stop and self.tripped is None:
+            engine = self.driver.pulse_engine
+            if engine is not None:
+                engine.halted = True
+                engine.stop()  # wave_tx_stop + PUL LOW
+            else:
+                self.pi.write(self.driver.pul_gpio, pigpio.LOW)
+            stop_tick: int = self.pi.get_current_tick()
+            event.update(stop_tick=stop_tick, latency_us=pigpio.tickDiff(tick, stop_tick))
+            self.driver.pin_state['PULL'] = pigpio.LOW
+            self.driver.pin_state['DIR'] = None  # Setup wave could be stopped before DIR
+            self.tripped = event
+            if self.driver.jog is not None:
+                self.driver.jog.trip()  # Ramp thread does not restart PWM
+            self.stopped.set()
+        self.events.append(event)
+
+    def check(self) -> None:
+        """
+        Driver hook of move start
+        :raise RuntimeError: when stopped by input until reset
+        """
+        if self.tripped is not None:
+            raise RuntimeError(f'Stopped by {self.tripped["name"]} input, reset() before next move')
+
+    def wait(self, timeout: float | None = None) -> dict | None:
+        """
+        Block until stop input trips (pigpio callback thread)
+        :param timeout: seconds (None -> forever)
+        :return: stop event or None on timeout
+        """
+        return self.tripped if self.stopped.wait(timeout) else None
+
+    def reset(self) -> dict | None:
+        """
+        Resync driver position with pulses sent until stop and allow moves again
+        Jog was stopped by trip without adding its tally, so pulses of jog are counted once (here)
+        :return: stop event with position of stop (None when not tripped)
+        """
+        event: dict | None = self.tripped
+        if event is not None:
+            self.driver.sleep(self.NOTIFY_LATENCY)  # Edges of last pulses before stop
+            event['position'] = self.position
+            self.driver.position = self.position
+            logger.info('%s stop after %s micro s at %s microsteps', event['name'], event['latency_us'], event['position'])
+        if self.driver.pulse_engine is not None:
+            self.driver.pulse_engine.halted = False
+            self.driver.pulse_engine.transmitted = None  # Stopped chain is resynced here, not by abort()
+        self.driver.pending = []
+        self.tripped = None
+        self.stopped.clear()
+        return event
+
+    def seek(self, steps: int, speed: float) -> dict | None:
+        """
+        Move until end of steps or stop input
+        :param steps: microsteps ( - sign mean DIR change)
+        :param speed: r/min
+        :return: stop event (None when move ended without stop)
+        """
+        if self.driver.pulse_engine is None:
+            self.driver.rotate_steps(steps=steps, speed=speed)  # Bit-bang loop ends on stop
+        else:
+            self.driver.queue_steps(steps=steps, speed=speed)
+            self.driver.pulse_engine.wait()  # Polls without expected duration, stop ends it at once
+        return self.reset()
+
+    def home(self, name: str = 'HOME', speed: float = 60, slow_speed: float = 6, backoff: float = 10,
+             max_sectors: float = 360) -> int | None:
+        """
+        Seek home input at speed, back off and re-approach slowly, latched edge position becomes 0
+        (encoder is not zeroed)
+        :param name: stop input of home switch
+        :param speed: r/min of seek ( - sign mean CCW)
+        :param slow_speed: r/min of latch approach (sign ignored)
+        :param backoff: sectors moved back from switch before slow approach
+        :param max_sectors: seek distance limit in sectors
+        :return: microsteps from start to home edge, None when input was not reached
+        """
+        if name not in self.inputs:
+            logger.warning('No %s input', name)
+            return
+        sign: int = 1 if speed > 0 else -1
+        start: int = self.driver.position
+        backoff_steps: int = int(backoff * self.driver.sector_steps)
+        event: dict | None = self.seek(steps=sign * int(max_sectors * self.driver.sector_steps), speed=abs(speed))
+        if event is not None and event['name'] == name:
+            self.seek(steps=-sign * backoff_steps, speed=abs(slow_speed))
+            event = self.seek(steps=sign * 2 * backoff_steps, speed=abs(slow_speed))  # Latch approach
+        if event is None or event['name'] != name:
+            if event is None:
+                logger.warning('%s input was not reached', name)
+            else:
+                logger.warning('Homing stopped by %s', event['name'])
+            return
+        latch: int = event['trigger_position']
+        self.origin -= latch
+        self.driver.position -= latch
+        logger.info('Home %s latched at %s microsteps from start', name, latch - start)
+        return latch - start
+
+    def cancel(self) -> None:
+        """
+        Cancel callbacks and driver hooks
+        """
+        for callback in self.callbacks:
+            callback.cancel()
+        self.callbacks.clear()
+        if self.driver.pulse_engine is not None:
+            self.driver.pulse_engine.halted = False
+        self.driver.safety = None
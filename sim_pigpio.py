@@ -0,0 +1,535 @@
+"""
+Pure python simulator of pigpio daemon connection (same API as pigpio module)
+Used as backend on plain Linux (no pigpio / pigpiod) for profiling and regression tests
+Every command costs one socket round-trip of virtual clock and is recorded with its tick
+Waves, chains, PWM and injected input edges are played on virtual clock,
+wave memory is allocated as by pigpiod: ids in order, deleted wave is reclaimed only with all higher ids
+or reused by new wave of exactly same size,
+edges seen by callbacks are quantised by daemon sample rate (micro s)
+    pi = SimulatedPi(sample_rate=5)
+    driver = DL57D(pi=pi)
+    driver.rotate_sectors(10)
+    pi.edges  # [(tick, gpio, lvl), ...]
+Commands are serialised by lock (as requests on pigpiod socket), so threads (jog ramp, servers) share one pi
+"""
+import heapq
+import threading
+import time
+from collections import namedtuple
+from functools import wraps
+from itertools import count
+from typing import Callable, Iterator
+
+OUTPUT: int = 1
+INPUT: int = 0
+HIGH: int = 1
+LOW: int = 0
+RISING_EDGE: int = 0
+FALLING_EDGE: int = 1
+EITHER_EDGE: int = 2
+PUD_OFF: int = 0
+PUD_DOWN: int = 1
+PUD_UP: int = 2
+WAVE_MODE_ONE_SHOT: int = 0
+WAVE_MODE_REPEAT: int = 1
+WAVE_MODE_ONE_SHOT_SYNC: int = 2
+WAVE_MODE_REPEAT_SYNC: int = 3
+NO_TX_WAVE: int = 9999  # wave_tx_at when nothing transmitting
+TICK_MASK: int = 0xFFFFFFFF  # Ticks are 32 bit micro s counter
+
+pulse = namedtuple('pulse', ['gpio_on', 'gpio_off', 'delay'])
+
+
+class error(Exception):
+    """
+    pigpio.error of simulator
+    """
+
+
+def tickDiff(t1: int, t2: int) -> int:
+    """
+    :return: micro s from t1 to t2 (32 bit wrap)
+    """
+    return (t2 - t1) & TICK_MASK
+
+
+class _callback:
+    """
+    Edge callback of simulator (pigpio._callback API)
+    """
+
+    def __init__(self, pi: 'SimulatedPi', gpio: int, edge: int, func: Callable | None):
+        self.pi: SimulatedPi = pi
+        self.gpio: int = gpio
+        self.edge: int = edge
+        self.func: Callable | None = func
+        self.count: int = 0
+
+    def fire(self, level: int, tick: int) -> None:
+        if self.edge == EITHER_EDGE or (self.edge == RISING_EDGE) == (level == HIGH):
+            self.count += 1
+            if self.func is not None:
+                self.func(self.gpio, level, tick & TICK_MASK)
+
+    def cancel(self) -> None:
+        with self.pi.lock:
+            if self in self.pi.callbacks:
+                self.pi.callbacks.remove(self)
+
+    def tally(self) -> int:
+        return self.count
+
+    def reset_tally(self) -> None:
+        self.count = 0
+
+
+class SimulatedPi:
+    """
+    Virtual pigpio.pi connection
+    """
+    ROUND_TRIP_MICROS: int = 60  # Socket command round-trip to pigpiod on Raspberry Pi
+    MAX_PULSES: int = 12000  # wave_get_max_pulses of pigpiod (OOL memory of all waves)
+    MAX_CBS: int = 25016  # wave_get_max_cbs of pigpiod
+    MAX_WAVES: int = 250  # Wave ids of pigpiod
+    CBS_PER_PULSE: int = 2  # DMA control blocks model (gpio write + delay per gpioPulse)
+
+    def __init__(self, sample_rate: int = 5, round_trip: int = ROUND_TRIP_MICROS, realtime: bool = False,
+                 record_edges: bool = True):
+        """
+        :param sample_rate: pigpiod sample rate (micro s), one of PWM_FREQ_DICT keys
+        :param round_trip: virtual micro s of every command
+        :param realtime: virtual clock never behind wall clock (for asyncio / threads polling)
+        :param record_edges: keep every output edge in edges
+        """
+        from DL57D import DL57D  # Frequencies table of daemon sample rates
+        if sample_rate not in DL57D.PWM_FREQ_DICT:
+            raise error(f'Not available sample rate {sample_rate}')
+        self.pwm_freqs: tuple = DL57D.PWM_FREQ_DICT[sample_rate]
+        self.sample_rate: int = sample_rate
+        self.round_trip: int = round_trip
+        self.realtime: bool = realtime
+        self.record_edges: bool = record_edges
+        self.started: float = time.perf_counter()
+        self.lock: threading.RLock = threading.RLock()  # One command at a time
+        self.connected: bool = True
+        self.tick: int = 0  # Virtual micro s
+        self.levels: dict[int, int] = {}
+        self.modes: dict[int, int] = {}
+        self.commands: list[tuple[int, str, tuple]] = []  # (tick, command, args)
+        self.edges: list[tuple[int, int, int]] = []  # (quantised tick, gpio, lvl)
+        self.callbacks: list[_callback] = []
+        self.waves: dict[int, list] = {}  # Not deleted waves
+        self.wave_sizes: list[int] = []  # Pulses of allocated wave ids (deleted ones until reclaimed)
+        self.new_wave: list = []  # Pulses added, not created
+        self.events: list = []  # Heap of (tick, order, on mask, off mask, source, iterator)
+        self.order: Iterator[int] = count()
+        self.sources: set[str] = set()  # Active event sources ('wave <n>', 'pwm <n>', 'input <n>')
+        self.schedule: list[tuple[int, float, int]] = []  # Transmitting waves (start, end, wave id)
+        self.pwm: dict[int, tuple[float, float]] = {}  # gpio -> (freq, duty 0..1)
+        self.pwm_sources: dict[int, str] = {}  # gpio -> source of PWM edges
+
+    # Virtual clock
+
+    def command(self, name: str, *args) -> None:
+        """
+        Record command at current tick and spend round-trip
+        """
+        began: float = time.perf_counter()
+        if self.realtime:
+            self.advance(round((began - self.started) * 1e6))
+        self.commands.append((self.tick, name, args))
+        self.advance(self.tick + self.round_trip)
+        if self.realtime:  # Host time of simulator is not daemon time (else next command sees daemon late)
+            self.started += time.perf_counter() - began
+
+    def catch_up(self) -> None:
+        """
+        Realtime: play events up to wall clock, host time of playing them is not daemon time
+        """
+        began: float = time.perf_counter()
+        self.advance(round((began - self.started) * 1e6))
+        self.started += time.perf_counter() - began
+
+    def sleep(self, seconds: float) -> None:
+        """
+        Host side sleep (virtual clock)
+        """
+        if self.realtime:
+            time.sleep(seconds)  # Other threads command meanwhile
+            with self.lock:
+                self.catch_up()
+        else:
+            with self.lock:
+                self.advance(self.tick + round(seconds * 1e6))
+
+    def advance(self, tick: int) -> None:
+        """
+        Play all events up to tick
+        """
+        while self.events and self.events[0][0] <= tick:
+            event_tick, _, on, off, source, events = heapq.heappop(self.events)
+            if source not in self.sources:
+                continue
+            self.tick = max(self.tick, event_tick)
+            self.apply(on=on, off=off, tick=event_tick)
+            self.push(source=source, events=events)
+        self.tick = max(self.tick, tick)
+
+    def push(self, source: str, events: Iterator[tuple[int, int, int]]) -> None:
+        """
+        Queue next event of source
+        """
+        for event_tick, on, off in events:
+            heapq.heappush(self.events, (event_tick, next(self.order), on, off, source, events))
+            return
+        self.sources.discard(source)
+
+    def apply(self, on: int, off: int, tick: int) -> None:
+        """
+        Set gpios of on mask HIGH and off mask LOW, record edges and fire callbacks
+        """
+        for mask, level in ((off, LOW), (on, HIGH)):
+            gpio: int = 0
+            while mask:
+                if mask & 1 and self.levels.get(gpio, LOW) != level:
+                    self.levels[gpio] = level
+                    sample: int = tick - tick % self.sample_rate  # Seen by daemon sampling
+                    if self.record_edges:
+                        self.edges.append((sample, gpio, level))
+                    for callback in list(self.callbacks):
+                        if callback.gpio == gpio:
+                            callback.fire(level=level, tick=sample)
+                mask >>= 1
+                gpio += 1
+
+    def set_level(self, gpio: int, level: int) -> None:
+        mask: int = 1 << gpio
+        self.apply(on=mask if level else 0, off=0 if level else mask, tick=self.tick)
+
+    def start_source(self, source: str, events: Iterator[tuple[int, int, int]]) -> None:
+        self.sources.add(source)
+        self.push(source=source, events=events)
+
+    def inject(self, gpio: int, level: int, at: int | None = None) -> None:
+        """
+        Simulate external lvl change of input gpio (PEND, ALM, encoder, limit switch)
+        :param gpio: gpio num
+        :param level: lvl
+        :param at: virtual tick (None -> now)
+        """
+        at = self.tick if at is None else at
+        mask: int = 1 << gpio
+        self.start_source(f'input {next(self.order)}', iter([(at, mask if level else 0, 0 if level else mask)]))
+        self.advance(self.tick)
+
+    # GPIO
+
+    def set_mode(self, gpio: int, mode: int) -> int:
+        self.command('set_mode', gpio, mode)
+        self.modes[gpio] = mode
+        return 0
+
+    def get_mode(self, gpio: int) -> int:
+        self.command('get_mode', gpio)
+        return self.modes.get(gpio, INPUT)
+
+    def set_pull_up_down(self, gpio: int, pud: int) -> int:
+        self.command('set_pull_up_down', gpio, pud)
+        return 0
+
+    def read(self, gpio: int) -> int:
+        self.command('read', gpio)
+        return self.levels.get(gpio, LOW)
+
+    def write(self, gpio: int, level: int) -> int:
+        self.command('write', gpio, level)
+        if gpio in self.pwm_sources:  # pigpiod switches PWM of gpio off on write
+            self.sources.discard(self.pwm_sources.pop(gpio))
+            self.pwm.pop(gpio, None)
+        self.set_level(gpio=gpio, level=level)
+        return 0
+
+    def read_bank_1(self) -> int:
+        self.command('read_bank_1')
+        return sum(1 << gpio for gpio, level in self.levels.items() if level and gpio < 32)
+
+    def set_bank_1(self, bits: int) -> int:
+        self.command('set_bank_1', bits)
+        self.apply(on=bits, off=0, tick=self.tick)
+        return 0
+
+    def clear_bank_1(self, bits: int) -> int:
+        self.command('clear_bank_1', bits)
+        self.apply(on=0, off=bits, tick=self.tick)
+        return 0
+
+    def get_current_tick(self) -> int:
+        self.command('get_current_tick')
+        return self.tick & TICK_MASK
+
+    def callback(self, user_gpio: int, edge: int = RISING_EDGE, func: Callable | None = None) -> _callback:
+        self.command('callback', user_gpio, edge)
+        callback: _callback = _callback(pi=self, gpio=user_gpio, edge=edge, func=func)
+        self.callbacks.append(callback)
+        return callback
+
+    def set_glitch_filter(self, user_gpio: int, steady: int) -> int:
+        self.command('set_glitch_filter', user_gpio, steady)
+        return 0
+
+    def stop(self) -> None:
+        self.command('stop')
+        self.connected = False
+
+    # PWM
+
+    def pwm_events(self, gpio: int, freq: float, duty: float) -> Iterator[tuple[int, int, int]]:
+        """
+        Endless PWM edges from current tick
+        """
+        mask: int = 1 << gpio
+        start: int = self.tick
+        period: float = 1e6 / freq
+        for k in count():
+            rise: int = start + round(k * period)
+            yield rise, mask, 0
+            yield rise + max(round(period * duty), 1), 0, mask
+
+    def start_pwm(self, gpio: int, freq: float, duty: float) -> None:
+        self.sources.discard(self.pwm_sources.pop(gpio, ''))  # Old edges of gpio are skipped
+        self.pwm[gpio] = (freq, duty)
+        if freq and 0 < duty < 1:
+            self.pwm_sources[gpio] = f'pwm {next(self.order)}'
+            self.start_source(self.pwm_sources[gpio], self.pwm_events(gpio=gpio, freq=freq, duty=duty))
+        else:
+            self.set_level(gpio=gpio, level=HIGH if duty >= 1 else LOW)
+
+    def hardware_PWM(self, gpio: int, PWMfreq: int, PWMduty: int) -> int:
+        self.command('hardware_PWM', gpio, PWMfreq, PWMduty)
+        self.start_pwm(gpio=gpio, freq=PWMfreq, duty=PWMduty / 1e6)
+        return 0
+
+    def set_PWM_frequency(self, user_gpio: int, frequency: int) -> int:
+        """
+        :return: nearest frequency of sample rate table (as pigpiod)
+        """
+        self.command('set_PWM_frequency', user_gpio, frequency)
+        freq: float = min(self.pwm_freqs, key=lambda available: abs(available - frequency))
+        duty: float = self.pwm.get(user_gpio, (0, 0))[1]
+        self.start_pwm(gpio=user_gpio, freq=freq, duty=duty)
+        return int(freq)
+
+    def get_PWM_frequency(self, user_gpio: int) -> int:
+        self.command('get_PWM_frequency', user_gpio)
+        return int(self.pwm.get(user_gpio, (self.pwm_freqs[10], 0))[0])
+
+    def set_PWM_dutycycle(self, user_gpio: int, dutycycle: int) -> int:
+        self.command('set_PWM_dutycycle', user_gpio, dutycycle)
+        freq: float = self.pwm.get(user_gpio, (self.pwm_freqs[10], 0))[0]
+        self.start_pwm(gpio=user_gpio, freq=freq, duty=dutycycle / 255)
+        return 0
+
+    # Waves
+
+    def wave_clear(self) -> int:
+        self.command('wave_clear')
+        self.waves.clear()
+        self.wave_sizes = []
+        self.new_wave = []
+        return 0
+
+    def wave_add_new(self) -> int:
+        self.command('wave_add_new')
+        self.new_wave = []
+        return 0
+
+    def wave_add_generic(self, pulses: list) -> int:
+        self.command('wave_add_generic', len(pulses))
+        self.new_wave.extend(pulse(p.gpio_on, p.gpio_off, p.delay) for p in pulses)
+        if len(self.new_wave) > self.MAX_PULSES:
+            raise error('too many pulses')
+        return len(self.new_wave)
+
+    def wave_get_pulses(self) -> int:
+        self.command('wave_get_pulses')
+        return len(self.new_wave)
+
+    def wave_get_cbs(self) -> int:
+        self.command('wave_get_cbs')
+        return self.CBS_PER_PULSE * len(self.new_wave)
+
+    def wave_get_max_pulses(self) -> int:
+        self.command('wave_get_max_pulses')
+        return self.MAX_PULSES
+
+    def wave_get_max_cbs(self) -> int:
+        self.command('wave_get_max_cbs')
+        return self.MAX_CBS
+
+    def wave_create(self) -> int:
+        """
+        Deleted wave of exactly same size is reused, else wave is allocated above highest id
+        """
+        self.command('wave_create', len(self.new_wave))
+        size: int = len(self.new_wave)
+        wave_id: int = next((wave_id for wave_id, pulses in enumerate(self.wave_sizes)
+                             if pulses == size and wave_id not in self.waves), -1)
+        if wave_id < 0:
+            if self.CBS_PER_PULSE * (sum(self.wave_sizes) + size) > self.MAX_CBS:
+                raise error('No more CBs for waveform')
+            if sum(self.wave_sizes) + size > self.MAX_PULSES:
+                raise error('No more OOL for waveform')
+            if len(self.wave_sizes) >= self.MAX_WAVES:
+                raise error('No more waveforms')
+            wave_id = len(self.wave_sizes)
+            self.wave_sizes.append(size)
+        self.waves[wave_id] = self.new_wave
+        self.new_wave = []
+        return wave_id
+
+    def wave_delete(self, wave_id: int) -> int:
+        """
+        Wave is flagged deleted, memory is reclaimed when all higher ids are deleted too
+        """
+        self.command('wave_delete', wave_id)
+        if wave_id not in self.waves:
+            raise error('bad wave id')
+        del self.waves[wave_id]
+        while self.wave_sizes and len(self.wave_sizes) - 1 not in self.waves:
+            self.wave_sizes.pop()
+        return 0
+
+    def parse_chain(self, data: list[int]) -> list:
+        """
+        wave_chain data -> tree of ('wave', id) ('delay', micro s) ('loop', items, count | None)
+        """
+        stack: list[list] = [[]]
+        i: int = 0
+        while i < len(data):
+            if data[i] == 255:
+                code: int = data[i + 1]
+                if code == 0:  # Loop start
+                    stack.append([])
+                    i += 2
+                    continue
+                if code == 3:  # Loop forever
+                    items: list = stack.pop()
+                    stack[-1].append(('loop', items, None))
+                    i += 2
+                    continue
+                value: int = data[i + 2] + 256 * data[i + 3]
+                if code == 1:
+                    items = stack.pop()
+                    stack[-1].append(('loop', items, value))
+                elif code == 2:
+                    stack[-1].append(('delay', value))
+                i += 4
+            else:
+                if data[i] not in self.waves:
+                    raise error('bad wave id in chain')
+                stack[-1].append(('wave', data[i]))
+                i += 1
+        return stack[0]
+
+    def chain_duration(self, items: list) -> float:
+        total: float = 0
+        for item in items:
+            if item[0] == 'wave':
+                total += sum(p.delay for p in self.waves[item[1]])
+            elif item[0] == 'delay':
+                total += item[1]
+            else:
+                total += float('inf') if item[2] is None else item[2] * self.chain_duration(item[1])
+        return total
+
+    def chain_events(self, items: list, state: list[int]) -> Iterator[tuple[int, int, int]]:
+        """
+        Events of chain items, state[0] is current tick of chain
+        """
+        for item in items:
+            if item[0] == 'wave':
+                for p in self.waves[item[1]]:
+                    yield state[0], p.gpio_on, p.gpio_off
+                    state[0] += p.delay
+            elif item[0] == 'delay':
+                state[0] += item[1]
+            else:
+                repeats: Iterator = count() if item[2] is None else range(item[2])
+                for _ in repeats:
+                    yield from self.chain_events(item[1], state)
+
+    def transmit(self, items: list, wave_id: int, sync: bool = False) -> None:
+        """
+        Start transmission of chain items (after current one when sync)
+        """
+        end: float = max((end for _, end, _ in self.schedule), default=self.tick)
+        if not sync or end <= self.tick:
+            self.stop_waves()
+            end = self.tick
+        start: int = int(end)
+        self.schedule.append((start, start + self.chain_duration(items), wave_id))
+        self.start_source(f'wave {next(self.order)}', self.chain_events(items, [start]))
+
+    def wave_chain(self, data: list[int]) -> int:
+        self.command('wave_chain', len(data))
+        self.transmit(items=self.parse_chain(list(data)), wave_id=-1)
+        return 0
+
+    def wave_send_once(self, wave_id: int) -> int:
+        self.command('wave_send_once', wave_id)
+        self.transmit(items=[('wave', wave_id)], wave_id=wave_id)
+        return sum(p.delay for p in self.waves[wave_id])
+
+    def wave_send_repeat(self, wave_id: int) -> int:
+        self.command('wave_send_repeat', wave_id)
+        self.transmit(items=[('loop', [('wave', wave_id)], None)], wave_id=wave_id)
+        return 0
+
+    def wave_send_using_mode(self, wave_id: int, mode: int) -> int:
+        self.command('wave_send_using_mode', wave_id, mode)
+        items: list = [('wave', wave_id)]
+        if mode in (WAVE_MODE_REPEAT, WAVE_MODE_REPEAT_SYNC):
+            items = [('loop', items, None)]
+        self.transmit(items=items, wave_id=wave_id, sync=mode in (WAVE_MODE_ONE_SHOT_SYNC, WAVE_MODE_REPEAT_SYNC))
+        return 0
+
+    def wave_tx_busy(self) -> int:
+        self.command('wave_tx_busy')
+        return int(any(end > self.tick for _, end, _ in self.schedule))
+
+    def wave_tx_at(self) -> int:
+        self.command('wave_tx_at')
+        for start, end, wave_id in self.schedule:
+            if start <= self.tick < end:
+                return wave_id
+        return NO_TX_WAVE
+
+    def wave_tx_stop(self) -> int:
+        self.command('wave_tx_stop')
+        self.stop_waves()
+        return 0
+
+    def stop_waves(self) -> None:
+        """
+        Drop not played edges of all transmitting waves
+        """
+        self.sources = {source for source in self.sources if not source.startswith('wave')}
+        self.schedule = []
+
+
+def synchronized(method: Callable) -> Callable:
+    """
+    :return: method run under lock of simulated connection
+    """
+    @wraps(method)
+    def locked(self: SimulatedPi, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return locked
+
+
+for name, method in list(vars(SimulatedPi).items()):  # Commands, virtual clock and injected edges
+    if callable(method) and not name.startswith('_') and name != 'sleep':
+        setattr(SimulatedPi, name, synchronized(method))
+
+pi = SimulatedPi  # pigpio.pi of simulator
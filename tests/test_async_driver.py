@@ -0,0 +1,62 @@
+"""
+Async batch moves on realtime simulated pigpiod
+"""
+import asyncio
+import random
+import time
+
+from async_driver import AsyncDL57D
+from DL57D import DL57D
+from pi_backend import pigpio
+from sim_pigpio import SimulatedPi
+
+RANDOM: random.Random = random.Random(3)
+TARGETS: list[float] = [round(RANDOM.uniform(-50, 50), 2) for _ in range(300)]  # Not periodic batch
+
+
+def batch(cancel_after: float | None = None) -> tuple[DL57D, SimulatedPi, float]:
+    async def main():
+        pi: SimulatedPi = SimulatedPi(realtime=True)
+        driver: DL57D = DL57D(pi=pi, sectors=400)
+        mover: AsyncDL57D = AsyncDL57D(driver)
+        start: float = time.perf_counter()
+        move: asyncio.Task = await mover.move_many(TARGETS, speed=600)
+        queued: float = time.perf_counter() - start
+        if cancel_after is not None:
+            await asyncio.sleep(cancel_after)
+            move.cancel()
+        try:
+            await move
+        except asyncio.CancelledError:
+            pass
+        return driver, pi, queued
+    return asyncio.run(main())
+
+
+def test_move_many_several_transmissions():
+    driver, pi, queued = batch()
+    chains, pinned = driver.compile_many(TARGETS, speed=600)  # Same batch again from its end position
+    driver.pulse_engine.cache.unpin(pinned)
+    assert len(chains) > 1
+    assert queued < 0.1  # Later transmissions are sent by move task
+    ends: list[int] = [round(driver.sector_microsteps(target)) for target in TARGETS]
+    assert sum(1 for _, gpio, lvl in pi.edges if gpio == driver.pul_gpio and lvl) == sum(
+        abs(end - start) for start, end in zip([0, *ends], ends))
+    assert not driver.pulse_engine.cache.pins.keys() - set(driver.setup_waves.values())
+
+
+def test_move_many_cancel_aborts_rest():
+    driver, pi, _ = batch(cancel_after=0.3)
+    edges: int = len(pi.edges)
+    pi.sleep(0.2)
+    assert not driver.pulse_engine.busy()
+    assert len(pi.edges) == edges
+    dir_level: int = pigpio.LOW
+    steps: int = 0
+    for _, gpio, level in pi.edges:
+        if gpio == driver.dir_gpio:
+            dir_level = level
+        elif gpio == driver.pul_gpio and level:
+            steps += 1 if dir_level else -1
+    assert abs(driver.position - steps) <= 1  # Stop and its tick read are two commands of realtime clock
+    assert not driver.pulse_engine.cache.pins.keys() - set(driver.setup_waves.values())
@@ -0,0 +1,128 @@
+"""
+CommandClient against CommandServer of driver on realtime simulated pigpiod
+"""
+import asyncio
+import time
+
+import pytest
+
+from command_server import BAD_REQUEST, FAILED, HEADER, CommandClient, CommandError, CommandServer, frame
+from DL57D import DL57D
+from sim_pigpio import SimulatedPi
+
+PUL: int = 18
+
+
+def rising_edges(pi: SimulatedPi, gpio: int = PUL) -> int:
+    return sum(1 for _, edge_gpio, lvl in pi.edges if edge_gpio == gpio and lvl)
+
+
+def serve(tmp_path, scenario, **options):
+    """
+    Run scenario(client, driver, pi) with client connected to server of simulated driver
+    """
+    async def main():
+        pi: SimulatedPi = SimulatedPi(realtime=True)
+        driver: DL57D = DL57D(pi=pi, pul_gpio=PUL, sectors=360, **options)
+        server: CommandServer = CommandServer(driver=driver)
+        path: str = str(tmp_path / 'dl57d.sock')
+        await server.start_unix(path=path)
+        client: CommandClient = await CommandClient.connect(path=path)
+        try:
+            return await scenario(client, driver, pi)
+        finally:
+            await client.close()
+            await server.close()
+    return asyncio.run(main())
+
+
+def test_move_sectors(tmp_path):
+    async def scenario(client, driver, pi):
+        move_time: float = await client.move_sectors(90, speed=60)
+        assert move_time == pytest.approx(0.25, rel=0.05)
+        await client.wait()
+        bank, position, transmitting = await client.state()
+        assert (position, transmitting) == (500, 0)
+        assert rising_edges(pi) == 500
+        assert not bank & 1 << PUL
+
+    serve(tmp_path, scenario)
+
+
+def test_jog_stop_latency(tmp_path):
+    async def scenario(client, driver, pi):
+        await client.jog(200)  # Reply at once, 2 s ramp runs on
+        await asyncio.sleep(0.3)
+        start: float = time.perf_counter()
+        await client.stop()
+        assert time.perf_counter() - start < 0.2
+        bank, position, transmitting = await client.state()
+        assert position == driver.position == rising_edges(pi) > 0
+        assert not bank & 1 << PUL
+
+    serve(tmp_path, scenario, accel=100)
+
+
+def test_stop_interrupts_bit_bang_move(tmp_path):
+    async def scenario(client, driver, pi):
+        move: asyncio.Task = asyncio.create_task(client.move_sectors(3600, speed=60))
+        await asyncio.sleep(0.2)
+        start: float = time.perf_counter()
+        await client.stop()
+        await asyncio.wait_for(move, timeout=1)
+        assert time.perf_counter() - start < 0.2
+        _, position, _ = await client.state()
+        assert 0 < position == rising_edges(pi) < 20000
+
+    serve(tmp_path, scenario, use_waves=False)
+
+
+def test_move_rejected_while_jogging(tmp_path):
+    async def scenario(client, driver, pi):
+        await client.jog(60)
+        with pytest.raises(CommandError) as error:
+            await client.move_sectors(10)
+        assert error.value.status == FAILED
+        await client.jog(0)  # Next move waits ramp down
+        await client.move_sectors(10, speed=60)
+        await client.wait()
+        _, position, _ = await client.state()
+        assert position == driver.position == rising_edges(pi)
+
+    serve(tmp_path, scenario, accel=1000)
+
+
+def test_telemetry(tmp_path):
+    async def scenario(client, driver, pi):
+        subscription: int = await client.subscribe(0.01)
+        await client.move_sectors(36, speed=60)
+        states: list = [await asyncio.wait_for(client.telemetry.get(), timeout=1) for _ in range(3)]
+        assert all(len(state) == 3 for state in states)
+        await client.unsubscribe(subscription)
+        await client.wait()
+        while not client.telemetry.empty():
+            client.telemetry.get_nowait()
+        await asyncio.sleep(0.05)
+        assert client.telemetry.empty()
+        _, position, transmitting = await client.state()
+        assert (position, transmitting) == (200, 0)
+
+    serve(tmp_path, scenario)
+
+
+def test_error_replies(tmp_path):
+    async def scenario(client, driver, pi):
+        await client.ping()
+        for request in (client.run_speed(speed=1e6, duration=1), client.subscribe(0), client.unsubscribe(12345)):
+            with pytest.raises(CommandError) as error:
+                await request
+            assert error.value.status == FAILED
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        client.pending[777] = future
+        client.writer.write(frame(HEADER.pack(777, 99)))  # Not known opcode
+        with pytest.raises(CommandError) as error:
+            await future
+        assert error.value.status == BAD_REQUEST
+        await client.ping()  # Connection stays usable
+
+    serve(tmp_path, scenario)
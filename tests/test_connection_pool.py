@@ -0,0 +1,98 @@
+"""
+Pooled pigpiod connections and config built drivers on simulated pigpiod
+"""
+import pytest
+
+from DL57D import DL57D, DriverConfigError
+from connection_pool import ConnectionPool, PooledPi
+from driver_factory import build_drivers, driver_options
+from sim_pigpio import SimulatedPi
+
+
+class FlakyPi(SimulatedPi):
+    """
+    Simulated daemon whose socket breaks once on listed commands
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fail: set[str] = set()
+
+    def command(self, name: str, *args) -> None:
+        if name in self.fail:
+            self.fail.discard(name)
+            raise OSError(f'{name}: connection reset')
+        super().command(name, *args)
+
+
+class Daemons:
+    """
+    Pool factory: every (re)connect opens new simulated connection
+    """
+
+    def __init__(self):
+        self.opened: list[FlakyPi] = []
+
+    def __call__(self, host: str, port: int) -> FlakyPi:
+        self.opened.append(FlakyPi())
+        return self.opened[-1]
+
+
+def test_config_errors():
+    for config, message in (({'drivers': {}}, 'no'),
+                            ({'drivers': {'x': {'pul_gpio': 18}}, 'motors': {}}, 'sections'),
+                            ({'drivers': {'x': {'pul_gpio': 18, 'speed': 1}}}, 'Unknown options'),
+                            ({'drivers': {'x': {'pul_gpio': '18'}}}, 'is not'),
+                            ({'drivers': {'x': {'pul_gpio': 60}}}, 'gpio num'),
+                            ({'drivers': {'x': {'pul_gpio': 18}, 'y': {'pul_gpio': 18}}}, 'used by driver x'),
+                            ({'drivers': {'x': {'pul_gpio': 18, 'port': 'x'}}}, 'host:port')):
+        with pytest.raises(DriverConfigError, match=message):
+            driver_options(config)
+    assert driver_options({'drivers': {'x': {'pul_gpio': 18}, 'y': {'pul_gpio': 18, 'port': 8889}}})
+    daemons: Daemons = Daemons()
+    pool: ConnectionPool = ConnectionPool(factory=daemons)
+    with pytest.raises(DriverConfigError, match='Driver y'):  # Rejected by DL57D, x is stopped
+        build_drivers({'drivers': {'x': {'pul_gpio': 18}, 'y': {'pul_gpio': 19, 'dir_gpio': 19}}}, pool=pool)
+    assert pool.connections[('localhost', 8888)].users == 0 and not daemons.opened[0].connected
+
+
+def test_stop_driver_keeps_shared_connection():
+    daemons: Daemons = Daemons()
+    pool: ConnectionPool = ConnectionPool(factory=daemons)
+    drivers: dict[str, DL57D] = build_drivers({'drivers': {'x': {'pul_gpio': 18, 'dir_gpio': 23},
+                                                           'y': {'pul_gpio': 19, 'dir_gpio': 24}}}, pool=pool)
+    assert len(daemons.opened) == 1 and drivers['x'].pi is drivers['y'].pi
+    drivers['x'].stop_driver()
+    assert daemons.opened[0].connected
+    drivers['y'].rotate_steps(100, speed=60)
+    assert drivers['y'].position == 100
+    drivers['y'].stop_driver()
+    assert not daemons.opened[0].connected
+
+
+def test_reconnect_registers_callbacks_and_retries_idempotent():
+    daemons: Daemons = Daemons()
+    pooled: PooledPi = ConnectionPool(factory=daemons).get()
+    edges: list[int] = []
+    pooled.callback(5, func=lambda gpio, level, tick: edges.append(level))
+    daemons.opened[0].fail.add('read')
+    assert pooled.read(5) == 0  # Retried on new connection
+    assert pooled.reconnects == 1 and not daemons.opened[0].connected
+    daemons.opened[1].inject(5, 1)
+    pooled.get_current_tick()
+    assert edges == [1]
+
+
+def test_lost_wave_command_resyncs_cache():
+    daemons: Daemons = Daemons()
+    pool: ConnectionPool = ConnectionPool(factory=daemons)
+    driver: DL57D = build_drivers({'drivers': {'x': {'pul_gpio': 18, 'dir_gpio': 23}}}, pool=pool)['x']
+    driver.rotate_steps(100, speed=60)
+    daemons.opened[0].fail.add('wave_chain')
+    with pytest.raises(ConnectionError, match='not repeated'):
+        driver.rotate_steps(100, speed=60)
+    assert driver.pulse_engine.cache.generation == 1
+    driver.position = 100  # Chain may be sent or not: caller references position again
+    driver.rotate_steps(-100, speed=60)  # Waves created again on new connection
+    assert driver.position == 0
+    assert len([edge for edge in daemons.opened[1].edges if edge[1] == 18 and edge[2] == 1]) == 100
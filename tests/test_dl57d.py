@@ -0,0 +1,53 @@
+"""
+Waveform moves of DL57D driver on simulated pigpiod
+"""
+import random
+
+from DL57D import DL57D
+from pi_backend import pigpio
+from sim_pigpio import SimulatedPi
+
+
+RANDOM: random.Random = random.Random(3)
+TARGETS: list[float] = [round(RANDOM.uniform(-50, 50), 2) for _ in range(60)]  # 3 transmissions
+
+
+def signed_rises(pi: SimulatedPi, driver: DL57D) -> int:
+    steps: int = 0
+    dir_level: int = pigpio.LOW
+    for _, gpio, level in pi.edges:
+        if gpio == driver.dir_gpio:
+            dir_level = level
+        elif gpio == driver.pul_gpio and level:
+            steps += 1 if dir_level else -1
+    return steps
+
+
+def test_abort_without_encoder_keeps_sent_position():
+    pi: SimulatedPi = SimulatedPi()
+    driver: DL57D = DL57D(pi=pi)
+    driver.rotate_steps(123, speed=100)
+    for steps, accel, after in ((5000, None, 0.01), (-20000, 5000, 0.05), (20000, 5000, 0.3), (-3000, 2000, 1)):
+        driver.queue_steps(steps, speed=300, accel=accel)
+        pi.sleep(after)
+        driver.abort()
+        assert driver.position == signed_rises(pi, driver)
+    driver.queue_speed(speed=-300, duration=4)  # Nested loops over 65535 repeats
+    pi.sleep(2.5)
+    driver.abort()
+    assert driver.position == signed_rises(pi, driver)
+    driver.abort()  # Stopped chain is accounted once
+    assert driver.position == signed_rises(pi, driver)
+
+
+def test_abort_of_batch_drops_not_transmitted_chains():
+    pi: SimulatedPi = SimulatedPi()
+    driver: DL57D = DL57D(pi=pi, sectors=400)
+    chains, pinned = driver.compile_many(TARGETS, speed=200)
+    end: int = driver.position
+    driver.pulse_engine.transmit(chain=chains[0][0])
+    driver.pending = [chain for chain, _ in chains[1:]]  # As sent by AsyncDL57D.move_many
+    pi.sleep(chains[0][1] / 2)
+    driver.abort()
+    driver.pulse_engine.cache.unpin(pinned)
+    assert len(chains) > 1 and driver.position == signed_rises(pi, driver) != end
@@ -0,0 +1,54 @@
+"""
+Quadrature decoding and velocity of encoder on simulated pigpiod
+"""
+from encoder import QuadratureEncoder
+from sim_pigpio import SimulatedPi
+
+EA_GPIO: int = 5
+EB_GPIO: int = 6
+FORWARD: tuple[tuple[int, int], ...] = ((EA_GPIO, 1), (EB_GPIO, 1), (EA_GPIO, 0), (EB_GPIO, 0))  # A leads B
+
+
+def turn(pi: SimulatedPi, cycles: int, period: int, backward: bool = False, start: int | None = None) -> int:
+    """
+    Inject edges of cycles (4 counts each) every period micro s
+    :return: tick of last edge
+    """
+    edges: tuple[tuple[int, int], ...] = FORWARD
+    if backward:  # B leads A
+        edges = ((EB_GPIO, 1), (EA_GPIO, 1), (EB_GPIO, 0), (EA_GPIO, 0))
+    tick: int = pi.tick if start is None else start
+    for _ in range(cycles):
+        for gpio, level in edges:
+            tick += period
+            pi.inject(gpio, level, at=tick)
+    return tick
+
+
+def test_decode_counts_every_edge_with_direction():
+    pi: SimulatedPi = SimulatedPi()
+    encoder: QuadratureEncoder = QuadratureEncoder(pi, ea_gpio=EA_GPIO, eb_gpio=EB_GPIO)
+    pi.sleep((turn(pi, cycles=5, period=100) - pi.tick) * 1e-6)
+    assert encoder.position == 20
+    pi.sleep((turn(pi, cycles=2, period=100, backward=True) - pi.tick) * 1e-6)
+    assert encoder.position == 12 and encoder.errors == 0
+    encoder.edge(EA_GPIO, 2, pi.tick)  # Watchdog report (pigpio.TIMEOUT lvl) is not an edge
+    assert encoder.position == 12
+    assert [count for _, count in encoder.history()][-9:] == [20, 19, 18, 17, 16, 15, 14, 13, 12]
+
+
+def test_inverted_encoder_counts_against_dir():
+    pi: SimulatedPi = SimulatedPi()
+    encoder: QuadratureEncoder = QuadratureEncoder(pi, ea_gpio=EA_GPIO, eb_gpio=EB_GPIO, invert=True)
+    pi.sleep((turn(pi, cycles=3, period=50) - pi.tick) * 1e-6)
+    assert encoder.position == -12 and encoder.rotations() == -12 / 4000
+
+
+def test_velocity_of_window():
+    pi: SimulatedPi = SimulatedPi()
+    encoder: QuadratureEncoder = QuadratureEncoder(pi, ea_gpio=EA_GPIO, eb_gpio=EB_GPIO, resolution=1000)
+    turn(pi, cycles=1000, period=25)  # 40000 counts/s of 4000 counts rotation -> 600 r/min for 0.1 s
+    pi.sleep(0.05)
+    assert abs(encoder.velocity(window=0.01) - 600) < 3
+    pi.sleep(0.1)
+    assert encoder.velocity(window=0.01) == 0  # Stopped
@@ -0,0 +1,30 @@
+"""
+Move metrics of dithered cruises on simulated pigpiod
+"""
+import pytest
+
+from DL57D import DL57D
+from instrumentation import Instrumentation
+from sim_pigpio import SimulatedPi
+
+
+@pytest.mark.parametrize('accel, tolerance', [(None, 0.1), (5000, 1)])  # Ramp ends on cruise periods too
+def test_dithered_cruise_freq(accel, tolerance):
+    driver: DL57D = DL57D(pi=SimulatedPi(), accel=accel)
+    instruments: Instrumentation = Instrumentation(driver)
+    assert not driver.planner.achievable(1234)  # Cruise mixes two grid periods
+    driver.rotate_sectors(4000, speed=1234)
+    instruments.flush()
+    metrics: dict = instruments.history[-1]
+    assert metrics['counted'] == metrics['pulses'] == 20000
+    assert abs(metrics['freq_error']) < tolerance
+    assert metrics['peak_freq'] > metrics['achieved_freq']
+
+
+def test_grid_cruise_freq():
+    driver: DL57D = DL57D(pi=SimulatedPi())
+    instruments: Instrumentation = Instrumentation(driver)
+    driver.rotate_sectors(400, speed=1200)
+    instruments.flush()
+    metrics: dict = instruments.history[-1]
+    assert metrics['achieved_freq'] == metrics['peak_freq'] == pytest.approx(40000)
@@ -0,0 +1,52 @@
+"""
+PWM jog on realtime simulated pigpiod
+"""
+from DL57D import DL57D
+from jog import SpeedJog
+from sim_pigpio import SimulatedPi
+
+
+def signed_rises(pi: SimulatedPi, driver: DL57D) -> int:
+    steps: int = 0
+    dir_level: int = 0
+    for _, gpio, level in pi.edges:
+        if gpio == driver.dir_gpio:
+            dir_level = level
+        elif gpio == driver.pul_gpio and level:
+            steps += 1 if dir_level else -1
+    return steps
+
+
+def test_tally_goes_into_position():
+    pi: SimulatedPi = SimulatedPi(realtime=True)
+    driver: DL57D = DL57D(pi=pi)
+    jog: SpeedJog = SpeedJog(driver, accel=None)
+    jog.set_speed(30)
+    pi.sleep(0.05)
+    assert jog.position > 0 and driver.position == 0  # Running tally
+    jog.stop()
+    assert driver.position == jog.position == signed_rises(pi, driver) > 0
+    jog.set_speed(-60)
+    pi.sleep(0.05)
+    jog.abort()
+    assert driver.position == jog.position == signed_rises(pi, driver)
+    jog.close()
+
+
+def test_dir_changes_at_standstill():
+    pi: SimulatedPi = SimulatedPi(realtime=True)
+    driver: DL57D = DL57D(pi=pi)
+    jog: SpeedJog = SpeedJog(driver, accel=20000)
+    jog.set_speed(60)
+    jog.set_speed(-60)  # Ramp down, DIR change, ramp up CCW
+    jog.close()
+    dir_ticks: list[int] = [tick for tick, gpio, _ in pi.edges if gpio == driver.dir_gpio]
+    pul: list[tuple[int, int]] = [(tick, level) for tick, gpio, level in pi.edges if gpio == driver.pul_gpio]
+    assert len(dir_ticks) == 2  # CW, then CCW
+    before: list[tuple[int, int]] = [edge for edge in pul if edge[0] <= dir_ticks[1]]
+    after: list[tuple[int, int]] = [edge for edge in pul if edge[0] > dir_ticks[1]]
+    assert before[-1][1] == 0  # PUL LOW, PWM off
+    assert after[0][0] - dir_ticks[1] >= DL57D.SLEEP_AFTER_DIR * 1e6
+    periods: list[int] = [end[0] - start[0] for start, end in zip(before[-6::2], before[-4::2])]
+    assert periods == sorted(periods)  # Ramped down before DIR change
+    assert driver.position == signed_rises(pi, driver)
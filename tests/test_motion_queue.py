@@ -0,0 +1,41 @@
+"""
+Motion queue programs on simulated pigpiod
+"""
+from fractions import Fraction
+
+from DL57D import DL57D
+from motion_queue import MotionQueue
+from sim_pigpio import SimulatedPi
+
+PUL_GPIO: int = 18
+
+
+def rises(pi: SimulatedPi) -> list[int]:
+    return [tick for tick, gpio, level in pi.edges if gpio == PUL_GPIO and level == 1]
+
+
+def test_fractional_sectors_are_carried():
+    pi: SimulatedPi = SimulatedPi()
+    driver: DL57D = DL57D(pi=pi, pul_gpio=PUL_GPIO, sectors=400)  # 5 microsteps per sector
+    motion: MotionQueue = MotionQueue(driver, accel=5000)
+    for sector in (Fraction(1, 3), Fraction(1, 3), Fraction(1, 3), -200.3):
+        motion.add_sectors(sector, speed=300)
+    motion.add_sectors(10, speed=300, absolute=True)
+    motion.run()
+    assert driver.exact_position == 50
+    assert len(rises(pi)) == 5 + 1001 + 1046
+
+
+def test_cruise_is_looped():
+    pi: SimulatedPi = SimulatedPi()
+    driver: DL57D = DL57D(pi=pi, pul_gpio=PUL_GPIO)
+    motion: MotionQueue = MotionQueue(driver)
+    for sector in (1000, 1000, 333):
+        motion.add_sectors(sector, speed=1000)
+    pi.edges.clear()
+    motion.run()
+    periods: set[int] = {end - start for start, end in zip(rises(pi), rises(pi)[1:])}
+    assert len(rises(pi)) == 2333 * driver.sector_steps
+    assert periods == {30}  # No gap between blended cruises sharing block waves
+    assert len([command for command in pi.commands if command[1] == 'wave_create']) <= 4
+    assert driver.pulse_engine.cache.stats()['pinned'] == 0
@@ -0,0 +1,38 @@
+"""
+Coordinated moves of several axes on simulated pigpiod
+"""
+from fractions import Fraction
+
+from multi_axis import AxisConfig, MultiAxis
+from pi_backend import pigpio
+from sim_pigpio import SimulatedPi
+
+AXES: list[AxisConfig] = [AxisConfig('x', pul_gpio=18, dir_gpio=23, ena_gpio=24, sectors=400),
+                          AxisConfig('y', pul_gpio=19, dir_gpio=25, sectors=400)]
+
+
+def rises(pi: SimulatedPi, gpio: int) -> int:
+    return len([edge for edge in pi.edges if edge[1] == gpio and edge[2] == 1])
+
+
+def test_fractional_sectors_are_carried():
+    pi: SimulatedPi = SimulatedPi()
+    multi: MultiAxis = MultiAxis(AXES, pi=pi)
+    for _ in range(3):
+        multi.move_sectors({'x': Fraction(1, 3), 'y': -0.5}, speed=300)
+    assert rises(pi, 18) == 5 and rises(pi, 19) == 7  # 3 * 5 / 3 and 3 * 2.5 rounded half to even
+    assert multi.positions == {'x': 5, 'y': -7}
+    assert multi.step_remainders == {'x': 0, 'y': Fraction(-1, 2)}
+
+
+def test_full_cache_keeps_setup_wave():
+    pi: SimulatedPi = SimulatedPi()
+    multi: MultiAxis = MultiAxis(AXES, pi=pi)
+    for delay in range(1000, 1300):  # Every wave id used
+        multi.engine.create_wave([pigpio.pulse(0, 0, delay)])
+    multi.stop()
+    pi.edges.clear()
+    multi.move_sectors({'x': 30, 'y': -20}, speed=300)
+    assert rises(pi, 18) == 150 and rises(pi, 19) == 100
+    gpios: list[int] = [edge[1] for edge in pi.edges]
+    assert gpios[:2] == [24, 23]  # Setup wave: ENA ON -> CW DIR of x -> PUL
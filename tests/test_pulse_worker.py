@@ -0,0 +1,61 @@
+"""
+Shared memory rings and worker process of pulse worker (simulated pigpiod in worker)
+"""
+import threading
+
+import pytest
+
+from DL57D import DriverConfigError
+from pulse_worker import FAILED, OK, SharedRing, WorkerDriver
+
+
+def test_ring_round_trip():
+    ring: SharedRing = SharedRing(slots=4, slot_size=32)
+    attached: SharedRing = SharedRing(slots=4, slot_size=32, name=ring.name, semaphores=ring.semaphores)
+    try:
+        assert attached.get() is None
+        assert attached.get(block=True, timeout=0.01) is None
+        assert all(ring.put(seq, OK, bytes([seq]) * seq) for seq in range(1, 5))
+        assert not ring.put(5, OK, b'')  # Full
+        assert [attached.get() for _ in range(4)] == [(seq, OK, bytes([seq]) * seq) for seq in range(1, 5)]
+        assert ring.put(6, FAILED, b'x') and attached.get(block=True) == (6, FAILED, b'x')  # Wraps
+        with pytest.raises(ValueError):
+            ring.put(7, OK, bytes(ring.max_payload + 1))
+    finally:
+        attached.close()
+        ring.close()
+
+
+def test_worker_calls_and_errors():
+    driver: WorkerDriver = WorkerDriver(cpu=None, priority=None, sectors=400)
+    try:
+        driver.rotate_sectors(10, speed=60)
+        assert driver.position == 50
+        with pytest.raises(AttributeError):
+            driver.not_an_attribute
+        with pytest.raises(TypeError):  # Exception of driver method is raised in app
+            driver.rotate_steps()
+        threads: list[threading.Thread] = [threading.Thread(target=driver.rotate_steps, args=(5, 60)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert driver.position == 70  # Replies of all app threads
+        assert driver.pend_gpio is None  # Attribute read
+    finally:
+        driver.close()
+    assert not driver.process.is_alive()
+
+
+def test_worker_setup_error():
+    with pytest.raises(DriverConfigError):
+        WorkerDriver(cpu=None, priority=None, pul_gpio=18, dir_gpio=18)
+
+
+def test_worker_exit_is_reported():
+    driver: WorkerDriver = WorkerDriver(cpu=None, priority=None)
+    driver.process.kill()
+    driver.process.join()
+    with pytest.raises(RuntimeError):
+        driver.position
+    driver.close()
@@ -0,0 +1,86 @@
+"""
+Safety stops, homing and jog abort on simulated pigpiod
+"""
+from DL57D import DL57D
+from jog import SpeedJog
+from pi_backend import pigpio
+from safety import SafetyMonitor
+from sim_pigpio import SimulatedPi
+
+PUL_GPIO: int = 18
+LIMIT_GPIO: int = 5
+HOME_GPIO: int = 6
+
+
+def signed_rises(pi: SimulatedPi, dir_gpio: int = 23) -> int:
+    steps: int = 0
+    dir_level: int = pigpio.LOW
+    for _, gpio, level in pi.edges:
+        if gpio == dir_gpio:
+            dir_level = level
+        elif gpio == PUL_GPIO and level:
+            steps += 1 if dir_level else -1
+    return steps
+
+
+def monitored(realtime: bool = False) -> tuple[SimulatedPi, DL57D, SafetyMonitor]:
+    pi: SimulatedPi = SimulatedPi(realtime=realtime)
+    driver: DL57D = DL57D(pi=pi, pul_gpio=PUL_GPIO)
+    safety: SafetyMonitor = SafetyMonitor(driver)
+    safety.add_input('LIMIT', gpio=LIMIT_GPIO, glitch=0)
+    return pi, driver, safety
+
+
+def test_trip_stops_transmission_with_exact_position():
+    pi, driver, safety = monitored()
+    driver.queue_steps(steps=-50000, speed=60)
+    pi.sleep(0.1)
+    pi.inject(LIMIT_GPIO, pigpio.HIGH)
+    stop_tick: int = pi.tick
+    pi.sleep(0.1)
+    assert safety.tripped['latency_us'] < 500  # Stop commands from callback
+    assert all(tick <= stop_tick for tick, gpio, _ in pi.edges if gpio == PUL_GPIO)
+    event: dict = safety.reset()
+    assert event['position'] == driver.position == signed_rises(pi) < -100
+
+
+def test_seek_and_home_latch_switch_position():
+    pi, driver, safety = monitored()
+    switch: int = 2000  # Microsteps of HOME switch from start (seek limit 360 sectors)
+    safety.add_input('HOME', gpio=HOME_GPIO, glitch=0)
+
+    def home_switch(_gpio: int, _level: int, _tick: int) -> None:
+        level: int = pigpio.HIGH if safety.position >= switch else pigpio.LOW
+        if pi.levels.get(HOME_GPIO, pigpio.LOW) != level:
+            pi.inject(HOME_GPIO, level)
+
+    pi.callback(PUL_GPIO, pigpio.RISING_EDGE, home_switch)
+    assert safety.seek(steps=1000, speed=30) is None and driver.position == 1000
+    assert safety.home('HOME', speed=30, slow_speed=3, backoff=2) == switch - 1000  # From start of homing
+    assert driver.position == signed_rises(pi) - switch  # Switch edge is 0
+    assert safety.tripped is None
+
+
+def test_trip_aborts_jog():
+    pi, driver, safety = monitored(realtime=True)
+    jog: SpeedJog = SpeedJog(driver, accel=None)
+    jog.set_speed(30)
+    pi.sleep(0.05)
+    pi.inject(LIMIT_GPIO, pigpio.HIGH)
+    stop_tick: int = pi.tick
+    pi.sleep(0.05)
+    assert (jog.target, jog.freq, jog.sign) == (0, 0, 0)
+    assert all(tick <= stop_tick for tick, gpio, _ in pi.edges if gpio == PUL_GPIO)
+    try:
+        jog.set_speed(30)
+        raise AssertionError('Speed set while tripped')
+    except RuntimeError:
+        pass
+    pi.inject(LIMIT_GPIO, pigpio.LOW)
+    safety.reset()
+    jog.set_speed(-30)
+    pi.sleep(0.05)
+    jog.stop()
+    assert driver.position == jog.position == signed_rises(pi) == safety.position  # Tally counted once
+    jog.close()
+    assert driver.jog is None
@@ -0,0 +1,41 @@
+"""
+Trajectory compile and memory-mapped replay round trip on simulated pigpiod
+"""
+import pytest
+
+from DL57D import DL57D
+from sim_pigpio import SimulatedPi
+
+np = pytest.importorskip('numpy')
+from trajectory import HEADER, TrajectoryCompiler, Waypoint, read_header, replay  # noqa: E402  Needs numpy
+
+WAYPOINTS: list[Waypoint] = [Waypoint(100, speed=300, accel=5000), Waypoint(-50, speed=200), Waypoint(20, speed=100)]
+
+
+def test_compile_and_replay_round_trip(tmp_path):
+    pi: SimulatedPi = SimulatedPi()
+    driver: DL57D = DL57D(pi=pi, sectors=400)
+    path: str = str(tmp_path / 'program.dl57')
+    pulses: int = TrajectoryCompiler(driver).compile(WAYPOINTS, path)
+    assert pulses == 500 + 750 + 350
+    assert read_header(path) == (5, driver.microstep, driver.sector_steps, pulses, 0)
+    deltas = np.fromfile(path, dtype='<i4', offset=HEADER.size)
+    assert int(np.sign(deltas).sum()) == 100
+    pi.edges.clear()
+    assert replay(driver, path) == 0  # No underruns
+    assert driver.position == 100
+    rises: list[int] = [tick for tick, gpio, level in pi.edges if gpio == driver.pul_gpio and level]
+    assert np.diff(rises).tolist() == np.abs(deltas[1:]).tolist()  # Rising edges as compiled
+    turns: list[int] = [tick for tick, gpio, _ in pi.edges if gpio == driver.dir_gpio]
+    assert len(turns) == 2  # CCW after 500 pulses, CW after 750 more
+    for turn, last in zip(turns, (499, 1249)):
+        assert rises[last] < turn <= rises[last + 1] - 100  # DIR 100 us before first rising edge of new DIR
+
+
+def test_replay_checks_start_position(tmp_path):
+    pi: SimulatedPi = SimulatedPi()
+    driver: DL57D = DL57D(pi=pi, sectors=400)
+    path: str = str(tmp_path / 'program.dl57')
+    TrajectoryCompiler(driver).compile(WAYPOINTS, path, start=10)
+    with pytest.raises(ValueError):
+        replay(driver, path)
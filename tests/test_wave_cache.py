@@ -0,0 +1,83 @@
+"""
+Wave cache accounting and eviction on simulated pigpiod
+"""
+from DL57D import DL57D
+from pi_backend import pigpio
+from sim_pigpio import SimulatedPi
+from wave_cache import WaveCache
+
+PUL_GPIO: int = 18
+
+
+def pulses(delay: int, count: int = 1) -> list:
+    return [pigpio.pulse(0, 0, delay)] * count
+
+
+def rises(pi: SimulatedPi) -> int:
+    return len([edge for edge in pi.edges if edge[1] == PUL_GPIO and edge[2] == 1])
+
+
+def test_identical_pulses_are_created_once():
+    pi: SimulatedPi = SimulatedPi()
+    cache: WaveCache = WaveCache(pi)
+    first: int = cache.wave(pulses(10))
+    assert cache.wave(pulses(10)) == first
+    assert cache.wave(pulses(11)) != first
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 2
+    assert len([command for command in pi.commands if command[1] == 'wave_create']) == 2
+
+
+def test_same_size_wave_is_reused_least_recently_used_first():
+    pi: SimulatedPi = SimulatedPi()
+    cache: WaveCache = WaveCache(pi, max_waves=4 + WaveCache.RESERVE_WAVES)
+    waves: list[int] = [cache.wave(pulses(delay)) for delay in range(10, 14)]
+    cache.wave(pulses(10))  # Wave 0 is recently used
+    wave_id: int = cache.wave(pulses(20))
+    assert wave_id == waves[1]  # Memory of least recently used wave of same size
+    assert cache.wave(pulses(10)) == waves[0]
+    assert cache.stats()['evictions'] == 1
+
+
+def test_eviction_reclaims_from_highest_id_and_keeps_pins():
+    pi: SimulatedPi = SimulatedPi()
+    cache: WaveCache = WaveCache(pi, max_waves=4 + WaveCache.RESERVE_WAVES)
+    waves: list[int] = [cache.wave(pulses(delay)) for delay in range(10, 14)]
+    cache.pin([waves[0]])
+    wave_id: int = cache.wave(pulses(20, count=2))  # Other size -> deleted memory is reclaimed from top
+    assert wave_id == waves[3]
+    assert waves[0] in pi.waves and waves[1] in pi.waves and waves[2] in pi.waves
+    cache.unpin([waves[0]])
+    assert cache.stats()['pinned'] == 0
+    assert (cache.pulses, cache.top) == (5, 4) == (sum(pi.wave_sizes), len(pi.wave_sizes))
+
+
+def test_pinned_top_wave_is_not_evicted():
+    pi: SimulatedPi = SimulatedPi()
+    cache: WaveCache = WaveCache(pi, max_waves=3 + WaveCache.RESERVE_WAVES)
+    waves: list[int] = [cache.wave(pulses(delay)) for delay in range(10, 13)]
+    cache.pin([waves[2]])
+    cache.wave(pulses(20, count=2))  # Rest of reserve
+    assert all(wave_id in pi.waves for wave_id in waves)
+
+
+def test_waves_of_compiled_chain_are_not_evicted():
+    pi: SimulatedPi = SimulatedPi()
+    cache: WaveCache = WaveCache(pi, max_waves=2 + WaveCache.RESERVE_WAVES)
+    cache.wave(pulses(10))
+    with cache.compiling():
+        first: int = cache.wave(pulses(11, count=2))
+        second: int = cache.wave(pulses(12, count=3))
+        assert first in pi.waves and second != first
+    assert pi.waves[first] == pulses(11, count=2)
+
+
+def test_full_cache_keeps_position():
+    pi: SimulatedPi = SimulatedPi()
+    driver: DL57D = DL57D(pi=pi, pul_gpio=PUL_GPIO)
+    for delay in range(1000, 1300):  # Every wave id used
+        driver.pulse_engine.create_wave(pulses(delay))
+    for steps, accel in ((1001, None), (-2003, 5000), (1002, None)):
+        pi.edges.clear()
+        driver.rotate_steps(steps, speed=1234, accel=accel)
+        assert rises(pi) == abs(steps)
+    assert driver.position == 0
@@ -0,0 +1,203 @@
+"""
+Offline trajectory compiler of DL57D driver: pulse timing of long programs is computed once into file
+    compiler = TrajectoryCompiler(driver)
+    compiler.compile([Waypoint(90, speed=500, accel=5000), Waypoint(-45, speed=1000)], 'program.dl57')
+    replay(driver, 'program.dl57')  # Memory-mapped, streamed into waves by chunks
+Waypoints are absolute sectors from start, every leg is trapezoidal (or constant speed without accel)
+and stops at its waypoint. Rising edges of PUL are computed by NumPy per block of pulses,
+quantised to pigpiod sample rate and stored as signed int32 deltas (micro s from previous rising edge,
+sign is DIR) after fixed size header. Needs numpy (optional dependency of package)
+"""
+import logging
+import struct
+from typing import Iterator, NamedTuple
+
+from DL57D import DL57D
+from motion_profile import speed_to_freq
+from pi_backend import pigpio
+from pulse_engine import PulseEngine
+
+logger: logging.Logger = logging.getLogger('dl57d.trajectory')
+
+try:
+    import numpy as np
+except ImportError:  # Only trajectory compiler needs numpy
+    np = None
+
+MAGIC: bytes = b'DL57PS\x00\x00'
+VERSION: int = 1
+HEADER: struct.Struct = struct.Struct('<8sHHIIQq4x')
+# magic, version, sample rate, microstep, sector_steps, pulses, start position (microsteps)
+
+
+class Waypoint(NamedTuple):
+    """
+    End of leg
+    """
+    sector: float  # Absolute position in sectors
+    speed: float | None = None  # r/min of cruise (None -> max speed)
+    accel: float | None = None  # r/min per second (None -> constant speed)
+
+
+def require_numpy() -> None:
+    if np is None:
+        raise ImportError('Trajectory compiler needs numpy (pip install numpy)')
+
+
+class TrajectoryCompiler:
+    """
+    Vectorised compiler of waypoints into pulse schedule file
+    """
+    BLOCK_PULSES: int = 1 << 20  # Pulses computed at once (bounded memory for long legs)
+
+    def __init__(self, driver: DL57D):
+        """
+        :param driver: DL57D driver (microstep, sectors, sample rate and speed limits)
+        """
+        require_numpy()
+        self.driver: DL57D = driver
+        self.sample_rate: int = driver.pigpiod_sample_rate
+        lvl: int = -(-max(PulseEngine.MIN_LVL_MICROS, self.sample_rate) // self.sample_rate) * self.sample_rate
+        self.min_delta: int = 2 * lvl  # Shortest period on sample grid
+        self.dir_delta: int = 2 * round(driver.SLEEP_AFTER_DIR * 1e6)  # First period after DIR change
+
+    def leg_times(self, pulses: int, freq: float, accel: float | None, first: int, last: int):
+        """
+        Rising edge times of pulses first..last-1 of leg (pulse k rises when position crosses k + 1)
+        :param pulses: pulses of leg
+        :param freq: cruise pulses per second
+        :param accel: pulses / s^2 (None -> constant speed)
+        :return: float64 array of micro s from leg start
+        """
+        k = np.arange(first + 1, last + 1, dtype=np.float64)
+        if accel is None:
+            return k * (1e6 / freq)
+        ramp: float = min(freq * freq / (2 * accel), pulses / 2)  # Pulses of accel (and decel) ramp
+        peak: float = np.sqrt(2 * accel * ramp)
+        ramp_time: float = peak / accel
+        total: float = 2 * ramp_time + (pulses - 2 * ramp) / peak
+        times = np.where(k <= ramp, np.sqrt(2 * np.minimum(k, ramp) / accel),
+                         ramp_time + (k - ramp) / peak)
+        times = np.where(k > pulses - ramp, total - np.sqrt(2 * np.maximum(pulses - k, 0) / accel), times)
+        return times * 1e6
+
+    def compile(self, waypoints: list[Waypoint], path: str, start: int = 0) -> int:
+        """
+        Write pulse schedule file of waypoints
+        :param waypoints: legs ends
+        :param path: file path
+        :param start: microsteps position at start of program
+        :return: amount of pulses
+        """
+        driver: DL57D = self.driver
+        position: int = start
+        rise: int = 0  # Last rising edge micro s
+        sign: int = 0  # DIR of last pulse
+        total: int = 0
+        with open(path, 'wb') as file:
+            file.write(bytes(HEADER.size))
+            for waypoint in waypoints:
+                steps: int = int(waypoint.sector * driver.sector_steps) - position
+                if not steps:
+                    continue
+                pulses: int = abs(steps)
+                freq: float = 1 / (2 * driver.sector_lvl_duration(speed=waypoint.speed))
+                accel: float | None = None if waypoint.accel is None else speed_to_freq(
+                    speed=waypoint.accel, full_rotate_steps=driver.full_rotate_steps)
+                leg_start: int = rise
+                leg_sign: int = 1 if steps > 0 else -1
+                for first in range(0, pulses, self.BLOCK_PULSES):
+                    last: int = min(first + self.BLOCK_PULSES, pulses)
+                    times = leg_start + self.leg_times(pulses=pulses, freq=freq, accel=accel, first=first, last=last)
+                    ticks = np.rint(times / self.sample_rate).astype(np.int64) * self.sample_rate
+                    if leg_sign != sign:  # DIR needs 100 us before first rising edge
+                        ticks[0] = max(ticks[0], rise + self.dir_delta)
+                        sign = leg_sign
+                    index = np.arange(1, len(ticks) + 1, dtype=np.int64) * self.min_delta
+                    ticks = np.maximum.accumulate(np.maximum(ticks - index, rise)) + index  # Min period
+                    deltas = np.diff(ticks, prepend=rise)
+                    file.write((deltas * leg_sign).astype('<i4').tobytes())
+                    rise = int(ticks[-1])
+                total += pulses
+                position += steps
+            file.seek(0)
+            file.write(HEADER.pack(MAGIC, VERSION, self.sample_rate, driver.microstep, driver.sector_steps,
+                                   total, start))
+        logger.info('Compiled %s pulses, %.3f s into %s', total, rise * 1e-6, path)
+        return total
+
+
+def read_header(path: str) -> tuple[int, int, int, int, int]:
+    """
+    :return: sample rate, microstep, sector_steps, pulses, start position
+    """
+    with open(path, 'rb') as file:
+        magic, version, *header = HEADER.unpack(file.read(HEADER.size))
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f'{path} is not pulse schedule file of version {VERSION}')
+    return tuple(header)
+
+
+def schedule_chunks(driver: DL57D, deltas, chunk_periods: int = 1000) -> Iterator[list]:
+    """
+    gpioPulse chunks of memory-mapped deltas (only one chunk is in memory)
+    HIGH lvl is half of next period on sample grid, DIR is switched 100 us before first rising edge of new DIR
+    :param driver: DL57D driver
+    :param deltas: int32 array of signed deltas
+    :param chunk_periods: PUL periods per chunk
+    :return: iterator of gpioPulse lists
+    """
+    pul: int = 1 << driver.pul_gpio
+    dir_mask: int = 0 if driver.dir_gpio is None else 1 << driver.dir_gpio
+    dir_micros: int = round(driver.SLEEP_AFTER_DIR * 1e6)
+    sample: int = driver.pigpiod_sample_rate
+    min_high: int = -(-max(PulseEngine.MIN_LVL_MICROS, sample) // sample) * sample
+    first = int(deltas[0])
+    lead: list = [pigpio.pulse(dir_mask if first > 0 else 0, 0 if first > 0 else dir_mask, abs(first))]  # DIR
+    for start in range(0, len(deltas), chunk_periods):
+        block = np.asarray(deltas[start:start + chunk_periods + 1], dtype=np.int64)  # One period ahead
+        periods = np.abs(block[1:])
+        if start + chunk_periods >= len(deltas):  # Last rising edge of program
+            periods = np.append(periods, 2 * min_high)
+        highs = np.maximum(periods // 2 // sample * sample, min_high)
+        turns = set((np.flatnonzero(np.sign(block[1:]) != np.sign(block[:-1]))).tolist())
+        chunk: list = [] if start else lead
+        for index, (high, period) in enumerate(zip(highs.tolist(), periods.tolist())):
+            chunk.append(pigpio.pulse(pul, 0, high))  # LVL HIGH (1)
+            if index in turns:  # DIR before next rising edge
+                on: bool = block[index + 1] > 0
+                chunk.append(pigpio.pulse(0, pul, period - high - dir_micros))
+                chunk.append(pigpio.pulse(dir_mask if on else 0, 0 if on else dir_mask, dir_micros))
+            else:
+                chunk.append(pigpio.pulse(0, pul, period - high))  # LVL LOW (0)
+        yield chunk
+
+
+def replay(driver: DL57D, path: str, chunk_periods: int = 1000) -> int:
+    """
+    Stream pulse schedule file by waveform engine of driver (file is memory-mapped)
+    :param driver: DL57D driver with waveform engine, at start position of program
+    :param path: file path
+    :param chunk_periods: PUL periods per chunk wave
+    :return: amount of underruns
+    """
+    require_numpy()
+    sample_rate, microstep, sector_steps, pulses, start = read_header(path)
+    if (sample_rate, microstep, sector_steps) != (driver.pigpiod_sample_rate, driver.microstep, driver.sector_steps):
+        raise ValueError(f'{path} is compiled for sample rate {sample_rate}, microstep {microstep}, '
+                         f'sector steps {sector_steps}')
+    if driver.position != start:
+        raise ValueError(f'Program starts at {start} microsteps, driver is at {driver.position}')
+    if driver.pulse_engine is None:
+        raise ValueError('Replay needs waveform engine (use_waves=True)')
+    if not pulses:
+        return 0
+    deltas = np.memmap(path, dtype='<i4', mode='r', offset=HEADER.size, shape=(pulses,))
+    if driver.ena_gpio is not None and driver.pin_state['ENA'] != pigpio.LOW:
+        driver.write_bank(low=('ENA',))  # Command round-trip is longer than 5 us after ENA
+    underruns: int = driver.pulse_engine.stream(schedule_chunks(driver=driver, deltas=deltas,
+                                                                chunk_periods=chunk_periods))
+    for first in range(0, pulses, TrajectoryCompiler.BLOCK_PULSES):  # Net microsteps
+        driver.position += int(np.sign(deltas[first:first + TrajectoryCompiler.BLOCK_PULSES]).sum())
+    driver.pin_state['DIR'] = pigpio.HIGH if deltas[-1] > 0 else pigpio.LOW
+    return underruns
@@ -0,0 +1,306 @@
+"""
+Wave memory manager between DL57D and pigpiod (wave ids and DMA control blocks are limited)
+Identical pulse trains are created once: waves are keyed by content (on / off masks and delays of gpioPulse)
+Cost of every wave (pulses, CBs) is tracked as pigpiod allocates it: wave ids in order, memory of deleted wave
+is reclaimed only when all higher ids are deleted too (or new wave has exactly its size and reuses it),
+so when cache is full least recently used wave of same size is evicted (its memory is reused at once),
+else waves are evicted from highest id down until reserve is free (only that reclaims memory)
+Reserve keeps room for all waves of next chain: they are never placed at the top of full cache
+Waves of transmitting chain, pinned waves (used by compiled chains kept elsewhere) and waves used
+inside compiling() scope (chain being compiled and sent) are never evicted
+    with cache.compiling():
+        chain = [cache.wave(ramp), cache.wave(cruise)]  # Cruise wave never evicts or reuses id of ramp wave
+        engine.transmit(chain)
+    cache = WaveCache(pi)
+    wave_id = cache.wave(pulses)  # Hit -> no commands
+    cache.stats()  # {'hits': .., 'misses': .., 'evictions': .., 'waves': .., 'cbs': ..}
+"""
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from typing import Iterator
+from weakref import WeakKeyDictionary
+
+from pi_backend import pigpio
+
+
+class WaveCache:
+    """
+    Content deduplicated LRU cache of pigpio waves
+    """
+    MAX_WAVES: int = 250  # Wave ids of pigpiod
+    CBS_PER_PULSE: int = 2  # DMA control blocks of gpioPulse (gpio write + delay)
+    RESERVE_WAVES: int = 32  # Wave ids kept free by eviction (profiled move uses up to about 25)
+    RESERVE_SHARE: int = 4  # 1 / share of pulses and CBs kept free by eviction (explicit ramp waves)
+
+    def __init__(self, pi: pigpio.pi, max_waves: int = MAX_WAVES, max_cbs: int | None = None,
+                 max_pulses: int | None = None):
+        """
+        :param pi: connected backend (pigpio.pi or sim_pigpio.SimulatedPi)
+        :param max_waves: wave ids budget
+        :param max_cbs: DMA control blocks budget (None -> wave_get_max_cbs of daemon)
+        :param max_pulses: pulses of all waves budget (None -> wave_get_max_pulses of daemon)
+        """
+        self.pi: pigpio.pi = pi
+        self.max_waves: int = max_waves
+        self.max_cbs: int = pi.wave_get_max_cbs() if max_cbs is None else max_cbs
+        self.max_pulses: int = pi.wave_get_max_pulses() if max_pulses is None else max_pulses
+        self.cached: OrderedDict[tuple, int] = OrderedDict()  # Content -> wave id (least recently used first)
+        self.keys: dict[int, tuple] = {}  # Cached wave id -> content
+        self.costs: dict[int, tuple[int, int]] = {}  # Every created wave id -> (pulses, CBs)
+        self.deleted: dict[int, tuple[int, int]] = {}  # Deleted wave id -> (pulses, CBs) until reclaimed
+        self.top: int = 0  # Wave ids below are allocated (created or deleted not reclaimed)
+        self.pins: Counter[int] = Counter()  # Wave id -> amount of pins
+        self.transmitting: set[int] = set()  # Waves of last sent chain
+        self.sender = None  # Engine of last sent chain (pigpiod has one transmitter for all its engines)
+        self.scopes: int = 0  # Nested compiling() scopes
+        self.compiled: set[int] = set()  # Waves used inside compiling() scope
+        self.pulses: int = 0  # Pulses of allocated waves
+        self.cbs: int = 0  # CBs of allocated waves
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self.users: int = 0  # Engines sharing cache (release of last one deletes waves)
+        self.generation: int = 0  # Changed by resync(), wave ids kept by owners of older one are stale
+
+    @staticmethod
+    def content(pulses: list) -> tuple:
+        """
+        :param pulses: list of gpioPulse
+        :return: hashable content of pulses (pigpio.pulse is compared by identity)
+        """
+        return tuple((pulse.gpio_on, pulse.gpio_off, pulse.delay) for pulse in pulses)
+
+    @staticmethod
+    def chain_waves(chain: list[int]) -> set[int]:
+        """
+        :param chain: wave_chain data
+        :return: wave ids used by chain
+        """
+        waves: set[int] = set()
+        index: int = 0
+        while index < len(chain):
+            if chain[index] == 255:  # 255 0 / 255 3 loop start / forever, 255 1 x y / 255 2 x y loop end / delay
+                index += 4 if chain[index + 1] in (1, 2) else 2
+            else:
+                waves.add(chain[index])
+                index += 1
+        return waves
+
+    def wave(self, pulses: list) -> int:
+        """
+        Wave of pulses (created on miss)
+        :param pulses: list of gpioPulse
+        :return: wave id
+        """
+        key: tuple = self.content(pulses)
+        wave_id: int | None = self.cached.get(key)
+        if wave_id is not None:
+            self.cached.move_to_end(key)
+            if self.scopes:
+                self.compiled.add(wave_id)
+            self.hits += 1
+            return wave_id
+        self.misses += 1
+        wave_id = self.create(pulses)
+        self.cached[key] = wave_id
+        self.keys[wave_id] = key
+        return wave_id
+
+    def create(self, pulses: list) -> int:
+        """
+        Create not cached wave (stream chunks), deleted by delete()
+        :param pulses: list of gpioPulse
+        :return: wave id
+        """
+        cbs: int = self.CBS_PER_PULSE * len(pulses)
+        self.make_room(pulses=len(pulses), cbs=cbs)
+        self.pi.wave_add_new()  # Clear not created pulses
+        self.pi.wave_add_generic(pulses)
+        wave_id: int = self.pi.wave_create()
+        if self.deleted.pop(wave_id, None) is None:  # Not reused memory of deleted wave
+            self.pulses += len(pulses)
+            self.cbs += cbs
+            self.top = max(self.top, wave_id + 1)
+        self.costs[wave_id] = (len(pulses), cbs)
+        if self.scopes:
+            self.compiled.add(wave_id)
+        return wave_id
+
+    def reusable(self, pulses: int, cbs: int) -> bool:
+        """
+        :return: True when deleted not reclaimed wave has exactly size of new wave (daemon reuses it)
+        """
+        return (pulses, cbs) in self.deleted.values()
+
+    def fits(self, pulses: int, cbs: int, reserve: bool = False) -> bool:
+        """
+        :param reserve: reserve stays free after new wave
+        :return: True when wave of pulses and cbs fits budgets
+        """
+        if self.reusable(pulses=pulses, cbs=cbs):
+            return True
+        waves: int = 1
+        if reserve:
+            waves += self.RESERVE_WAVES
+            pulses += self.max_pulses // self.RESERVE_SHARE
+            cbs += self.max_cbs // self.RESERVE_SHARE
+        return self.top + waves <= self.max_waves and self.cbs + cbs <= self.max_cbs and \
+            self.pulses + pulses <= self.max_pulses
+
+    def evictable(self, wave_id: int) -> bool:
+        """
+        :return: True for cached wave not pinned, not transmitting and not used by chain being compiled
+        """
+        return wave_id in self.keys and wave_id not in self.pins and wave_id not in self.transmitting and \
+            wave_id not in self.compiled
+
+    def make_room(self, pulses: int, cbs: int) -> None:
+        """
+        Evict waves until new wave and reserve fit budgets: least recently used wave of same size
+        (its memory is reused at once), else waves from highest id down (deleted memory is reclaimed from
+        highest id down, so lower least recently used waves would free nothing)
+        Eviction stops at not evictable wave: new wave uses rest of reserve, daemon raises its error
+        when even that is used
+        :param pulses: pulses of new wave
+        :param cbs: CBs of new wave
+        """
+        if self.fits(pulses=pulses, cbs=cbs, reserve=True):
+            return
+        if self.transmitting and not self.pi.wave_tx_busy():  # Chain ended, its waves are free
+            self.transmitting.clear()
+        for wave_id in list(self.cached.values()):
+            if self.costs[wave_id] == (pulses, cbs) and self.evictable(wave_id):
+                self.delete(wave_id)
+                self.evictions += 1
+                return
+        for wave_id in sorted(self.costs, reverse=True):
+            if self.fits(pulses=pulses, cbs=cbs, reserve=True) or not self.evictable(wave_id):
+                return
+            self.delete(wave_id)
+            self.evictions += 1
+
+    def delete(self, wave_id: int) -> None:
+        """
+        Delete wave from daemon and cache (memory is reclaimed when all higher ids are deleted)
+        :param wave_id: wave id
+        """
+        self.pi.wave_delete(wave_id)
+        self.deleted[wave_id] = self.costs.pop(wave_id)
+        while self.top - 1 in self.deleted:
+            wave_pulses, cbs = self.deleted.pop(self.top - 1)
+            self.pulses -= wave_pulses
+            self.cbs -= cbs
+            self.top -= 1
+        key: tuple | None = self.keys.pop(wave_id, None)
+        if key is not None:
+            del self.cached[key]
+        self.pins.pop(wave_id, None)
+        self.transmitting.discard(wave_id)
+
+    def pin(self, waves) -> None:
+        """
+        Protect waves from eviction (chains compiled and kept by caller)
+        :param waves: iterable of wave ids
+        """
+        self.pins.update(waves)
+
+    def unpin(self, waves) -> None:
+        """
+        :param waves: iterable of pinned wave ids
+        """
+        self.pins.subtract(waves)
+        for wave_id in set(waves):
+            if self.pins[wave_id] <= 0:
+                del self.pins[wave_id]
+
+    @contextmanager
+    def compiling(self) -> Iterator[None]:
+        """
+        Scope of compiling and sending chain: waves used inside are not evicted (scopes nest,
+        protection ends with outermost one)
+        """
+        self.scopes += 1
+        try:
+            yield
+        finally:
+            self.scopes -= 1
+            if not self.scopes:
+                self.compiled.clear()
+
+    def transmit(self, chain: list[int], sender=None) -> None:
+        """
+        Mark waves of sent chain as transmitting (previous transmission ended)
+        :param chain: wave_chain data
+        :param sender: engine of chain (None -> stopped transmission)
+        """
+        self.transmitting = self.chain_waves(chain)
+        self.sender = sender
+
+    def clear(self) -> None:
+        """
+        Delete all created waves
+        """
+        for wave_id in sorted(self.costs, reverse=True):
+            self.delete(wave_id)
+        self.pins.clear()
+        self.transmitting.clear()
+        self.sender = None
+
+    def resync(self) -> None:
+        """
+        Wave command failed with lost connection (daemon state unknown: wave created or not, chain sent or not):
+        transmission is stopped, all waves of daemon are cleared and forgotten,
+        owners of wave ids (setup waves, compiled ramps) create them again in next generation
+        """
+        self.pi.wave_tx_stop()
+        self.pi.wave_clear()
+        self.cached.clear()
+        self.keys.clear()
+        self.costs.clear()
+        self.deleted.clear()
+        self.pins.clear()
+        self.transmitting.clear()
+        self.compiled.clear()
+        self.sender = None
+        self.top = self.pulses = self.cbs = 0
+        self.generation += 1
+
+    def release(self) -> None:
+        """
+        Engine does not use cache any more, waves are deleted by last one
+        """
+        self.users -= 1
+        if self.users <= 0:
+            self.clear()
+
+    def stats(self) -> dict[str, int]:
+        """
+        :return: counters and usage for cache sizing
+        """
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'waves': len(self.costs),
+                'deleted': len(self.deleted),
+                'cached': len(self.cached),
+                'pinned': len(self.pins),
+                'pulses': self.pulses,
+                'cbs': self.cbs,
+                'max_waves': self.max_waves,
+                'max_cbs': self.max_cbs}
+
+
+CACHES: WeakKeyDictionary = WeakKeyDictionary()  # Connection -> WaveCache
+
+
+def shared_cache(pi: pigpio.pi) -> WaveCache:
+    """
+    WaveCache of connection: drivers sharing pigpiod connection share its wave ids and CBs budget
+    :param pi: connected backend
+    :return: cache with one more user
+    """
+    cache: WaveCache | None = CACHES.get(pi)
+    if cache is None or cache.users <= 0:
+        cache = CACHES[pi] = WaveCache(pi=pi)
+    cache.users += 1
+    return cache